@@ -1,4 +1,4 @@
 from .clickhouse_client import ClickHouseDB
+from .events_catalog import EventsCatalog
 from .posgres_client import PostgresDB
 from .vectordb_client import VectorDB
-
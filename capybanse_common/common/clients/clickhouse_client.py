@@ -1,96 +1,413 @@
+import asyncio
+import contextlib
+import functools
+import os
+import socket
+import threading
+import time
 import typing as t
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from uuid import UUID
+from uuid import uuid4
 
 import clickhouse_connect
+from clickhouse_connect.driver.exceptions import DatabaseError
 
-from common.clients.prepared_sql import CREATE_GIVEN_RECOMMENDATIONS_TABLE
-from common.clients.prepared_sql import CREATE_USERS_INTERACTION_TABLE
+from common.clients.prepared_sql import CLICKHOUSE_MIGRATIONS
+from common.clients.prepared_sql import CREATE_SCHEMA_MIGRATIONS_LOCK_TABLE
+from common.clients.prepared_sql import CREATE_SCHEMA_MIGRATIONS_TABLE
+from common.clients.prepared_sql import LAST_INTERACTIONS_AMOUNT
+from common.clients.prepared_sql import SELECT_SCHEMA_MIGRATIONS_LOCK_STATE
+from common.models import InteractionKind
+from common.models import RecItem
 from common.models import RecommendationList
+from common.models import SimplifiedRecItem
 from common.models import UserInteraction
 from common.utils import get_logger
 
+DEFAULT_POOL_SIZE = 4
+MIGRATIONS_LOCK_TIMEOUT = 3600  # seconds
+MIGRATIONS_LOCK_RETRY_INTERVAL = 1  # seconds
+MIGRATIONS_LOCK_HEARTBEAT_INTERVAL = 10  # seconds
+MIGRATIONS_LOCK_STALE_AFTER = 60  # seconds without heartbeats, then lock is taken over
+
 logger = get_logger('clickhouse_client')
 
 
+def get_recommended_events(
+        recommendation: RecommendationList | list[SimplifiedRecItem],
+) -> list[tuple[UUID, str, float]]:
+    return [
+        (rec.event.id if isinstance(rec, RecItem) else rec.event_id, rec.subsystem, rec.score)
+        for rec in recommendation
+    ]
+
+
+def get_migrations_lock_state(client: clickhouse_connect.driver.client.Client) -> tuple[str, int] | None:
+    """
+    :return: owner of migrations lock and seconds since its last heartbeat or None if migrations are not locked
+    """
+    try:
+        owner, heartbeat_age = client.query(SELECT_SCHEMA_MIGRATIONS_LOCK_STATE).result_rows[0]
+    except DatabaseError as err:
+        if 'UNKNOWN_TABLE' not in str(err):
+            raise
+        return None
+
+    return owner, heartbeat_age
+
+
+def take_over_migrations_lock(client: clickhouse_connect.driver.client.Client, stale_owner: str):
+    """
+    drop lock of crashed service. Lock is renamed away first, so only one of waiting services takes it over.
+    Lock which was taken over and acquired again by other service in between is renamed back
+    """
+    stale_lock_table = f'schema_migrations_lock_{uuid4().hex}'
+    try:
+        client.command(f'RENAME TABLE schema_migrations_lock TO {stale_lock_table}')
+    except DatabaseError as err:
+        if 'UNKNOWN_TABLE' not in str(err):
+            raise
+        return
+
+    owner = client.query(f'SELECT any(owner) FROM {stale_lock_table}').result_rows[0][0]
+    if owner != stale_owner:
+        client.command(f'RENAME TABLE {stale_lock_table} TO schema_migrations_lock')
+        return
+
+    logger.warning('Clickhouse migrations lock of %s is stale, taken over', stale_owner)
+    client.command(f'DROP TABLE {stale_lock_table}')
+
+
+def run_migrations_lock_heartbeat(
+        client: clickhouse_connect.driver.client.Client,
+        owner: str,
+        released: threading.Event,
+):
+    """
+    insert heartbeat rows of lock owner until lock is released, lock without heartbeats is taken over
+    """
+    while not released.wait(MIGRATIONS_LOCK_HEARTBEAT_INTERVAL):
+        try:
+            client.insert('schema_migrations_lock', [(owner,)], column_names=['owner'])
+        except Exception as err:
+            logger.warning('Heartbeat of clickhouse migrations lock failed: %s', err)
+
+
+@contextlib.contextmanager
+def migrations_lock(
+        client: clickhouse_connect.driver.client.Client,
+        heartbeat_client: clickhouse_connect.driver.client.Client,
+):
+    """
+    services apply migrations on start, lock table is created by one of them at a time.
+    Lock is kept by heartbeats of separate client while migration statements run,
+    lock of crashed service is taken over when its heartbeats stop
+    """
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}'
+    started = time.monotonic()
+    while True:
+        try:
+            client.command(CREATE_SCHEMA_MIGRATIONS_LOCK_TABLE, parameters={'owner': owner})
+            break
+        except DatabaseError as err:
+            if 'TABLE_ALREADY_EXISTS' not in str(err):
+                raise
+
+        lock_state = get_migrations_lock_state(client)
+        if lock_state is not None and lock_state[1] > MIGRATIONS_LOCK_STALE_AFTER:
+            take_over_migrations_lock(client, lock_state[0])
+            continue
+
+        if time.monotonic() - started > MIGRATIONS_LOCK_TIMEOUT:
+            raise TimeoutError(f'Clickhouse migrations are locked by {lock_state and lock_state[0]}')
+
+        logger.info('Waiting for clickhouse migrations lock')
+        time.sleep(MIGRATIONS_LOCK_RETRY_INTERVAL)
+
+    released = threading.Event()
+    heartbeat = threading.Thread(
+        target=run_migrations_lock_heartbeat,
+        args=(heartbeat_client, owner, released),
+        name='clickhouse-migrations-lock',
+        daemon=True,
+    )
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        released.set()
+        heartbeat.join()
+        client.command('DROP TABLE schema_migrations_lock')
+
+
+def apply_migrations(
+        client: clickhouse_connect.driver.client.Client,
+        heartbeat_client: clickhouse_connect.driver.client.Client,
+) -> int:
+    """
+    apply migrations newer than version of schema, each one is recorded after all its statements succeed
+    :param heartbeat_client: client which keeps migrations lock, it is not used by migration statements
+    :return: version of schema
+    """
+    client.command(CREATE_SCHEMA_MIGRATIONS_TABLE)
+
+    with migrations_lock(client, heartbeat_client):
+        version = client.query('SELECT max(version) FROM schema_migrations').result_rows[0][0]
+
+        for migration_version, description, statements in CLICKHOUSE_MIGRATIONS:
+            if migration_version <= version:
+                continue
+
+            logger.info('Applying clickhouse migration %s: %s', migration_version, description)
+            for statement in statements:
+                client.command(statement)
+            client.insert(
+                'schema_migrations',
+                [(migration_version, description, datetime.now())],
+                column_names=['version', 'description', 'applied_dt'],
+            )
+            version = migration_version
+
+    return version
+
+
 class ClickHouseDB:
-    _clickhouse_client: clickhouse_connect.driver.client.Client | None = None
+    """
+    Synchronous clickhouse clients are run on thread pool, so queries do not block event loop.
+    Each query takes a client from pool, amount of clients bounds amount of concurrent queries
+    """
+    _clients_pool: asyncio.Queue[clickhouse_connect.driver.client.Client] | None = None
+    _executor: ThreadPoolExecutor | None = None
+    _init_lock = asyncio.Lock()
 
     @classmethod
-    async def get_client(cls, host, username, password) -> t.Self:
-        if cls._clickhouse_client is not None:
+    async def get_client(cls, host, username, password, pool_size: int = DEFAULT_POOL_SIZE) -> t.Self:
+        if cls._clients_pool is not None:
             return cls()
 
-        client = clickhouse_connect.get_client(host=host, username=username, password=password)
-        client.command(CREATE_USERS_INTERACTION_TABLE)
-        client.command(CREATE_GIVEN_RECOMMENDATIONS_TABLE)
+        async with cls._init_lock:
+            if cls._clients_pool is not None:
+                return cls()
+
+            loop = asyncio.get_running_loop()
+            executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='clickhouse')
+            connect = functools.partial(clickhouse_connect.get_client, host=host, username=username, password=password)
+            clients = await asyncio.gather(*(
+                loop.run_in_executor(executor, connect)
+                for _ in range(pool_size)
+            ))
+
+            # client does not run concurrent queries, so lock is kept by separate one
+            heartbeat_client = await loop.run_in_executor(executor, connect)
+            try:
+                version = await loop.run_in_executor(executor, apply_migrations, clients[0], heartbeat_client)
+            finally:
+                heartbeat_client.close()
+            logger.info('Clickhouse schema version %s', version)
+
+            clients_pool = asyncio.Queue()
+            for client in clients:
+                clients_pool.put_nowait(client)
 
-        cls._clickhouse_client = client
+            cls._executor = executor
+            cls._clients_pool = clients_pool
 
         return cls()
 
-    async def insert_interaction(self, user_id: int, event_id: UUID, interaction_type: str):
-        self._clickhouse_client.insert(
+    async def _run(self, method: str, *args, **kwargs):
+        """
+        call method of pooled client in thread pool
+        """
+        client = await self._clients_pool.get()
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            functools.partial(getattr(client, method), *args, **kwargs),
+        )
+        # client is returned to pool when query is done, even if awaiting coroutine was cancelled
+        future.add_done_callback(lambda _: self._clients_pool.put_nowait(client))
+
+        return await asyncio.shield(future)
+
+    async def insert_interactions(self, interactions: list[UserInteraction]):
+        """
+        save several interactions in one columnar insert
+        """
+        if not interactions:
+            return
+
+        await self._run(
+            'insert',
             'users_interactions',
-            [(user_id, event_id.hex, interaction_type, datetime.now())],
+            [
+                [interaction.user_id for interaction in interactions],
+                [interaction.event_id.hex for interaction in interactions],
+                [interaction.interaction_type.value for interaction in interactions],
+                [interaction.interaction_dt for interaction in interactions],
+            ],
             column_names=['user_id', 'event_id', 'interaction_type', 'interaction_dt'],
+            column_oriented=True,
         )
 
-    async def insert_given_recommendation(
+    async def insert_given_recommendations_log(
             self,
-            user_id: int,
-            recommendation: RecommendationList,
+            recommendations: list[tuple[int, RecommendationList | list[SimplifiedRecItem], datetime]],
     ):
-        recommended_events = [
-            (rec.event.id, rec.subsystem, rec.score)
-            for rec in recommendation
-        ]
-        self._clickhouse_client.insert(
+        """
+        save recommendations given at different time in one columnar insert
+        :param recommendations: user id, recommendation and time when it was given
+        """
+        if not recommendations:
+            return
+
+        await self._run(
+            'insert',
             'given_recommendations',
-            [(user_id, recommended_events, datetime.now())],
+            [
+                [user_id for user_id, _, _ in recommendations],
+                [get_recommended_events(recommendation) for _, recommendation, _ in recommendations],
+                [recommendation_dt for _, _, recommendation_dt in recommendations],
+            ],
             column_names=['user_id', 'recommended_events', 'recommendation_dt'],
+            column_oriented=True,
+        )
+
+    async def insert_precomputed_recommendations(
+            self,
+            recommendations: dict[int, list[SimplifiedRecItem]],
+            computed_dt: datetime,
+    ):
+        if not recommendations:
+            return
+
+        await self._run(
+            'insert',
+            'precomputed_recommendations',
+            [
+                (user_id, get_recommended_events(recommendation), computed_dt)
+                for user_id, recommendation in recommendations.items()
+            ],
+            column_names=['user_id', 'recommended_events', 'computed_dt'],
         )
 
-    async def get_interactions_by_user(self, user_id: int, after_dt: datetime, limit: int) -> list[UserInteraction]:
-        result = self._clickhouse_client.query(
+    async def get_precomputed_recommendation(
+            self,
+            user_id: int,
+            computed_after_dt: datetime,
+    ) -> list[SimplifiedRecItem] | None:
+        """
+        latest recommendation precomputed for user
+        :param computed_after_dt: older recommendations are not considered
+        :return: recommendation or None if there is no fresh one
+        """
+        result = await self._run(
+            'query',
             '''
-            SELECT * FROM users_interactions WHERE (user_id = %(v1)s) AND (toDate(interaction_dt) >= toDate(%(v2)s))
-            ORDER BY interaction_dt DESC
-            LIMIT %(v3)s
+            SELECT recommended_events FROM precomputed_recommendations
+            WHERE (user_id = %(v1)s) AND (computed_dt >= %(v2)s)
+            ORDER BY computed_dt DESC
+            LIMIT 1
             ''',
             parameters={
                 'v1': user_id,
-                'v2': after_dt,
-                'v3': limit,
+                'v2': computed_after_dt,
             }
         )
+        if not result.result_rows:
+            return None
 
         return [
-            UserInteraction(
-                user_id=row[0], event_id=row[1],
-                interaction_type=row[2], interaction_dt=row[3],
+            SimplifiedRecItem(
+                event_id=event_id, subsystem=subsystem, score=score,
             )
-            for row in result.result_rows
+            for event_id, subsystem, score in result.result_rows[0][0]
         ]
 
-    async def get_interactions_by_event(self, event_id: UUID, after_dt: datetime, limit: int) -> list[UserInteraction]:
-        result = self._clickhouse_client.query(
+    async def get_active_users(self, after_dt: datetime) -> set[int]:
+        """
+        users who interacted with events since after_dt
+        """
+        result = await self._run(
+            'query',
             '''
-            SELECT * FROM users_interactions WHERE (event_id = %(v1)s) AND (toDate(interaction_dt) >= toDate(%(v2)s))
-            ORDER BY interaction_dt DESC
-            LIMIT %(v3)s
+            SELECT DISTINCT user_id FROM users_interactions WHERE interaction_dt >= %(v1)s
             ''',
             parameters={
-                'v1': event_id.hex,
-                'v2': after_dt,
-                'v3': limit,
+                'v1': after_dt,
             }
         )
 
-        return [
-            UserInteraction(
-                user_id=row[0], event_id=row[1],
-                interaction_type=row[2], interaction_dt=row[3],
+        return {row[0] for row in result.result_rows}
+
+    async def get_interacted_pairs(self, after_dt: datetime, before_dt: datetime) -> list[tuple[int, UUID]]:
+        """
+        distinct pairs of user and event, which user clicked or liked in period
+        """
+        result = await self._run(
+            'query',
+            '''
+            SELECT DISTINCT user_id, event_id FROM users_interactions
+            WHERE (interaction_dt >= %(v1)s) AND (interaction_dt < %(v2)s) AND (interaction_type != %(v3)s)
+            ''',
+            parameters={
+                'v1': after_dt,
+                'v2': before_dt,
+                'v3': InteractionKind.DISLIKE.value,
+            }
+        )
+
+        return [(row[0], row[1]) for row in result.result_rows]
+
+    async def get_last_interactions_by_users(
+            self,
+            users_ids: set[int],
+            after_dt: datetime,
+            limit_by_user: int = LAST_INTERACTIONS_AMOUNT,
+    ) -> dict[int, list[UserInteraction]]:
+        """
+        latest interactions of users from pre-aggregated view, it is read by one row per user
+        :param users_ids: users to get interactions for
+        :param after_dt: interactions are considered from this date
+        :param limit_by_user: max amount of interactions for each user, not more than LAST_INTERACTIONS_AMOUNT
+        :return: interactions by user id, latest first
+        """
+        if limit_by_user > LAST_INTERACTIONS_AMOUNT:
+            raise ValueError(f'Only {LAST_INTERACTIONS_AMOUNT} last interactions are aggregated by user')
+        if not users_ids:
+            return {}
+
+        result = await self._run(
+            'query',
+            f'''
+            SELECT user_id, arraySlice(
+                arrayFilter(
+                    interaction -> (tupleElement(interaction, 2) >= %(v2)s),
+                    arrayDistinct(groupArraySortedMerge({LAST_INTERACTIONS_AMOUNT})(last_interactions))
+                ),
+                1, %(v3)s
             )
-            for row in result.result_rows
-        ]
+            FROM users_last_interactions WHERE user_id IN %(v1)s
+            GROUP BY user_id
+            ''',
+            parameters={
+                'v1': list(users_ids),
+                'v2': after_dt,
+                'v3': limit_by_user,
+            }
+        )
+
+        interactions_by_user: dict[int, list[UserInteraction]] = {}
+        for user_id, last_interactions in result.result_rows:
+            if not last_interactions:
+                continue
+
+            interactions_by_user[user_id] = [
+                UserInteraction(
+                    user_id=user_id, event_id=event_id,
+                    interaction_type=interaction_type, interaction_dt=interaction_dt,
+                )
+                for _, interaction_dt, event_id, interaction_type in last_interactions
+            ]
+
+        return interactions_by_user
@@ -0,0 +1,131 @@
+"""
+Cache of texts embeddings, so unchanged events and descriptions are not embedded again.
+Embeddings are keyed by model name and hash of normalized text,
+recently used ones are kept in memory in front of sqlite store on disk
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from common.utils import get_logger
+
+logger = get_logger('embedding_cache')
+
+CREATE_EMBEDDINGS_TABLE = '''
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    embedding BLOB NOT NULL
+) WITHOUT ROWID;
+'''
+SQLITE_MAX_PARAMETERS = 900
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def get_cache_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f'{model_name}\0{normalize_text(text)}'.encode()).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, path: Path, max_memory_size: int):
+        self.model_name = model_name
+        self.max_memory_size = max_memory_size
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # store is accessed from threads, one at a time
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(CREATE_EMBEDDINGS_TABLE)
+        self._connection_lock = threading.Lock()
+
+    def _remember(self, key: bytes, embedding: np.ndarray):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_memory_size:
+            self._entries.popitem(last=False)
+
+    def _load(self, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        loaded = {}
+        with self._connection_lock:
+            for batch_start in range(0, len(keys), SQLITE_MAX_PARAMETERS):
+                batch = keys[batch_start:batch_start + SQLITE_MAX_PARAMETERS]
+                rows = self._connection.execute(
+                    f'SELECT key, embedding FROM embeddings WHERE key IN ({", ".join("?" * len(batch))})',
+                    batch,
+                )
+                for key, embedding in rows:
+                    loaded[key] = np.frombuffer(embedding, dtype=np.float32)
+
+        return loaded
+
+    def _store(self, embeddings: dict[bytes, np.ndarray]):
+        with self._connection_lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)',
+                [(key, embedding.astype(np.float32).tobytes()) for key, embedding in embeddings.items()],
+            )
+
+    async def get_many(self, texts: list[str]) -> list[np.ndarray | None]:
+        """
+        :return: for each text its cached embedding or None
+        """
+        keys = [get_cache_key(self.model_name, text) for text in texts]
+
+        found: dict[bytes, np.ndarray] = {}
+        missing_in_memory = []
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+                self.memory_hits += 1
+            else:
+                missing_in_memory.append(key)
+
+        if missing_in_memory:
+            loaded = await asyncio.to_thread(self._load, missing_in_memory)
+            for key, embedding in loaded.items():
+                self._remember(key, embedding)
+            found.update(loaded)
+            self.disk_hits += len(loaded)
+            self.misses += len(missing_in_memory) - len(loaded)
+
+        return [found.get(key) for key in keys]
+
+    async def set_many(self, texts: list[str], embeddings: np.ndarray):
+        entries = {
+            get_cache_key(self.model_name, text): embedding
+            for text, embedding in zip(texts, embeddings)
+        }
+        for key, embedding in entries.items():
+            self._remember(key, embedding)
+
+        try:
+            await asyncio.to_thread(self._store, entries)
+        except sqlite3.Error as err:
+            logger.exception('Embeddings are not stored to disk: %s', err)
+
+    def get_stats(self) -> dict:
+        requests = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / requests if requests else 0.0,
+            'memory_size': len(self._entries),
+            'max_memory_size': self.max_memory_size,
+        }
@@ -0,0 +1,65 @@
+"""
+Embedding of texts in pool of processes, so inference does not block event loop and scales across cores.
+Each worker process loads embedding model once on start
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from common.utils import get_logger
+
+logger = get_logger('embedding_executor')
+
+# model of worker process, loaded by initializer
+_worker_model = None
+
+
+def _init_worker(model_name: str, cache_dir: str):
+    from fastembed import TextEmbedding
+
+    global _worker_model
+    _worker_model = TextEmbedding(model_name=model_name, cache_dir=cache_dir)
+
+
+def _embed(texts: list[str]) -> np.ndarray:
+    return np.stack(list(_worker_model.embed(texts))).astype(np.float32, copy=False)
+
+
+class EmbeddingExecutor:
+    """
+    Submission waits while max_pending batches are already submitted,
+    so bursts of texts are queued by callers instead of growing queue of process pool
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, workers: int, max_pending: int):
+        self.workers = workers
+        # workers are spawned, forked event loop and inference threads of parent are not safe to use
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(model_name, cache_dir),
+        )
+        self._pending = asyncio.Semaphore(max_pending)
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        :return: float32 embeddings of texts, one in each row
+        """
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _embed, texts)
+
+    async def warm_up(self):
+        """
+        start all workers, so model is loaded by each of them before first real embedding
+        """
+        logger.info('Starting %s embedding workers', self.workers)
+        await asyncio.gather(*(
+            asyncio.get_running_loop().run_in_executor(self._executor, _embed, ['warm up'])
+            for _ in range(self.workers)
+        ))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,106 @@
+import asyncio
+import time
+import typing as t
+from datetime import datetime
+from uuid import UUID
+
+from qdrant_client import models
+
+from common.clients.vectordb_client import VectorDB
+from common.clients.vectordb_client import get_upcoming_events_filter
+from common.clients.vectordb_client import get_updated_events_filter
+from common.models import EventData
+from common.utils import get_logger
+
+logger = get_logger('events_catalog')
+
+
+class EventsCatalog:
+    """
+    In-process catalog of events which can be recommended now.
+    Catalog is loaded once with full scroll of vector db, then only events indexed since
+    previous sync and events entered recommendation period are fetched. Past events are evicted,
+    events deleted from vector db are evicted by periodic reconciliation of ids.
+    Catalog state is shared by all instances
+    """
+    _events: dict[UUID, EventData] = {}
+    _synced_dt: datetime | None = None
+
+    def __init__(self, vectordb_client: VectorDB):
+        self._vectordb_client = vectordb_client
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __contains__(self, event_id: UUID) -> bool:
+        return event_id in self._events
+
+    @property
+    def is_loaded(self) -> bool:
+        return EventsCatalog._synced_dt is not None
+
+    def get(self, event_id: UUID) -> EventData | None:
+        return self._events.get(event_id)
+
+    def get_many(self, events_ids: t.Iterable[UUID]) -> dict[UUID, EventData]:
+        return {
+            event_id: self._events[event_id]
+            for event_id in events_ids
+            if event_id in self._events
+        }
+
+    def _get_sync_filter(self, sync_dt: datetime) -> models.Filter:
+        if not self.is_loaded:
+            return get_upcoming_events_filter(sync_dt)
+
+        return get_updated_events_filter(sync_dt, EventsCatalog._synced_dt)
+
+    def _evict_past_events(self, sync_dt: datetime):
+        sync_ts = sync_dt.timestamp()
+        past_events_ids = [
+            event_id for event_id, event in self._events.items()
+            if event.datetime_from.timestamp() < sync_ts
+        ]
+        for event_id in past_events_ids:
+            del self._events[event_id]
+
+    def _evict_deleted_events(self, stored_events_ids: set[UUID]):
+        deleted_events_ids = [event_id for event_id in self._events if event_id not in stored_events_ids]
+        for event_id in deleted_events_ids:
+            del self._events[event_id]
+
+    async def sync(self, reconcile: bool = False):
+        """
+        :param reconcile: evict events deleted from vector db, incremental sync does not see deletions
+        """
+        sync_dt = datetime.now()
+        # ids are scrolled first, events indexed after it are fetched by incremental scroll
+        stored_events_ids = None
+        if reconcile and self.is_loaded:
+            stored_events_ids = await self._vectordb_client.get_upcoming_events_ids()
+        events = await self._vectordb_client.scroll_events(self._get_sync_filter(sync_dt))
+
+        if stored_events_ids is not None:
+            stored_events_ids.update(event.id for event in events)
+            self._evict_deleted_events(stored_events_ids)
+        self._events.update((event.id, event) for event in events)
+        self._evict_past_events(sync_dt)
+
+        EventsCatalog._synced_dt = sync_dt
+        logger.debug('Events catalog synced: %s fetched, %s in catalog', len(events), len(self._events))
+
+    async def run_sync(self, sync_interval: float, reconcile_interval: float):
+        """
+        sync catalog every sync_interval seconds and reconcile it every reconcile_interval seconds,
+        catalog is expected to be synced once before
+        """
+        reconciled = time.monotonic()
+        while True:
+            await asyncio.sleep(sync_interval)
+            try:
+                reconcile = time.monotonic() - reconciled >= reconcile_interval
+                await self.sync(reconcile)
+                if reconcile:
+                    reconciled = time.monotonic()
+            except Exception as err:
+                logger.exception('Exception on events catalog sync: %s', err)
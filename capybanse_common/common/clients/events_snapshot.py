@@ -0,0 +1,75 @@
+"""
+Snapshot of upcoming events embeddings for fast start of local index.
+Arrays are saved as .npy files to be memory mapped on load, pages are shared by processes loaded same snapshot:
+    vectors.npy - float32 normalized embeddings, row per event
+    ids.npy - uint8 bytes of event uuid, row per event
+    datetimes.npy - float64 timestamp of event start, row per event
+    meta.json - time of snapshot, events indexed after it are not in snapshot
+"""
+import json
+import os
+import shutil
+import typing as t
+from datetime import datetime
+from pathlib import Path
+from uuid import UUID
+
+import numpy as np
+
+VECTORS_FILE = 'vectors.npy'
+IDS_FILE = 'ids.npy'
+DATETIMES_FILE = 'datetimes.npy'
+META_FILE = 'meta.json'
+
+
+class EventsSnapshot(t.NamedTuple):
+    ids: list[UUID]
+    datetimes_ts: np.ndarray  # float64, timestamp of event start
+    vectors: np.ndarray  # float32, normalized embedding of event in each row
+    exported_dt: datetime
+
+
+def save_events_snapshot(path: Path, snapshot: EventsSnapshot):
+    """
+    save snapshot to directory, previous snapshot in same directory is replaced
+    """
+    tmp_path = path.with_name(f'{path.name}.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    ids = np.array([list(event_id.bytes) for event_id in snapshot.ids], dtype=np.uint8).reshape(-1, 16)
+    np.save(tmp_path / IDS_FILE, ids)
+    np.save(tmp_path / DATETIMES_FILE, np.ascontiguousarray(snapshot.datetimes_ts, dtype=np.float64))
+    np.save(tmp_path / VECTORS_FILE, np.ascontiguousarray(snapshot.vectors, dtype=np.float32))
+    (tmp_path / META_FILE).write_text(json.dumps({
+        'exported_dt': snapshot.exported_dt.isoformat(),
+        'events_amount': len(snapshot.ids),
+    }))
+
+    # snapshot is missing only for a moment between renames
+    old_path = path.with_name(f'{path.name}.old')
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_events_snapshot(path: Path) -> EventsSnapshot:
+    """
+    load snapshot with memory mapped arrays.
+    Arrays are mapped copy-on-write, changed pages become private to process
+    """
+    meta = json.loads((path / META_FILE).read_text())
+    ids = np.load(path / IDS_FILE)
+    datetimes_ts = np.load(path / DATETIMES_FILE, mmap_mode='c')
+    vectors = np.load(path / VECTORS_FILE, mmap_mode='c')
+
+    if not len(ids) == len(datetimes_ts) == len(vectors) == meta['events_amount']:
+        raise ValueError(f'Snapshot {path} is inconsistent')
+
+    return EventsSnapshot(
+        ids=[UUID(bytes=event_id.tobytes()) for event_id in ids],
+        datetimes_ts=datetimes_ts,
+        vectors=vectors,
+        exported_dt=datetime.fromisoformat(meta['exported_dt']),
+    )
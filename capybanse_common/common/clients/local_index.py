@@ -0,0 +1,251 @@
+"""
+In-process vector index over embeddings of upcoming events.
+Exact brute force search is used for small sets of events, HNSW index for larger ones if hnswlib is installed
+"""
+import typing as t
+from uuid import UUID
+
+import numpy as np
+
+from common.utils import get_logger
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+HNSW_THRESHOLD = 50_000  # events amount since which HNSW index is used
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_OVERFETCH = 2  # filtered out events are compensated by fetching more neighbours
+MIN_CAPACITY = 1024
+
+logger = get_logger('local_index')
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).eps)
+
+
+class LocalEventsIndex:
+    """
+    Cosine similarity search of events, scores are same as of qdrant cosine distance.
+    Events are stored in rows of preallocated arrays, rows of removed events are reused
+    """
+
+    def __init__(self, dim: int, hnsw_threshold: int = HNSW_THRESHOLD):
+        self.dim = dim
+        self.hnsw_threshold = hnsw_threshold
+
+        self._ids: list[UUID | None] = []
+        self._row_by_id: dict[UUID, int] = {}
+        self._free_rows: list[int] = []
+        self._vectors = np.zeros((MIN_CAPACITY, dim), dtype=np.float32)
+        self._datetimes_ts = np.zeros(MIN_CAPACITY, dtype=np.float64)
+        self._alive = np.zeros(MIN_CAPACITY, dtype=bool)
+        self._hnsw_index = None
+
+    @classmethod
+    def from_arrays(cls, ids: list[UUID], datetimes_ts: np.ndarray, normalized_vectors: np.ndarray) -> t.Self:
+        """
+        index over given arrays without copying them, e.g. memory mapped snapshot.
+        Arrays are copied when index grows over their size
+        """
+        local_index = cls(normalized_vectors.shape[1])
+        local_index._ids = list(ids)
+        local_index._row_by_id = {event_id: row for row, event_id in enumerate(ids)}
+        local_index._vectors = normalized_vectors
+        local_index._datetimes_ts = datetimes_ts
+        local_index._alive = np.ones(len(ids), dtype=bool)
+
+        if hnswlib is not None and len(local_index) >= local_index.hnsw_threshold:
+            local_index._build_hnsw_index()
+
+        return local_index
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def __contains__(self, event_id: UUID) -> bool:
+        return event_id in self._row_by_id
+
+    @property
+    def ids(self) -> list[UUID]:
+        return list(self._row_by_id)
+
+    @property
+    def _capacity(self) -> int:
+        return len(self._alive)
+
+    def _grow(self, capacity: int):
+        grown = max(self._capacity, MIN_CAPACITY)
+        while grown < capacity:
+            grown *= 2
+
+        vectors = np.zeros((grown, self.dim), dtype=np.float32)
+        vectors[:len(self._vectors)] = self._vectors
+        datetimes_ts = np.zeros(grown, dtype=np.float64)
+        datetimes_ts[:len(self._datetimes_ts)] = self._datetimes_ts
+        alive = np.zeros(grown, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+
+        self._vectors, self._datetimes_ts, self._alive = vectors, datetimes_ts, alive
+        if self._hnsw_index is not None:
+            self._hnsw_index.resize_index(grown)
+
+    def _allocate_rows(self, amount: int) -> list[int]:
+        rows = self._free_rows[-amount:][::-1] if amount else []
+        del self._free_rows[len(self._free_rows) - len(rows):]
+
+        new_rows_amount = amount - len(rows)
+        if new_rows_amount:
+            first_new_row = len(self._ids)
+            self._grow(first_new_row + new_rows_amount)
+            self._ids.extend([None] * new_rows_amount)
+            rows.extend(range(first_new_row, first_new_row + new_rows_amount))
+
+        return rows
+
+    def upsert(self, ids: list[UUID], datetimes_ts: np.ndarray, vectors: np.ndarray):
+        """
+        add events or update existing ones
+        """
+        if not ids:
+            return
+
+        new_ids = [event_id for event_id in dict.fromkeys(ids) if event_id not in self._row_by_id]
+        for event_id, row in zip(new_ids, self._allocate_rows(len(new_ids))):
+            self._ids[row] = event_id
+            self._row_by_id[event_id] = row
+
+        rows = np.array([self._row_by_id[event_id] for event_id in ids], dtype=np.int64)
+        self._vectors[rows] = normalize(np.asarray(vectors, dtype=np.float32))
+        self._datetimes_ts[rows] = datetimes_ts
+        self._alive[rows] = True
+
+        if self._hnsw_index is not None:
+            # labels of removed events are restored by adding them again
+            self._hnsw_index.add_items(self._vectors[rows], rows)
+        elif hnswlib is not None and len(self) >= self.hnsw_threshold:
+            self._build_hnsw_index()
+
+    def remove(self, ids: list[UUID]):
+        for event_id in ids:
+            row = self._row_by_id.pop(event_id, None)
+            if row is None:
+                continue
+
+            self._ids[row] = None
+            self._alive[row] = False
+            self._free_rows.append(row)
+            if self._hnsw_index is not None:
+                self._hnsw_index.mark_deleted(row)
+
+    def remove_past(self, request_ts: float):
+        """
+        remove events started before request_ts
+        """
+        past_rows = np.flatnonzero(self._alive & (self._datetimes_ts < request_ts))
+        self.remove([self._ids[row] for row in past_rows])
+
+    def _build_hnsw_index(self):
+        logger.info('Building HNSW index over %s events', len(self))
+        hnsw_index = hnswlib.Index(space='ip', dim=self.dim)
+        hnsw_index.init_index(
+            max_elements=self._capacity,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            M=HNSW_M,
+        )
+
+        rows = np.flatnonzero(self._alive)
+        hnsw_index.add_items(self._vectors[rows], rows)
+        self._hnsw_index = hnsw_index
+
+    def _search_hnsw(
+            self,
+            embedding: np.ndarray,
+            limit: int,
+            is_valid: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        :return: rows and scores of found events or None if not enough events passed filter
+        """
+        neighbours = min(limit * HNSW_OVERFETCH, len(self))
+        if neighbours <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        self._hnsw_index.set_ef(max(neighbours, HNSW_M))
+        labels, distances = self._hnsw_index.knn_query(embedding, k=neighbours)
+        rows = labels[0].astype(np.int64)
+        scores = 1 - distances[0]
+
+        passed = is_valid[rows]
+        if passed.sum() < min(limit, is_valid.sum()):
+            return None
+
+        return rows[passed][:limit], scores[passed][:limit]
+
+    def _search_exact(
+            self,
+            embeddings: np.ndarray,
+            limits: list[int],
+            is_valid: np.ndarray,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        # used rows are scored in place, scores of invalid ones are masked, so vectors are not copied
+        rows_amount = len(self._ids)
+        is_valid = is_valid[:rows_amount]
+        valid_amount = int(is_valid.sum())
+        batch_scores = embeddings @ self._vectors[:rows_amount].T
+        batch_scores[:, ~is_valid] = -np.inf
+
+        results = []
+        for scores, limit in zip(batch_scores, limits):
+            limit = min(limit, valid_amount)
+            found = np.argpartition(-scores, limit - 1)[:limit] if limit else np.empty(0, dtype=np.int64)
+            found = found[np.argsort(-scores[found], kind='stable')]
+            results.append((found, scores[found]))
+
+        return results
+
+    def search(
+            self,
+            queries: list[tuple[np.ndarray | list[float], int]],
+            min_ts: float,
+            max_ts: float,
+    ) -> list[list[tuple[float, UUID, float]]]:
+        """
+        search events started between min_ts and max_ts
+        :param queries: embedding and limit of each search
+        :return: score, id and start timestamp of found events in order of queries
+        """
+        if not queries:
+            return []
+
+        is_valid = self._alive & (self._datetimes_ts >= min_ts) & (self._datetimes_ts <= max_ts)
+        embeddings = normalize(np.stack([np.asarray(embedding, dtype=np.float32) for embedding, _ in queries]))
+        limits = [limit for _, limit in queries]
+
+        results: list[tuple[np.ndarray, np.ndarray] | None] = [None] * len(queries)
+        if self._hnsw_index is not None:
+            for query_index, (embedding, limit) in enumerate(zip(embeddings, limits)):
+                results[query_index] = self._search_hnsw(embedding, limit, is_valid)
+
+        # exact search of all queries not served by HNSW index
+        exact_queries = [query_index for query_index, result in enumerate(results) if result is None]
+        if exact_queries:
+            exact_results = self._search_exact(
+                embeddings[exact_queries],
+                [limits[query_index] for query_index in exact_queries],
+                is_valid,
+            )
+            for query_index, result in zip(exact_queries, exact_results):
+                results[query_index] = result
+
+        return [
+            [
+                (float(score), self._ids[row], float(self._datetimes_ts[row]))
+                for row, score in zip(rows, scores)
+            ]
+            for rows, scores in results
+        ]
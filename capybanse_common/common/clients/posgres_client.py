@@ -1,9 +1,13 @@
 import json
 import typing as t
+from enum import Enum
+from uuid import UUID
 
 import psycopg
 from psycopg_pool import AsyncConnectionPool
 
+from common.clients.prepared_sql import ADD_RESONANSE_EVENTS_FINGERPRINT_COLUMN
+from common.clients.prepared_sql import CREATE_RESONANSE_EVENTS_STAGING_TABLE
 from common.clients.prepared_sql import CREATE_RESONANSE_EVENTS_TABLE
 from common.clients.prepared_sql import CREATE_RESONANSE_USERS_TABLE
 from common.models import EventData
@@ -12,9 +16,78 @@ from common.models import Image
 from common.models import Price
 from common.models import Venue
 from common.utils import get_logger
+from common.utils.serde_helpers import get_event_fingerprint
 
 logger = get_logger('postgres_client')
 
+EVENT_COLUMNS = (
+    'id', 'title', 'description', 'datetime_from', 'datetime_to', 'city',
+    'venue_title', 'venue_address', 'venue_lat', 'venue_lon',
+    'image_url', 'local_image_path', 'price_price', 'price_currency',
+    'tags', 'contact', 'service_id', 'service_type', 'service_data', 'fingerprint',
+)
+
+# saved event keeps its id, other columns are updated by new version of event
+UPSERT_EVENT_CLAUSE = '''
+    ON CONFLICT (service_id) DO UPDATE SET ({updated_columns}) = ({excluded_columns})
+    WHERE resonanse_events.id = EXCLUDED.id AND resonanse_events.fingerprint IS DISTINCT FROM EXCLUDED.fingerprint
+'''.format(
+    updated_columns=', '.join(column for column in EVENT_COLUMNS if column != 'id'),
+    excluded_columns=', '.join(f'EXCLUDED.{column}' for column in EVENT_COLUMNS if column != 'id'),
+)
+
+INSERT_EVENT_QUERY = '''
+    INSERT INTO resonanse_events (
+        id, title, description, datetime_from, datetime_to, city,
+        venue_title, venue_address, venue_lat, venue_lon,
+        image_url, local_image_path, price_price, price_currency,
+        tags, contact, service_id, service_type, service_data, fingerprint
+    ) VALUES (
+        %(id)s, %(title)s, %(description)s, %(datetime_from)s, %(datetime_to)s, %(city)s,
+        %(venue_title)s, %(venue_address)s, %(venue_lat)s, %(venue_lon)s,
+        %(image_url)s, %(local_image_path)s, %(price_price)s, %(price_currency)s,
+        %(tags)s, %(contact)s, %(service_id)s, %(service_type)s, %(service_data)s, %(fingerprint)s
+    )
+'''
+
+
+class EventInsertOutcome(Enum):
+    INSERTED = 'INSERTED'
+    UPDATED = 'UPDATED'  # saved event with same service id and id is replaced by new version
+    DUPLICATE = 'DUPLICATE'  # event with same service id is already saved
+    FAILED = 'FAILED'
+
+
+def get_event_params(event: EventData) -> dict:
+    price_price = None
+    price_currency = None
+    if event.price is not None:
+        price_price = event.price.price
+        price_currency = event.price.currency
+
+    return {
+        'id': event.id,
+        'title': event.title,
+        'description': event.description,
+        'datetime_from': event.datetime_from,
+        'datetime_to': event.datetime_to,
+        'city': event.city,
+        'venue_title': event.venue.title,
+        'venue_address': event.venue.address,
+        'venue_lat': event.venue.lat,
+        'venue_lon': event.venue.lon,
+        'image_url': str(event.picture.image_url),
+        'local_image_path': event.picture.local_image,
+        'price_price': price_price,
+        'price_currency': price_currency,
+        'tags': event.tags,
+        'contact': event.contact,
+        'service_id': event.service_id,
+        'service_type': event.service_type,
+        'service_data': json.dumps(event.service_data),
+        'fingerprint': get_event_fingerprint(event),
+    }
+
 
 class PostgresDB:
     _pool: AsyncConnectionPool | None = None
@@ -41,63 +114,109 @@ class PostgresDB:
         async with cls._pool.connection() as aconn:
             async with aconn.cursor() as acur:
                 await acur.execute(CREATE_RESONANSE_EVENTS_TABLE)
+                await acur.execute(ADD_RESONANSE_EVENTS_FINGERPRINT_COLUMN)
                 await acur.execute(CREATE_RESONANSE_USERS_TABLE)
 
         return cls()
 
     async def add_event(self, event: EventData) -> bool:
-        query = '''
-            INSERT INTO resonanse_events (
-                id, title, description, datetime_from, datetime_to, city,
-                venue_title, venue_address, venue_lat, venue_lon,
-                image_url, local_image_path, price_price, price_currency,
-                tags, contact, service_id, service_type, service_data
-            ) VALUES (
-                %(id)s, %(title)s, %(description)s, %(datetime_from)s, %(datetime_to)s, %(city)s,
-                %(venue_title)s, %(venue_address)s, %(venue_lat)s, %(venue_lon)s,
-                %(image_url)s, %(local_image_path)s, %(price_price)s, %(price_currency)s,
-                %(tags)s, %(contact)s, %(service_id)s, %(service_type)s, %(service_data)s
-            )
-        '''
+        try:
+            return await self._add_event_with_outcome(event) == EventInsertOutcome.INSERTED
+        except psycopg.OperationalError as err:
+            logger.exception('Error on add_event %s', err)
+            return False
 
+    async def _add_event_with_outcome(self, event: EventData) -> EventInsertOutcome:
         try:
             async with self._pool.connection() as aconn:
                 async with aconn.cursor() as acur:
-                    price_price = None
-                    price_currency = None
-                    if event.price is not None:
-                        price_price = event.price.price
-                        price_currency = event.price.currency
-
                     await acur.execute(
-                        query,
-                        {
-                            'id': event.id,
-                            'title': event.title,
-                            'description': event.description,
-                            'datetime_from': event.datetime_from,
-                            'datetime_to': event.datetime_to,
-                            'city': event.city,
-                            'venue_title': event.venue.title,
-                            'venue_address': event.venue.address,
-                            'venue_lat': event.venue.lat,
-                            'venue_lon': event.venue.lon,
-                            'image_url': str(event.picture.image_url),
-                            'local_image_path': event.picture.local_image,
-                            'price_price': price_price,
-                            'price_currency': price_currency,
-                            'tags': event.tags,
-                            'contact': event.contact,
-                            'service_id': event.service_id,
-                            'service_type': event.service_type,
-                            'service_data': json.dumps(event.service_data),
-                        }
+                        INSERT_EVENT_QUERY + UPSERT_EVENT_CLAUSE + 'RETURNING xmax = 0',
+                        get_event_params(event),
                     )
+                    if (row := await acur.fetchone()) is None:
+                        return EventInsertOutcome.DUPLICATE
+                    if not row[0]:
+                        return EventInsertOutcome.UPDATED
+        except psycopg.OperationalError:
+            # database is not available, event is not invalid
+            raise
         except psycopg.errors.Error as err:
             logger.exception('Error on add_event %s', err)
-            return False
+            return EventInsertOutcome.FAILED
 
-        return True
+        return EventInsertOutcome.INSERTED
+
+    async def add_events_bulk(self, events: list[EventData]) -> list[EventInsertOutcome]:
+        """
+        insert several events in one transaction: events are copied to staging table
+        and moved from it to events table. Saved event with same service id is updated,
+        when event has its id and changed content, otherwise event is skipped.
+        If batch fails, events are inserted one by one, so one invalid event does not fail others.
+        Connection errors are raised, so batch can be retried as a whole
+        :return: outcome of each event
+        """
+        outcomes = [EventInsertOutcome.DUPLICATE] * len(events)
+        # only first event of each service id is inserted, others are duplicates
+        first_indices: dict[str, int] = {}
+        for event_index, event in enumerate(events):
+            first_indices.setdefault(event.service_id, event_index)
+        if not first_indices:
+            return outcomes
+
+        columns = ', '.join(EVENT_COLUMNS)
+        try:
+            async with self._pool.connection() as aconn:
+                async with aconn.transaction():
+                    async with aconn.cursor() as acur:
+                        await acur.execute(CREATE_RESONANSE_EVENTS_STAGING_TABLE)
+                        async with acur.copy(f'COPY resonanse_events_staging ({columns}) FROM STDIN') as copy:
+                            for event_index in first_indices.values():
+                                event_params = get_event_params(events[event_index])
+                                await copy.write_row([event_params[column] for column in EVENT_COLUMNS])
+
+                        await acur.execute(f'''
+                            INSERT INTO resonanse_events ({columns})
+                            SELECT {columns} FROM resonanse_events_staging
+                            {UPSERT_EVENT_CLAUSE}
+                            RETURNING service_id, xmax = 0
+                        ''')
+                        # xmax of inserted row is zero
+                        is_inserted = dict(await acur.fetchall())
+        except psycopg.OperationalError:
+            raise
+        except psycopg.errors.Error as err:
+            logger.exception('Error on add_events_bulk of %s events, adding one by one: %s', len(events), err)
+            for event_index in first_indices.values():
+                outcomes[event_index] = await self._add_event_with_outcome(events[event_index])
+            return outcomes
+
+        for service_id, event_index in first_indices.items():
+            if service_id not in is_inserted:
+                continue
+            if is_inserted[service_id]:
+                outcomes[event_index] = EventInsertOutcome.INSERTED
+            else:
+                outcomes[event_index] = EventInsertOutcome.UPDATED
+
+        return outcomes
+
+    async def get_saved_events(self, service_ids: list[str]) -> dict[str, tuple[UUID, str | None]]:
+        """
+        :return: id and fingerprint of saved event by service id, unknown events are absent
+        """
+        if not service_ids:
+            return {}
+
+        async with self._pool.connection() as aconn:
+            async with aconn.cursor() as acur:
+                await acur.execute(
+                    'SELECT service_id, id, fingerprint FROM resonanse_events WHERE service_id = ANY(%(service_ids)s)',
+                    {'service_ids': service_ids},
+                )
+                rows = await acur.fetchall()
+
+        return {service_id: (event_id, fingerprint) for service_id, event_id, fingerprint in rows}
 
     async def set_user_description(self, user_id: int, user_description: str) -> bool:
         query = '''
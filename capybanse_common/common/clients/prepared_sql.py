@@ -24,10 +24,24 @@ CREATE TABLE IF NOT EXISTS resonanse_events (
 
      service_id TEXT NOT NULL UNIQUE,
      service_type TEXT,
-     service_data JSONB
+     service_data JSONB,
+
+     -- content hash of saved version of event, parsers compare it to skip unchanged events
+     fingerprint CHAR(64)
 );
 '''
 
+ADD_RESONANSE_EVENTS_FINGERPRINT_COLUMN = '''
+ALTER TABLE resonanse_events ADD COLUMN IF NOT EXISTS fingerprint CHAR(64);
+'''
+
+# bulk insert of events is copied to staging table of session first, rows are deleted on commit
+CREATE_RESONANSE_EVENTS_STAGING_TABLE = '''
+CREATE TEMPORARY TABLE IF NOT EXISTS resonanse_events_staging (
+    LIKE resonanse_events INCLUDING DEFAULTS
+) ON COMMIT DELETE ROWS;
+'''
+
 CREATE_RESONANSE_USERS_TABLE = '''
 CREATE TABLE IF NOT EXISTS resonanse_users (
     -- base data
@@ -90,4 +104,198 @@ ENGINE MergeTree
 ORDER BY recommendation_dt;
 '''
 
+CREATE_PRECOMPUTED_RECOMMENDATIONS_TABLE = '''
+CREATE TABLE IF NOT EXISTS precomputed_recommendations (
+    user_id Int64,
+    recommended_events Array(Tuple(event_id UUID, subsystem_kind String, score Float32)),
+    computed_dt DateTime
+)
+ENGINE ReplacingMergeTree(computed_dt)
+ORDER BY user_id;
+'''
+
+# clickhouse schema is changed by numbered migrations, applied version is stored in schema_migrations table.
+# Migrations are never edited after release, schema is changed by adding next one,
+# so statements of a migration are the ones it was released with
+
+CREATE_SCHEMA_MIGRATIONS_TABLE = '''
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version UInt32,
+    description String,
+    applied_dt DateTime
+)
+ENGINE MergeTree
+ORDER BY version;
+'''
+
+# table exists while migrations are applied, creation of existing table fails, so it is used as mutex.
+# Table is created with row of its owner, owner inserts heartbeat rows while it holds lock
+CREATE_SCHEMA_MIGRATIONS_LOCK_TABLE = '''
+CREATE TABLE schema_migrations_lock (
+    owner String,
+    heartbeat_dt DateTime DEFAULT now()
+)
+ENGINE Memory
+AS SELECT %(owner)s AS owner, now() AS heartbeat_dt;
+'''
+
+# owner of lock and seconds since its last heartbeat or creation of lock, by server clock
+SELECT_SCHEMA_MIGRATIONS_LOCK_STATE = '''
+SELECT
+    any(owner),
+    dateDiff('second', greatest(max(heartbeat_dt), (
+        SELECT any(metadata_modification_time) FROM system.tables
+        WHERE database = currentDatabase() AND name = 'schema_migrations_lock'
+    )), now())
+FROM schema_migrations_lock
+'''
+
+# layout of interactions when they were read by user or by event: table is sorted by user,
+# projection sorted by event serves reads by event and monthly partitions are pruned by period.
+# Table is rebuilt into new layout and swapped, rerun after failure starts over from current table
+MIGRATE_USERS_INTERACTIONS_TABLE = [
+    'DROP TABLE IF EXISTS users_interactions_migration;',
+    '''
+    CREATE TABLE users_interactions_migration (
+        user_id Int64,
+        event_id UUID,
+        interaction_type LowCardinality(String),
+        interaction_dt DateTime,
+        PROJECTION by_event (
+            SELECT * ORDER BY event_id, interaction_dt
+        )
+    )
+    ENGINE MergeTree
+    PARTITION BY toYYYYMM(interaction_dt)
+    ORDER BY (user_id, interaction_dt)
+    TTL interaction_dt + INTERVAL 1 YEAR;
+    ''',
+    '''
+    INSERT INTO users_interactions_migration
+    SELECT user_id, event_id, interaction_type, interaction_dt FROM users_interactions;
+    ''',
+    'EXCHANGE TABLES users_interactions AND users_interactions_migration;',
+    'DROP TABLE users_interactions_migration;',
+]
+
+MIGRATE_GIVEN_RECOMMENDATIONS_TABLE = [
+    'DROP TABLE IF EXISTS given_recommendations_migration;',
+    '''
+    CREATE TABLE given_recommendations_migration (
+        user_id Int64,
+        recommended_events Array(Tuple(event_id UUID, subsystem_kind String, score Float32)),
+        recommendation_dt DateTime
+    )
+    ENGINE MergeTree
+    PARTITION BY toYYYYMM(recommendation_dt)
+    ORDER BY (user_id, recommendation_dt)
+    TTL recommendation_dt + INTERVAL 180 DAY;
+    ''',
+    '''
+    INSERT INTO given_recommendations_migration
+    SELECT user_id, recommended_events, recommendation_dt FROM given_recommendations;
+    ''',
+    'EXCHANGE TABLES given_recommendations AND given_recommendations_migration;',
+    'DROP TABLE given_recommendations_migration;',
+]
+
+MODIFY_PRECOMPUTED_RECOMMENDATIONS_TTL = '''
+ALTER TABLE precomputed_recommendations MODIFY TTL computed_dt + INTERVAL 7 DAY;
+'''
+
+LAST_INTERACTIONS_AMOUNT = 100
+
+# latest interactions of each user, aggregated on insert to users_interactions.
+# Interactions are sorted by negated timestamp, so groupArraySorted keeps latest ones on merges
+CREATE_USERS_LAST_INTERACTIONS_TABLE = f'''
+CREATE TABLE IF NOT EXISTS users_last_interactions (
+    user_id Int64,
+    last_interactions AggregateFunction(
+        groupArraySorted({LAST_INTERACTIONS_AMOUNT}),
+        Tuple(Int64, DateTime, UUID, String)
+    )
+)
+ENGINE AggregatingMergeTree
+ORDER BY user_id;
+'''
+
+SELECT_USERS_LAST_INTERACTIONS_STATE = f'''
+SELECT
+    user_id,
+    groupArraySortedState({LAST_INTERACTIONS_AMOUNT})(
+        (-toInt64(toUnixTimestamp(interaction_dt)), interaction_dt, event_id, toString(interaction_type))
+    ) AS last_interactions
+FROM users_interactions
+GROUP BY user_id
+'''
+
+# table is filled from existing interactions after view is created,
+# interactions inserted in between and ones inserted late with earlier time are duplicated and removed on read
+CREATE_USERS_LAST_INTERACTIONS_VIEW = [
+    CREATE_USERS_LAST_INTERACTIONS_TABLE,
+    'TRUNCATE TABLE users_last_interactions;',
+    f'''
+    CREATE MATERIALIZED VIEW IF NOT EXISTS users_last_interactions_mv TO users_last_interactions AS
+    {SELECT_USERS_LAST_INTERACTIONS_STATE};
+    ''',
+    f'''
+    INSERT INTO users_last_interactions
+    {SELECT_USERS_LAST_INTERACTIONS_STATE};
+    ''',
+]
+
+# projection by event is created by migration 2, no query reads interactions by event anymore
+DROP_USERS_INTERACTIONS_BY_EVENT_PROJECTION = '''
+ALTER TABLE users_interactions DROP PROJECTION IF EXISTS by_event;
+'''
+
+# interactions are not read by user anymore, latest ones of user are read from users_last_interactions.
+# Remained reads select period of time, so table is sorted by time again, monthly partitions are kept for TTL.
+# Interactions inserted while table was copied are in swapped out table, they are copied again after swap,
+# migration is expected to take less than a day. Copied again ones are aggregated again by
+# users_last_interactions_mv, duplicates are removed on read
+MIGRATE_USERS_INTERACTIONS_TABLE_BY_TIME = [
+    'DROP TABLE IF EXISTS users_interactions_migration;',
+    '''
+    CREATE TABLE users_interactions_migration (
+        user_id Int64,
+        event_id UUID,
+        interaction_type LowCardinality(String),
+        interaction_dt DateTime
+    )
+    ENGINE MergeTree
+    PARTITION BY toYYYYMM(interaction_dt)
+    ORDER BY interaction_dt
+    TTL interaction_dt + INTERVAL 1 YEAR;
+    ''',
+    '''
+    INSERT INTO users_interactions_migration
+    SELECT user_id, event_id, interaction_type, interaction_dt FROM users_interactions;
+    ''',
+    'EXCHANGE TABLES users_interactions AND users_interactions_migration;',
+    '''
+    INSERT INTO users_interactions
+    SELECT user_id, event_id, interaction_type, interaction_dt FROM users_interactions_migration
+    WHERE interaction_dt >= now() - INTERVAL 1 DAY
+        AND (user_id, event_id, interaction_type, interaction_dt) NOT IN (
+            SELECT user_id, event_id, interaction_type, interaction_dt FROM users_interactions
+            WHERE interaction_dt >= now() - INTERVAL 1 DAY
+        );
+    ''',
+    'DROP TABLE users_interactions_migration;',
+]
 
+# version, description, statements
+CLICKHOUSE_MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, 'initial tables', [
+        CREATE_USERS_INTERACTION_TABLE,
+        CREATE_GIVEN_RECOMMENDATIONS_TABLE,
+        CREATE_PRECOMPUTED_RECOMMENDATIONS_TABLE,
+    ]),
+    (2, 'users_interactions sorted by user, projection by event, monthly partitions', MIGRATE_USERS_INTERACTIONS_TABLE),
+    (3, 'given_recommendations sorted by user, monthly partitions', MIGRATE_GIVEN_RECOMMENDATIONS_TABLE),
+    (4, 'precomputed_recommendations ttl', [MODIFY_PRECOMPUTED_RECOMMENDATIONS_TTL]),
+    (5, 'users_last_interactions materialized view', CREATE_USERS_LAST_INTERACTIONS_VIEW),
+    (6, 'users_interactions without projection by event', [DROP_USERS_INTERACTIONS_BY_EVENT_PROJECTION]),
+    (7, 'users_interactions sorted by time, monthly partitions', MIGRATE_USERS_INTERACTIONS_TABLE_BY_TIME),
+]
@@ -1,32 +1,193 @@
+import asyncio
 import os
+import threading
+import time
+from pathlib import Path
 import typing as t
 from datetime import datetime
 from datetime import timedelta
 from uuid import UUID
+from uuid import uuid4
 
 import numpy as np
-from fastembed import TextEmbedding
 from qdrant_client import AsyncQdrantClient
 from qdrant_client import models
 
+from common.clients.embedding_cache import EmbeddingCache
+from common.clients.embedding_executor import EmbeddingExecutor
+from common.clients.events_snapshot import EventsSnapshot
+from common.clients.events_snapshot import load_events_snapshot
+from common.clients.events_snapshot import save_events_snapshot
+from common.clients.local_index import LocalEventsIndex
+from common.clients.local_index import normalize
 from common.models import EventData
+from common.models import EventRef
 from common.utils import get_logger
 
+if t.TYPE_CHECKING:
+    from fastembed import TextEmbedding
+
 # todo fix this path
 CACHE_DIR = os.getenv('FASTEMBED_CACHE_DIR') or '/var/capybanse/model'
+EMBEDDING_MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
 QDRANT_EVENTS_COLLECTION = 'events_collection'
 QDRANT_USERS_COLLECTION = 'users_collection'
+QDRANT_USERS_DYNAMIC_COLLECTION = 'users_dynamic_collection'
 RECOMMENDATION_PERIOD = timedelta(days=180)
+EMBEDDING_SIZE = 384
+SCROLL_BATCH_SIZE = 1000
+SYNC_OVERLAP = timedelta(seconds=30)  # events indexed while previous sync was running are fetched again
 
 logger = get_logger('vectordb_client')
 
 
+# payload fields of compact search, event id is taken from point id
+EVENT_REF_PAYLOAD = models.PayloadSelectorInclude(include=['datetime_from'])
+
+
+def get_event_ref(point: models.ScoredPoint | models.Record) -> EventRef:
+    # payload is not validated, it was validated when event was added
+    return EventRef.model_construct(
+        id=UUID(str(point.id)),
+        datetime_from=datetime.fromisoformat(point.payload['datetime_from']),
+    )
+
+
+class EventsMatrix(t.NamedTuple):
+    ids: list[UUID]
+    datetimes_ts: np.ndarray  # float64, timestamp of event start
+    vectors: np.ndarray  # float32, embedding of event in each row
+
+
+class DynamicEmbedding(t.NamedTuple):
+    weighted_sum: np.ndarray  # float32, weighted sum of interacted events embeddings
+    count: float  # decayed amount of interactions
+    updated_ts: float  # timestamp of last update, decay is applied since it
+    events_ids: list[UUID]  # recently interacted events, latest first
+    version: int | None = None  # version of stored embedding, None if embedding is not stored
+
+
+def get_upcoming_events_filter(request_dt: datetime) -> models.Filter:
+    """
+    events which can be recommended at request_dt
+    """
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="datetime_from",
+                range=models.DatetimeRange(
+                    gte=request_dt,
+                    lte=request_dt + RECOMMENDATION_PERIOD,
+                ),
+            ),
+        ]
+    )
+
+
+def get_updated_events_filter(request_dt: datetime, synced_dt: datetime) -> models.Filter:
+    """
+    events which can be recommended at request_dt and were indexed
+    or entered recommendation period since synced_dt
+    """
+    return models.Filter(
+        must=get_upcoming_events_filter(request_dt).must,
+        should=[
+            models.FieldCondition(
+                key='indexed_dt',
+                range=models.DatetimeRange(gte=synced_dt - SYNC_OVERLAP),
+            ),
+            models.FieldCondition(
+                key='datetime_from',
+                range=models.DatetimeRange(gt=synced_dt + RECOMMENDATION_PERIOD - SYNC_OVERLAP),
+            ),
+        ],
+    )
+
+
 class VectorDB:
     _qdrant_client: AsyncQdrantClient | None = None
-    _multilingual_model = TextEmbedding(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-        cache_dir=CACHE_DIR,
-    )
+    # local index of upcoming events, searches are served by it when enabled
+    _local_index: LocalEventsIndex | None = None
+    _local_index_synced_dt: datetime | None = None
+    # embedding model is loaded on first embedding, processes which only search do not load it
+    _multilingual_model: 'TextEmbedding | None' = None
+    _model_lock = threading.Lock()
+
+    @classmethod
+    def get_model(cls) -> 'TextEmbedding':
+        if cls._multilingual_model is not None:
+            return cls._multilingual_model
+
+        with cls._model_lock:
+            if cls._multilingual_model is None:
+                from fastembed import TextEmbedding
+
+                logger.info('Loading embedding model %s', EMBEDDING_MODEL_NAME)
+                cls._multilingual_model = TextEmbedding(
+                    model_name=EMBEDDING_MODEL_NAME,
+                    cache_dir=CACHE_DIR,
+                )
+
+        return cls._multilingual_model
+
+    # embeddings of async methods are computed by executor when it is set, otherwise in thread
+    _embedding_executor: EmbeddingExecutor | None = None
+
+    @classmethod
+    def set_embedding_executor(cls, embedding_executor: EmbeddingExecutor | None):
+        cls._embedding_executor = embedding_executor
+
+    @classmethod
+    def start_embedding_executor(cls, workers: int, max_pending: int) -> EmbeddingExecutor:
+        embedding_executor = EmbeddingExecutor(EMBEDDING_MODEL_NAME, CACHE_DIR, workers, max_pending)
+        cls.set_embedding_executor(embedding_executor)
+        return embedding_executor
+
+    # embeddings of texts which were embedded before are taken from cache when it is set
+    _embedding_cache: EmbeddingCache | None = None
+
+    @classmethod
+    def start_embedding_cache(cls, path: Path, max_memory_size: int) -> EmbeddingCache:
+        cls._embedding_cache = EmbeddingCache(EMBEDDING_MODEL_NAME, path, max_memory_size)
+        return cls._embedding_cache
+
+    @classmethod
+    def get_embedding_cache_stats(cls) -> dict | None:
+        if cls._embedding_cache is None:
+            return None
+
+        return cls._embedding_cache.get_stats()
+
+    @classmethod
+    def embed_many(cls, texts: list[str]) -> np.ndarray:
+        return np.stack(list(cls.get_model().embed(texts))).astype(np.float32, copy=False)
+
+    async def _compute_embeddings(self, texts: list[str]) -> np.ndarray:
+        if self._embedding_executor is not None:
+            return await self._embedding_executor.embed(texts)
+
+        return await asyncio.to_thread(self.embed_many, texts)
+
+    async def get_embeddings(self, texts: list[str]) -> np.ndarray:
+        """
+        embed texts without blocking event loop, only texts missing in cache are embedded
+        :return: float32 embeddings of texts, one in each row
+        """
+        if self._embedding_cache is None:
+            return await self._compute_embeddings(texts)
+
+        embeddings = await self._embedding_cache.get_many(texts)
+        missing_texts = list({text for text, embedding in zip(texts, embeddings) if embedding is None})
+        if missing_texts:
+            computed_embeddings = await self._compute_embeddings(missing_texts)
+            await self._embedding_cache.set_many(missing_texts, computed_embeddings)
+            computed = dict(zip(missing_texts, computed_embeddings))
+            embeddings = [
+                computed[text] if embedding is None else embedding
+                for text, embedding in zip(texts, embeddings)
+            ]
+
+        return np.stack(embeddings)
 
     @classmethod
     async def get_client(
@@ -49,7 +210,7 @@ class VectorDB:
             await qdrant_client.create_collection(
                 collection_name=QDRANT_EVENTS_COLLECTION,
                 vectors_config=models.VectorParams(
-                    size=384, distance=models.Distance.COSINE, on_disk=True
+                    size=EMBEDDING_SIZE, distance=models.Distance.COSINE, on_disk=True
                 ),
             )
 
@@ -59,7 +220,18 @@ class VectorDB:
             await qdrant_client.create_collection(
                 collection_name=QDRANT_USERS_COLLECTION,
                 vectors_config=models.VectorParams(
-                    size=384, distance=models.Distance.COSINE, on_disk=True
+                    size=EMBEDDING_SIZE, distance=models.Distance.COSINE, on_disk=True
+                ),
+            )
+
+        # weighted sum is not normalized, so dot distance is used
+        is_users_dynamic_collections_exists = await qdrant_client.collection_exists(QDRANT_USERS_DYNAMIC_COLLECTION)
+        if not is_users_dynamic_collections_exists:
+            logger.info('no collection %s, creating', QDRANT_USERS_DYNAMIC_COLLECTION)
+            await qdrant_client.create_collection(
+                collection_name=QDRANT_USERS_DYNAMIC_COLLECTION,
+                vectors_config=models.VectorParams(
+                    size=EMBEDDING_SIZE, distance=models.Distance.DOT, on_disk=True
                 ),
             )
 
@@ -67,65 +239,193 @@ class VectorDB:
         return cls()
 
     async def add_event(self, event: EventData) -> bool:
-        # vectorize description if not empty
-        if event.description is None or len(event.description) <= 20:
-            # no reason to vectorize such event
-            return False
+        return (await self.add_events([event]))[0]
 
-        embeddings_generator = self._multilingual_model.embed(event.description)
-        event_embedding = list(embeddings_generator)[0]
+    async def add_events(self, events: list[EventData]) -> list[bool]:
+        """
+        embed descriptions of events in one batch and upsert them in one request
+        :return: for each event whether it was added, events with too short description are not added
+        """
+        # no reason to vectorize events with empty description
+        is_added = [event.description is not None and len(event.description) > 20 for event in events]
+        added_events = [event for event, added in zip(events, is_added) if added]
+        if not added_events:
+            return is_added
+
+        events_embeddings = await self.get_embeddings([event.description for event in added_events])
+        # indexed_dt is used for incremental sync of events catalogs
+        indexed_dt = datetime.now()
 
-        # then add to qdrant
         await self._qdrant_client.upsert(
             collection_name=QDRANT_EVENTS_COLLECTION,
             points=[
                 models.PointStruct(
                     id=event.id.hex,
-                    payload=event.model_dump(),
+                    payload={**event.model_dump(), 'indexed_dt': indexed_dt},
                     vector=event_embedding,
                 )
+                for event, event_embedding in zip(added_events, events_embeddings)
             ]
         )
 
-        return True
+        return is_added
+
+    async def delete_events(self, events_ids: list[UUID]):
+        if not events_ids:
+            return
+
+        await self._qdrant_client.delete(
+            collection_name=QDRANT_EVENTS_COLLECTION,
+            points_selector=models.PointIdsList(points=[event_id.hex for event_id in events_ids]),
+        )
 
     async def search_event_by_vector(
             self,
             embedding: np.ndarray | list[float],
             limit: int,
-    ) -> list[tuple[float, EventData]]:
+            compact: bool = False,
+    ) -> list[tuple[float, EventData | EventRef]]:
         """
         perform search by request, filtering by date of event
+        :param compact: return only event fields used by ranking instead of full event data
         """
+        if self._local_index is not None:
+            return (await self._search_local_index([(embedding, limit)], compact))[0]
+
         request_dt = datetime.now()
 
-        scored_points = await self._qdrant_client.search(
+        query_response = await self._qdrant_client.query_points(
             collection_name=QDRANT_EVENTS_COLLECTION,
-            query_vector=embedding,
+            query=np.asarray(embedding, dtype=np.float32).tolist(),
             with_vectors=False,
-            with_payload=True,
+            with_payload=EVENT_REF_PAYLOAD if compact else True,
             limit=limit,
-            query_filter=models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="datetime_from",
-                        range=models.DatetimeRange(
-                            gte=request_dt,
-                            lte=request_dt + RECOMMENDATION_PERIOD,
-                        ),
-                    ),
-                ]
-            ),
+            query_filter=get_upcoming_events_filter(request_dt),
         )
 
         return [
-            (scored_point.score, EventData.model_validate(scored_point.payload))
-            for scored_point in scored_points
+            (
+                scored_point.score,
+                get_event_ref(scored_point) if compact else EventData.model_validate(scored_point.payload),
+            )
+            for scored_point in query_response.points
+        ]
+
+    async def search_events_by_vectors(
+            self,
+            queries: list[tuple[np.ndarray | list[float], int]],
+            compact: bool = False,
+    ) -> list[list[tuple[float, EventData | EventRef]]]:
+        """
+        perform several searches by vector in one request, filtering by date of event
+        :param queries: embedding and limit of each search
+        :param compact: return only event fields used by ranking instead of full event data
+        :return: search results in order of queries
+        """
+        if not queries:
+            return []
+        if self._local_index is not None:
+            return await self._search_local_index(queries, compact)
+
+        query_filter = get_upcoming_events_filter(datetime.now())
+
+        query_responses = await self._qdrant_client.query_batch_points(
+            collection_name=QDRANT_EVENTS_COLLECTION,
+            requests=[
+                models.QueryRequest(
+                    query=np.asarray(embedding, dtype=np.float32).tolist(),
+                    filter=query_filter,
+                    with_vector=False,
+                    with_payload=EVENT_REF_PAYLOAD if compact else True,
+                    limit=limit,
+                )
+                for embedding, limit in queries
+            ],
+        )
+
+        return [
+            [
+                (
+                    scored_point.score,
+                    get_event_ref(scored_point) if compact else EventData.model_validate(scored_point.payload),
+                )
+                for scored_point in query_response.points
+            ]
+            for query_response in query_responses
+        ]
+
+    async def search_events_ids_by_vectors(
+            self,
+            queries: list[tuple[np.ndarray | list[float], int]],
+    ) -> list[list[tuple[float, UUID]]]:
+        """
+        same as search_events_by_vectors, but without payload at all
+        :return: scores and ids of found events in order of queries
+        """
+        if not queries:
+            return []
+        if self._local_index is not None:
+            return [
+                [(score, event_id) for score, event_id, _ in result]
+                for result in self._get_local_index_results(queries)
+            ]
+
+        query_filter = get_upcoming_events_filter(datetime.now())
+
+        query_responses = await self._qdrant_client.query_batch_points(
+            collection_name=QDRANT_EVENTS_COLLECTION,
+            requests=[
+                models.QueryRequest(
+                    query=np.asarray(embedding, dtype=np.float32).tolist(),
+                    filter=query_filter,
+                    with_vector=False,
+                    with_payload=False,
+                    limit=limit,
+                )
+                for embedding, limit in queries
+            ],
+        )
+
+        return [
+            [(scored_point.score, UUID(str(scored_point.id))) for scored_point in query_response.points]
+            for query_response in query_responses
+        ]
+
+    def _get_local_index_results(
+            self,
+            queries: list[tuple[np.ndarray | list[float], int]],
+    ) -> list[list[tuple[float, UUID, float]]]:
+        request_dt = datetime.now()
+        return self._local_index.search(
+            queries,
+            request_dt.timestamp(),
+            (request_dt + RECOMMENDATION_PERIOD).timestamp(),
+        )
+
+    async def _search_local_index(
+            self,
+            queries: list[tuple[np.ndarray | list[float], int]],
+            compact: bool,
+    ) -> list[list[tuple[float, EventData | EventRef]]]:
+        results = self._get_local_index_results(queries)
+        if compact:
+            return [
+                [
+                    (score, EventRef.model_construct(id=event_id, datetime_from=datetime.fromtimestamp(event_ts)))
+                    for score, event_id, event_ts in result
+                ]
+                for result in results
+            ]
+
+        # full payloads of found events are fetched with one request
+        events = await self.get_events_map({event_id for result in results for _, event_id, _ in result})
+        return [
+            [(score, events[event_id]) for score, event_id, _ in result if event_id in events]
+            for result in results
         ]
 
     async def search_event_by_request(self, request: str, limit: int) -> list[tuple[float, EventData]]:
-        embeddings_generator = self._multilingual_model.embed(request)
-        embedding = list(embeddings_generator)[0]
+        embedding = (await self.get_embeddings([request]))[0]
 
         return await self.search_event_by_vector(embedding, limit)
 
@@ -139,33 +439,30 @@ class VectorDB:
             return []
         request_dt = datetime.now()
 
-        scored_points = await self._qdrant_client.recommend(
+        query_response = await self._qdrant_client.query_points(
             collection_name=QDRANT_EVENTS_COLLECTION,
-            positive=positive,
-            negative=negative,
-            strategy=models.RecommendStrategy.BEST_SCORE,
+            query=models.RecommendQuery(
+                recommend=models.RecommendInput(
+                    positive=positive,
+                    negative=negative,
+                    strategy=models.RecommendStrategy.BEST_SCORE,
+                ),
+            ),
             with_vectors=False,
             with_payload=True,
             limit=limit,
-            query_filter=models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="datetime_from",
-                        range=models.DatetimeRange(
-                            gte=request_dt,
-                            lte=request_dt + RECOMMENDATION_PERIOD,
-                        ),
-                    ),
-                ]
-            ),
+            query_filter=get_upcoming_events_filter(request_dt),
         )
 
         return [
             (scored_point.score, EventData.model_validate(scored_point.payload))
-            for scored_point in scored_points
+            for scored_point in query_response.points
         ]
 
-    async def get_events_vectors_by_ids(self, events_ids: set[UUID]) -> list[np.ndarray]:
+    async def get_events_vectors_map(self, events_ids: set[UUID]) -> dict[UUID, np.ndarray]:
+        if not events_ids:
+            return {}
+
         records = await self._qdrant_client.retrieve(
             collection_name=QDRANT_EVENTS_COLLECTION,
             ids=[event_id.hex for event_id in events_ids],
@@ -173,19 +470,221 @@ class VectorDB:
             with_vectors=True,
         )
 
-        vectors: list[np.ndarray] = [
-            np.array(record.vector, dtype=np.float32)
+        return {
+            UUID(str(record.id)): np.array(record.vector, dtype=np.float32)
             for record in records
-        ]
-        return vectors
+        }
+
+    async def get_events_map(self, events_ids: set[UUID]) -> dict[UUID, EventData]:
+        if not events_ids:
+            return {}
+
+        records = await self._qdrant_client.retrieve(
+            collection_name=QDRANT_EVENTS_COLLECTION,
+            ids=[event_id.hex for event_id in events_ids],
+            with_payload=True,
+            with_vectors=False,
+        )
+
+        return {
+            UUID(str(record.id)): EventData.model_validate(record.payload)
+            for record in records
+        }
+
+    async def get_upcoming_events_refs(self) -> list[EventRef]:
+        """
+        scroll ids and dates of all events which can be recommended now
+        """
+        events_refs: list[EventRef] = []
+
+        scroll_filter = get_upcoming_events_filter(datetime.now())
+        offset = None
+        while True:
+            records, offset = await self._qdrant_client.scroll(
+                collection_name=QDRANT_EVENTS_COLLECTION,
+                scroll_filter=scroll_filter,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=EVENT_REF_PAYLOAD,
+                with_vectors=False,
+            )
+            events_refs.extend(get_event_ref(record) for record in records)
+
+            if offset is None:
+                break
+
+        return events_refs
+
+    async def get_upcoming_events_ids(self) -> set[UUID]:
+        """
+        scroll ids of all events which can be recommended now, without payload and vectors
+        """
+        events_ids: set[UUID] = set()
+
+        scroll_filter = get_upcoming_events_filter(datetime.now())
+        offset = None
+        while True:
+            records, offset = await self._qdrant_client.scroll(
+                collection_name=QDRANT_EVENTS_COLLECTION,
+                scroll_filter=scroll_filter,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            events_ids.update(UUID(str(record.id)) for record in records)
+
+            if offset is None:
+                break
+
+        return events_ids
+
+    async def get_upcoming_events_matrix(self) -> EventsMatrix:
+        """
+        scroll embeddings of all events which can be recommended now
+        """
+        return await self.scroll_events_matrix(get_upcoming_events_filter(datetime.now()))
+
+    async def scroll_events_matrix(self, scroll_filter: models.Filter) -> EventsMatrix:
+        """
+        scroll embeddings of all events matching filter
+        """
+        ids: list[UUID] = []
+        datetimes_ts: list[float] = []
+        vectors: list[list[float]] = []
+
+        offset = None
+        while True:
+            records, offset = await self._qdrant_client.scroll(
+                collection_name=QDRANT_EVENTS_COLLECTION,
+                scroll_filter=scroll_filter,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=['datetime_from'],
+                with_vectors=True,
+            )
+
+            for record in records:
+                ids.append(UUID(str(record.id)))
+                datetimes_ts.append(datetime.fromisoformat(record.payload['datetime_from']).timestamp())
+                vectors.append(record.vector)
+
+            if offset is None:
+                break
+
+        return EventsMatrix(
+            ids=ids,
+            datetimes_ts=np.array(datetimes_ts, dtype=np.float64),
+            vectors=np.array(vectors, dtype=np.float32).reshape(len(ids), EMBEDDING_SIZE),
+        )
+
+    async def scroll_events(self, scroll_filter: models.Filter) -> list[EventData]:
+        """
+        scroll full data of all events matching filter
+        """
+        events: list[EventData] = []
+
+        offset = None
+        while True:
+            records, offset = await self._qdrant_client.scroll(
+                collection_name=QDRANT_EVENTS_COLLECTION,
+                scroll_filter=scroll_filter,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            events.extend(EventData.model_validate(record.payload) for record in records)
+
+            if offset is None:
+                break
+
+        return events
+
+    async def sync_local_index(self, reconcile: bool = False):
+        """
+        load local index of upcoming events on first call, then fetch only updated events.
+        Searches are served by local index since it was synced first time
+        :param reconcile: remove events deleted from vector db, incremental sync does not see deletions
+        """
+        sync_dt = datetime.now()
+        if self._local_index_synced_dt is None:
+            scroll_filter = get_upcoming_events_filter(sync_dt)
+        else:
+            scroll_filter = get_updated_events_filter(sync_dt, self._local_index_synced_dt)
+
+        # ids are scrolled first, events indexed after it are fetched by incremental scroll
+        stored_ids = None
+        if reconcile and self._local_index is not None:
+            stored_ids = await self.get_upcoming_events_ids()
+        events_matrix = await self.scroll_events_matrix(scroll_filter)
+
+        local_index = VectorDB._local_index or LocalEventsIndex(EMBEDDING_SIZE)
+        if stored_ids is not None:
+            stored_ids.update(events_matrix.ids)
+            deleted_ids = [event_id for event_id in local_index.ids if event_id not in stored_ids]
+            local_index.remove(deleted_ids)
+            logger.debug('Local index reconciled: %s deleted events removed', len(deleted_ids))
+        local_index.upsert(*events_matrix)
+        local_index.remove_past(sync_dt.timestamp())
+
+        VectorDB._local_index = local_index
+        VectorDB._local_index_synced_dt = sync_dt
+        logger.debug('Local index synced: %s fetched, %s in index', len(events_matrix.ids), len(local_index))
+
+    def load_local_index_snapshot(self, path: Path):
+        """
+        start local index from memory mapped snapshot, next sync fetches only events updated after snapshot
+        """
+        snapshot = load_events_snapshot(path)
+        local_index = LocalEventsIndex.from_arrays(snapshot.ids, snapshot.datetimes_ts, snapshot.vectors)
+        local_index.remove_past(datetime.now().timestamp())
+
+        VectorDB._local_index = local_index
+        VectorDB._local_index_synced_dt = snapshot.exported_dt
+        logger.info('Local index loaded from snapshot of %s: %s events', snapshot.exported_dt, len(local_index))
+
+    async def export_events_snapshot(self, path: Path) -> int:
+        """
+        save embeddings of upcoming events to snapshot
+        :return: amount of exported events
+        """
+        exported_dt = datetime.now()
+        events_matrix = await self.scroll_events_matrix(get_upcoming_events_filter(exported_dt))
+        if not events_matrix.ids:
+            # empty arrays can not be memory mapped
+            return 0
+
+        save_events_snapshot(path, EventsSnapshot(
+            ids=events_matrix.ids,
+            datetimes_ts=events_matrix.datetimes_ts,
+            vectors=normalize(events_matrix.vectors),
+            exported_dt=exported_dt,
+        ))
+        return len(events_matrix.ids)
+
+    async def run_local_index_sync(self, sync_interval: float, reconcile_interval: float):
+        """
+        sync local index every sync_interval seconds and reconcile it every reconcile_interval seconds,
+        index is expected to be synced once before
+        """
+        reconciled = time.monotonic()
+        while True:
+            await asyncio.sleep(sync_interval)
+            try:
+                reconcile = time.monotonic() - reconciled >= reconcile_interval
+                await self.sync_local_index(reconcile)
+                if reconcile:
+                    reconciled = time.monotonic()
+            except Exception as err:
+                logger.exception('Exception on local index sync: %s', err)
 
     async def add_user_description(self, user_id: int, description: str) -> bool:
         # vectorize description if not empty
         if description is None or len(description) <= 10:
             return False
 
-        embeddings_generator = self._multilingual_model.embed(description)
-        description_embedding = list(embeddings_generator)[0]
+        description_embedding = (await self.get_embeddings([description]))[0]
 
         # then add to qdrant
         await self._qdrant_client.upsert(
@@ -200,7 +699,10 @@ class VectorDB:
 
         return True
 
-    async def get_users_vectors_by_ids(self, users_ids: set[int]) -> list[np.ndarray]:
+    async def get_users_vectors_map(self, users_ids: set[int]) -> dict[int, np.ndarray]:
+        if not users_ids:
+            return {}
+
         records = await self._qdrant_client.retrieve(
             collection_name=QDRANT_USERS_COLLECTION,
             ids=list(users_ids),
@@ -208,8 +710,98 @@ class VectorDB:
             with_vectors=True,
         )
 
-        vectors: list[np.ndarray] = [
-            np.array(record.vector, dtype=np.float32)
+        return {
+            int(record.id): np.array(record.vector, dtype=np.float32)
             for record in records
-        ]
-        return vectors
+        }
+
+    async def get_dynamic_embeddings_map(self, users_ids: set[int]) -> dict[int, DynamicEmbedding]:
+        if not users_ids:
+            return {}
+
+        records = await self._qdrant_client.retrieve(
+            collection_name=QDRANT_USERS_DYNAMIC_COLLECTION,
+            ids=list(users_ids),
+            with_payload=True,
+            with_vectors=True,
+        )
+
+        return {
+            int(record.id): DynamicEmbedding(
+                weighted_sum=np.array(record.vector, dtype=np.float32),
+                count=record.payload['count'],
+                updated_ts=record.payload['updated_ts'],
+                events_ids=[UUID(event_id) for event_id in record.payload['events_ids']],
+                version=record.payload.get('version', 0),
+            )
+            for record in records
+        }
+
+    async def set_dynamic_embedding(self, user_id: int, dynamic_embedding: DynamicEmbedding) -> bool:
+        """
+        save embedding, if stored one is not changed since embedding was read.
+        Stored embedding is replaced only when its version is version of embedding,
+        saved embedding has next version and token of this save, which is checked after save
+        :return: whether embedding is saved
+        """
+        if dynamic_embedding.version is None:
+            # embedding which was not stored is saved only if there is still no stored one
+            update_filter = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key='count'))])
+            version = 1
+        else:
+            version_conditions = [
+                models.FieldCondition(key='version', match=models.MatchValue(value=dynamic_embedding.version)),
+            ]
+            if dynamic_embedding.version == 0:
+                # embeddings stored before versioning have no version
+                version_conditions.append(models.IsEmptyCondition(is_empty=models.PayloadField(key='version')))
+            update_filter = models.Filter(should=version_conditions)
+            version = dynamic_embedding.version + 1
+
+        save_token = uuid4().hex
+        await self._qdrant_client.upsert(
+            collection_name=QDRANT_USERS_DYNAMIC_COLLECTION,
+            points=[
+                models.PointStruct(
+                    id=user_id,
+                    payload={
+                        'count': dynamic_embedding.count,
+                        'updated_ts': dynamic_embedding.updated_ts,
+                        'events_ids': [event_id.hex for event_id in dynamic_embedding.events_ids],
+                        'version': version,
+                        'save_token': save_token,
+                    },
+                    vector=np.asarray(dynamic_embedding.weighted_sum, dtype=np.float32).tolist(),
+                )
+            ],
+            update_filter=update_filter,
+        )
+
+        records = await self._qdrant_client.retrieve(
+            collection_name=QDRANT_USERS_DYNAMIC_COLLECTION,
+            ids=[user_id],
+            with_payload=['save_token'],
+        )
+        return bool(records) and records[0].payload.get('save_token') == save_token
+
+    async def get_users_ids(self) -> set[int]:
+        """
+        scroll ids of all users with description embedding
+        """
+        users_ids: set[int] = set()
+
+        offset = None
+        while True:
+            records, offset = await self._qdrant_client.scroll(
+                collection_name=QDRANT_USERS_COLLECTION,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            users_ids.update(int(record.id) for record in records)
+
+            if offset is None:
+                break
+
+        return users_ids
@@ -61,6 +61,14 @@ class EventData(BasicEvent):
     service_data: dict  # custom service data
 
 
+class EventRef(BaseModel):
+    """
+    event fields used by ranking, without full event payload
+    """
+    id: UUID
+    datetime_from: datetime
+
+
 class ResonanceEventInfo(BaseModel):
     subject: int
     creator_id: int
@@ -83,6 +91,11 @@ class UserInteraction(BaseModel):
     interaction_dt: datetime
 
 
+# users interactions are published to topic exchange with routing key interactions.<interaction kind>
+INTERACTIONS_EXCHANGE = 'interactions'
+INTERACTIONS_ROUTING_KEY = 'interactions.*'
+
+
 class RecSubsystem(str, Enum):
     BASIC = 'BASIC'
     DYNAMIC = 'DYNAMIC'
@@ -91,7 +104,7 @@ class RecSubsystem(str, Enum):
 
 class RecItem(BaseModel):
     subsystem: RecSubsystem
-    event: EventData
+    event: EventData | EventRef
     score: float
 
 
@@ -1,8 +1,12 @@
+import hashlib
+import json
 from datetime import datetime
 from uuid import UUID
 
 from pydantic import BaseModel
 
+from common.models import EventData
+
 
 def custom_encoder(obj):
     if isinstance(obj, UUID):
@@ -10,3 +14,15 @@ def custom_encoder(obj):
     elif isinstance(obj, datetime):
         return obj.isoformat()
     raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def get_event_fingerprint(event: EventData) -> str:
+    """
+    hash of event content, event id is generated on each parsing, so it is not considered.
+    Description is stripped, as event handler saves it
+    """
+    content = event.model_dump(mode='json', exclude={'id'})
+    if content['description'] is not None:
+        content['description'] = content['description'].strip()
+
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
@@ -0,0 +1,143 @@
+from uuid import UUID
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from common.clients.local_index import LocalEventsIndex
+from common.clients.local_index import normalize
+
+DIM = 16
+
+
+def brute_force_search(
+        ids: list[UUID],
+        datetimes_ts: np.ndarray,
+        vectors: np.ndarray,
+        embedding: np.ndarray,
+        limit: int,
+        min_ts: float,
+        max_ts: float,
+) -> list[UUID]:
+    scores = normalize(vectors) @ normalize(embedding)
+    found = [
+        (score, event_id)
+        for score, event_id, datetime_ts in zip(scores, ids, datetimes_ts)
+        if min_ts <= datetime_ts <= max_ts
+    ]
+    found.sort(key=lambda item: -item[0])
+    return [event_id for _, event_id in found[:limit]]
+
+
+@pytest.fixture
+def events():
+    rng = np.random.default_rng(0)
+    amount = 3000  # over initial capacity, so index grows
+    ids = [uuid4() for _ in range(amount)]
+    datetimes_ts = rng.uniform(0, 1000, size=amount)
+    vectors = rng.normal(size=(amount, DIM)).astype(np.float32)
+    return ids, datetimes_ts, vectors
+
+
+def assert_same_as_brute_force(local_index: LocalEventsIndex, ids, datetimes_ts, vectors):
+    rng = np.random.default_rng(1)
+    queries = [(rng.normal(size=DIM).astype(np.float32), limit) for limit in (1, 10, 100)]
+    min_ts, max_ts = 200, 700
+
+    results = local_index.search(queries, min_ts, max_ts)
+
+    for (embedding, limit), result in zip(queries, results):
+        expected = brute_force_search(ids, datetimes_ts, vectors, embedding, limit, min_ts, max_ts)
+        assert [event_id for _, event_id, _ in result] == expected
+        for score, event_id, datetime_ts in result:
+            event_index = ids.index(event_id)
+            assert datetime_ts == datetimes_ts[event_index]
+            assert score == pytest.approx(float(normalize(vectors[event_index]) @ normalize(embedding)), abs=1e-5)
+
+
+def test_search_is_same_as_brute_force(events):
+    ids, datetimes_ts, vectors = events
+    local_index = LocalEventsIndex(DIM)
+    local_index.upsert(ids[:1000], datetimes_ts[:1000], vectors[:1000])
+    local_index.upsert(ids[1000:], datetimes_ts[1000:], vectors[1000:])
+
+    assert len(local_index) == len(ids)
+    assert_same_as_brute_force(local_index, ids, datetimes_ts, vectors)
+
+
+def test_search_from_arrays_is_same_as_brute_force(events):
+    ids, datetimes_ts, vectors = events
+    local_index = LocalEventsIndex.from_arrays(ids, datetimes_ts, normalize(vectors))
+
+    assert_same_as_brute_force(local_index, ids, datetimes_ts, vectors)
+
+
+def test_search_after_update_and_remove_is_same_as_brute_force(events):
+    ids, datetimes_ts, vectors = events
+    local_index = LocalEventsIndex.from_arrays(ids, datetimes_ts, normalize(vectors))
+    rng = np.random.default_rng(2)
+
+    # rows of removed events are reused by new ones
+    removed = set(rng.choice(len(ids), size=500, replace=False).tolist())
+    local_index.remove([ids[event_index] for event_index in removed])
+    new_ids = [uuid4() for _ in range(700)]
+    new_datetimes_ts = rng.uniform(0, 1000, size=len(new_ids))
+    new_vectors = rng.normal(size=(len(new_ids), DIM)).astype(np.float32)
+    local_index.upsert(new_ids, new_datetimes_ts, new_vectors)
+
+    updated = [event_index for event_index in range(100) if event_index not in removed]
+    updated_vectors = rng.normal(size=(len(updated), DIM)).astype(np.float32)
+    local_index.upsert([ids[event_index] for event_index in updated], datetimes_ts[updated], updated_vectors)
+
+    vectors = vectors.copy()
+    vectors[updated] = updated_vectors
+    kept = [event_index for event_index in range(len(ids)) if event_index not in removed]
+    expected_ids = [ids[event_index] for event_index in kept] + new_ids
+    expected_datetimes_ts = np.concatenate((datetimes_ts[kept], new_datetimes_ts))
+    expected_vectors = np.concatenate((vectors[kept], new_vectors))
+
+    assert len(local_index) == len(expected_ids)
+    assert set(local_index.ids) == set(expected_ids)
+    assert_same_as_brute_force(local_index, expected_ids, expected_datetimes_ts, expected_vectors)
+
+
+def test_remove_past(events):
+    ids, datetimes_ts, vectors = events
+    local_index = LocalEventsIndex(DIM)
+    local_index.upsert(ids, datetimes_ts, vectors)
+
+    local_index.remove_past(500)
+
+    kept = [event_index for event_index in range(len(ids)) if datetimes_ts[event_index] >= 500]
+    assert set(local_index.ids) == {ids[event_index] for event_index in kept}
+    assert ids[int(np.argmin(datetimes_ts))] not in local_index
+    assert_same_as_brute_force(
+        local_index,
+        [ids[event_index] for event_index in kept],
+        datetimes_ts[kept],
+        vectors[kept],
+    )
+
+
+def test_limit_over_amount_of_events():
+    local_index = LocalEventsIndex(DIM)
+    ids = [uuid4(), uuid4()]
+    local_index.upsert(ids, np.array([1.0, 2.0]), np.eye(2, DIM, dtype=np.float32))
+
+    [result] = local_index.search([(np.eye(1, DIM, dtype=np.float32)[0], 10)], 0, 10)
+
+    assert [event_id for _, event_id, _ in result] == ids
+    assert local_index.search([(np.ones(DIM), 10)], 5, 10) == [[]]
+
+
+def test_hnsw_search_finds_nearest_events(events):
+    pytest.importorskip('hnswlib')
+    ids, datetimes_ts, vectors = events
+    local_index = LocalEventsIndex(DIM, hnsw_threshold=1000)
+    local_index.upsert(ids, datetimes_ts, vectors)
+    local_index.remove(ids[:100])
+
+    queries = [(vectors[event_index], 1) for event_index in range(100, 200)]
+    results = local_index.search(queries, 0, 1000)
+
+    assert [result[0][1] for result in results] == ids[100:200]
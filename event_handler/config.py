@@ -1,4 +1,5 @@
 from os import environ
+from pathlib import Path
 
 # rabbit mq
 RABBITMQ_HOST = environ.get('RABBITMQ_HOST', 'localhost')
@@ -16,3 +17,15 @@ POSTGRES_DB = environ.get('POSTGRES_DB')
 # qdrant
 QDRANT_HOST = environ.get('QDRANT_HOST', 'localhost')
 QDRANT_PORT = environ.get('QDRANT_PORT', '6333')
+
+# embedding of events descriptions in pool of processes
+EMBEDDING_WORKERS = int(environ.get('EMBEDDING_WORKERS', '2'))
+EMBEDDING_MAX_PENDING = int(environ.get('EMBEDDING_MAX_PENDING', '64'))  # submitted batches, further ones wait
+
+# events are handled by micro-batches
+EVENTS_BATCH_SIZE = int(environ.get('EVENTS_BATCH_SIZE', '64'))  # events saved at once
+EVENTS_BATCH_TIMEOUT = float(environ.get('EVENTS_BATCH_TIMEOUT', '0.2'))  # max seconds in batch
+
+# cache of descriptions embeddings, recently used ones are kept in memory
+EMBEDDING_CACHE_PATH = Path(environ.get('EMBEDDING_CACHE_PATH', '/var/capybanse/embeddings/events.sqlite3'))
+EMBEDDING_CACHE_MEMORY_SIZE = int(environ.get('EMBEDDING_CACHE_MEMORY_SIZE', '10000'))
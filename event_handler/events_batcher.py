@@ -0,0 +1,185 @@
+"""
+Events are handled by micro-batches: descriptions are embedded in one call,
+events are saved to qdrant in one request and to postgres in one round trip.
+Events are saved when they are new or their content changed since saved version,
+changed event replaces saved one and keeps its id, so it is embedded and indexed again.
+Postgres write is commit point of batch: events are indexed before it,
+so batch which fails after indexing is indexed again on redelivery.
+Messages are acknowledged only after batch is saved,
+messages of events which can not be saved are moved to dead letter queue
+"""
+import asyncio
+import time
+
+import aio_pika
+from pydantic import ValidationError
+
+from common.clients.posgres_client import EventInsertOutcome
+from common.clients.posgres_client import PostgresDB
+from common.clients.vectordb_client import VectorDB
+from common.models import EventData
+from common.utils import get_logger
+from common.utils.serde_helpers import get_event_fingerprint
+
+logger = get_logger('events_batcher')
+
+
+class EventsBatcher:
+    def __init__(
+            self,
+            postgres_client: PostgresDB,
+            vectordb_client: VectorDB,
+            dead_letter_exchange: aio_pika.abc.AbstractExchange,
+            dead_letter_routing_key: str,
+            batch_size: int,
+            batch_timeout: float,
+    ):
+        self.postgres_client = postgres_client
+        self.vectordb_client = vectordb_client
+        self.dead_letter_exchange = dead_letter_exchange
+        self.dead_letter_routing_key = dead_letter_routing_key
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+
+        self._messages: list[aio_pika.abc.AbstractIncomingMessage] = []
+        self._events: list[EventData] = []
+        self._first_buffered_at: float | None = None
+        self._flush_lock = asyncio.Lock()
+
+    async def add(self, message: aio_pika.abc.AbstractIncomingMessage):
+        try:
+            event = EventData.model_validate_json(message.body)
+        except ValidationError as err:
+            logger.warning('Invalid event message rejected: %s', err)
+            await message.reject(requeue=False)
+            return
+
+        if event.description is not None:
+            event.description = event.description.strip()
+
+        if self._first_buffered_at is None:
+            self._first_buffered_at = time.monotonic()
+        self._messages.append(message)
+        self._events.append(event)
+
+        if len(self._events) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._messages:
+                return
+
+            messages, events = self._messages, self._events
+            self._messages, self._events = [], []
+            self._first_buffered_at = None
+
+            try:
+                saved_events = await self.postgres_client.get_saved_events([event.service_id for event in events])
+                # new and changed events are saved, first one of each service id
+                save_indices: dict[str, int] = {}
+                for event_index, event in enumerate(events):
+                    if event.service_id in save_indices:
+                        continue
+                    if event.service_id not in saved_events:
+                        save_indices[event.service_id] = event_index
+                        continue
+
+                    saved_event_id, saved_fingerprint = saved_events[event.service_id]
+                    if get_event_fingerprint(event) != saved_fingerprint:
+                        # new version replaces saved event, so it keeps id of saved event
+                        event.id = saved_event_id
+                        save_indices[event.service_id] = event_index
+
+                events_to_save = [events[event_index] for event_index in save_indices.values()]
+                is_indexed = await self.vectordb_client.add_events(events_to_save)
+                # changed event with too short description is not searchable anymore
+                await self.vectordb_client.delete_events([
+                    event.id
+                    for event, indexed in zip(events_to_save, is_indexed)
+                    if not indexed and event.service_id in saved_events
+                ])
+                save_outcomes = await self.postgres_client.add_events_bulk(events_to_save)
+            except Exception as err:
+                logger.exception('Batch of %s events is not saved, requeued: %s', len(events), err)
+                for message in messages:
+                    await message.nack(requeue=True)
+                return
+
+            # unchanged events and repeated ones are duplicates
+            outcomes = [EventInsertOutcome.DUPLICATE] * len(events)
+            for event_index, outcome in zip(save_indices.values(), save_outcomes):
+                outcomes[event_index] = outcome
+            await self.delete_not_inserted([
+                (event, outcome)
+                for event, outcome in zip(events_to_save, save_outcomes)
+                if event.service_id not in saved_events
+            ])
+
+            # messages of several queues are in batch, so each one is acknowledged separately
+            for message, outcome in zip(messages, outcomes):
+                if outcome == EventInsertOutcome.FAILED:
+                    await self.dead_letter(message)
+                else:
+                    await message.ack()
+            logger.debug(
+                'Batch of %s events handled: %s inserted, %s updated, %s duplicate, %s failed',
+                len(events),
+                outcomes.count(EventInsertOutcome.INSERTED),
+                outcomes.count(EventInsertOutcome.UPDATED),
+                outcomes.count(EventInsertOutcome.DUPLICATE),
+                outcomes.count(EventInsertOutcome.FAILED),
+            )
+            if (embedding_cache_stats := self.vectordb_client.get_embedding_cache_stats()) is not None:
+                logger.debug('Embedding cache stats: %s', embedding_cache_stats)
+
+    async def delete_not_inserted(self, new_events_outcomes: list[tuple[EventData, EventInsertOutcome]]):
+        """
+        remove indexed new events which were not inserted to postgres,
+        they were inserted concurrently with other id or they are invalid
+        """
+        not_inserted_ids = [
+            event.id
+            for event, outcome in new_events_outcomes
+            if outcome != EventInsertOutcome.INSERTED
+        ]
+        try:
+            await self.vectordb_client.delete_events(not_inserted_ids)
+        except Exception as err:
+            logger.exception('Events %s are indexed, but not saved to postgres: %s', not_inserted_ids, err)
+
+    async def dead_letter(self, message: aio_pika.abc.AbstractIncomingMessage):
+        """
+        move message of event which can not be saved to dead letter queue,
+        it is requeued if it can not be moved
+        """
+        try:
+            await self.dead_letter_exchange.publish(
+                aio_pika.Message(
+                    body=message.body,
+                    headers={'x-original-routing-key': message.routing_key},
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                ),
+                routing_key=self.dead_letter_routing_key,
+            )
+        except Exception as err:
+            logger.exception('Message %s is not moved to dead letter queue, requeued: %s', message.message_id, err)
+            await message.nack(requeue=True)
+            return
+
+        await message.ack()
+
+    async def run_periodic_flush(self):
+        """
+        flush buffered events which wait longer than batch_timeout
+        """
+        while True:
+            await asyncio.sleep(self.batch_timeout / 2)
+            if self._first_buffered_at is None:
+                continue
+
+            if time.monotonic() - self._first_buffered_at >= self.batch_timeout:
+                try:
+                    await self.flush()
+                except Exception as err:
+                    logger.exception('Exception on events flush: %s', err)
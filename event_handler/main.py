@@ -7,8 +7,13 @@ import aio_pika
 
 from common.clients.posgres_client import PostgresDB
 from common.clients.vectordb_client import VectorDB
-from common.models import EventData
 from common.utils import get_logger
+from config import EMBEDDING_CACHE_MEMORY_SIZE
+from config import EMBEDDING_CACHE_PATH
+from config import EMBEDDING_MAX_PENDING
+from config import EMBEDDING_WORKERS
+from config import EVENTS_BATCH_SIZE
+from config import EVENTS_BATCH_TIMEOUT
 from config import POSTGRES_DB
 from config import POSTGRES_HOST
 from config import POSTGRES_PASSWORD
@@ -19,6 +24,7 @@ from config import QDRANT_PORT
 from config import RABBITMQ_HOST
 from config import RABBITMQ_PASSWORD
 from config import RABBITMQ_USER
+from events_batcher import EventsBatcher
 
 logger = get_logger('main')
 
@@ -28,9 +34,16 @@ EVENTS_QUEUES = [
     'events.resonanse',
     'events.networkly',
 ]
+# events which can not be saved, kept for inspection
+EVENTS_DEAD_LETTER_QUEUE = 'events.dead_letter'
 
 
-async def handle_event_message(message: aio_pika.abc.AbstractIncomingMessage) -> None:
+async def main() -> None:
+    # init qdrant before message handling: issues with concurrent collection extistance check
+    vectordb_client = await VectorDB.get_client(
+        qdrant_host=QDRANT_HOST,
+        qdrant_port=int(QDRANT_PORT),
+    )
     postgres_client = await PostgresDB.get_client(
         pg_user=POSTGRES_USER,
         pg_password=POSTGRES_PASSWORD,
@@ -38,29 +51,11 @@ async def handle_event_message(message: aio_pika.abc.AbstractIncomingMessage) ->
         pg_port=POSTGRES_PORT,
         pg_db=POSTGRES_DB,
     )
-
-    event = EventData.model_validate_json(message.body)
-    event.description = event.description.strip()
-
-    saved_to_pg = await postgres_client.add_event(event)
-    if saved_to_pg:
-        # then save to vector db too
-        vectordb_client = await VectorDB.get_client(
-            qdrant_host=QDRANT_HOST,
-            qdrant_port=int(QDRANT_PORT),
-        )
-        await vectordb_client.add_event(event)
-
-    logger.debug('message %s for event %s handled', message.message_id, event.service_id)
-    await message.ack()
-
-
-async def main() -> None:
-    # init qdrant before message handling: issues with concurrent collection extistance check
-    await VectorDB.get_client(
-        qdrant_host=QDRANT_HOST,
-        qdrant_port=int(QDRANT_PORT),
-    )
+    # events are parsed again on each parsing cycle, their descriptions are not embedded again
+    VectorDB.start_embedding_cache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_SIZE)
+    # each event is embedded, so workers load model before consuming instead of on first message
+    embedding_executor = VectorDB.start_embedding_executor(EMBEDDING_WORKERS, EMBEDDING_MAX_PENDING)
+    await embedding_executor.warm_up()
 
     connection = await aio_pika.connect_robust(
         host=RABBITMQ_HOST,
@@ -69,17 +64,28 @@ async def main() -> None:
     )
 
     channel = await connection.channel()
-    # it seems that big prefetch count depletes db connection pool
-    await channel.set_qos(prefetch_count=10)
+    await channel.declare_queue(EVENTS_DEAD_LETTER_QUEUE, durable=True)
+    events_batcher = EventsBatcher(
+        postgres_client,
+        vectordb_client,
+        channel.default_exchange,
+        EVENTS_DEAD_LETTER_QUEUE,
+        EVENTS_BATCH_SIZE,
+        EVENTS_BATCH_TIMEOUT,
+    )
+
+    # batch is saved with one db connection, so prefetch is enough to fill couple of batches
+    await channel.set_qos(prefetch_count=EVENTS_BATCH_SIZE * 2)
     for mq_queue_name in EVENTS_QUEUES:
         queue = await channel.declare_queue(mq_queue_name, durable=True)
-        await queue.consume(handle_event_message)
+        await queue.consume(events_batcher.add)
 
     try:
         # Wait until terminate
-        await asyncio.Future()
+        await events_batcher.run_periodic_flush()
     finally:
         await connection.close()
+        embedding_executor.shutdown()
 
 
 if __name__ == "__main__":
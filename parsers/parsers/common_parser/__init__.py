@@ -9,6 +9,8 @@ import aio_pika
 
 from common.models import EventData
 from common.utils import get_logger
+from common.utils.serde_helpers import get_event_fingerprint
+from parsers import storage
 from parsers.config import RABBITMQ_HOST
 
 logger = get_logger('common_parser')
@@ -56,8 +58,25 @@ class EventsParser(ABC):
         queue = await channel.declare_queue(mq_queue_name, durable=True)
         await queue.bind(exchange, mq_queue_name)
 
+        # events are published only when they are new or changed since version saved by event handler
+        new_count = changed_count = unchanged_count = 0
+
         while events := await self._get_next_events():
+            events = list(events)
+            fingerprints = {event_data.service_id: get_event_fingerprint(event_data) for event_data in events}
+            known_fingerprints = await asyncio.to_thread(storage.get_fingerprints, list(fingerprints))
+
             for event_data in events:
+                fingerprint = fingerprints[event_data.service_id]
+                known_fingerprint = known_fingerprints.get(event_data.service_id)
+                if known_fingerprint == fingerprint:
+                    unchanged_count += 1
+                    continue
+                if event_data.service_id not in known_fingerprints:
+                    new_count += 1
+                else:
+                    changed_count += 1
+
                 event_data_json = event_data.json()
                 logger.debug('Sending to queue %s: %s', self.parser_name(), event_data_json)
                 await exchange.publish(
@@ -67,7 +86,13 @@ class EventsParser(ABC):
                     ),
                     routing_key=mq_queue_name,
                 )
+                # same event may repeat on page
+                known_fingerprints[event_data.service_id] = fingerprint
 
+        logger.info(
+            'Parsing cycle of %s: %s new and %s changed events published, %s unchanged skipped',
+            self.parser_name(), new_count, changed_count, unchanged_count,
+        )
         await connection.close()
 
     async def run(self):
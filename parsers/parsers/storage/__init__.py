@@ -57,5 +57,28 @@ def get_state(key: str) -> str | None:
                 return value[0]
 
 
+def get_fingerprints(service_ids: list[str]) -> dict[str, str | None]:
+    """
+    fingerprints are saved with events by event handler,
+    so event is published again until its version is saved
+    :return: fingerprint of saved event by service id, unknown events are absent
+    """
+    if not service_ids:
+        return {}
+
+    with psycopg.connect(DB_URL) as conn:
+        with conn.cursor() as cur:
+            try:
+                rows = cur.execute(
+                    "SELECT service_id, fingerprint FROM resonanse_events WHERE service_id = ANY(%s)",
+                    (service_ids,),
+                ).fetchall()
+            except (psycopg.errors.UndefinedTable, psycopg.errors.UndefinedColumn):
+                # events table is created or migrated by event handler on its start
+                return {}
+
+    return {service_id: fingerprint for service_id, fingerprint in rows}
+
+
 # init table
 init_db()
@@ -0,0 +1,148 @@
+"""
+Compare reads of users interactions in layouts of users_interactions table:
+legacy one sorted by time, one sorted by user after migration 2 and one sorted by time
+with monthly partitions after migration 7. Queries are the ones which read the table now,
+latest interactions of users are read from users_last_interactions, which does not depend on layout.
+Synthetic interactions are generated on clickhouse server, benchmark databases are dropped after run
+
+usage: CLICKHOUSE_HOST=localhost python benchmarks/clickhouse_interactions_benchmark.py
+"""
+import time
+from datetime import datetime
+from datetime import timedelta
+from os import environ
+
+import clickhouse_connect
+
+from common.clients.prepared_sql import CLICKHOUSE_MIGRATIONS
+from common.clients.prepared_sql import CREATE_USERS_INTERACTION_TABLE
+from common.models import InteractionKind
+
+INTERACTIONS_AMOUNT = 30_000_000
+USERS_AMOUNT = 1_000_000
+EVENTS_AMOUNT = 200_000
+HISTORY_DAYS = 365
+REPEATS = 20
+
+# database and versions of migrations applied to legacy table
+LAYOUTS = {
+    'legacy': ('interactions_benchmark_legacy', []),
+    'by user': ('interactions_benchmark_by_user', [2, 6]),
+    'by time': ('interactions_benchmark_by_time', [2, 6, 7]),
+}
+
+GENERATE_INTERACTIONS = f'''
+INSERT INTO users_interactions
+SELECT
+    rand(1) % {USERS_AMOUNT} AS user_id,
+    toUUID(concat('00000000-0000-4000-8000-', leftPad(toString(rand(2) % {EVENTS_AMOUNT}), 12, '0'))) AS event_id,
+    ['click', 'like', 'dislike'][rand(3) % 3 + 1] AS interaction_type,
+    now() - toIntervalSecond(rand(4) % {HISTORY_DAYS * 24 * 3600}) AS interaction_dt
+FROM numbers({INTERACTIONS_AMOUNT});
+'''
+
+# queries of ClickHouseDB which read users_interactions, with period they are called for
+QUERIES = {
+    # precompute, users active during period of considered interactions
+    'active users 7d': (
+        '''
+        SELECT DISTINCT user_id FROM users_interactions WHERE interaction_dt >= %(v1)s
+        ''',
+        timedelta(days=7),
+    ),
+    # co-occurrence model refresh, interactions since previous refresh with overlap
+    'pairs 90s': (
+        '''
+        SELECT DISTINCT user_id, event_id FROM users_interactions
+        WHERE (interaction_dt >= %(v1)s) AND (interaction_dt < %(v2)s) AND (interaction_type != %(v3)s)
+        ''',
+        timedelta(seconds=90),
+    ),
+    # co-occurrence model rebuild
+    'pairs 30d': (
+        '''
+        SELECT DISTINCT user_id, event_id FROM users_interactions
+        WHERE (interaction_dt >= %(v1)s) AND (interaction_dt < %(v2)s) AND (interaction_type != %(v3)s)
+        ''',
+        timedelta(days=30),
+    ),
+}
+
+
+def get_parameters(period: timedelta, latest_dt: datetime) -> dict:
+    """
+    period ends after latest interaction, so it is same for all layouts however long benchmark runs
+    """
+    before_dt = latest_dt + timedelta(seconds=1)
+    return {'v1': before_dt - period, 'v2': before_dt, 'v3': InteractionKind.DISLIKE.value}
+
+
+def measure(client, query: str, parameters: dict) -> tuple[float, float]:
+    """
+    :return: average latency in milliseconds and amount of read rows
+    """
+    elapsed = 0.0
+    read_rows = 0
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        result = client.query(query, parameters=parameters, settings={'use_query_cache': 0})
+        elapsed += time.perf_counter() - started
+        read_rows = int(result.summary.get('read_rows', 0))
+
+    return elapsed / REPEATS * 1000, read_rows
+
+
+def get_client(database: str = 'default'):
+    return clickhouse_connect.get_client(
+        host=environ.get('CLICKHOUSE_HOST', 'localhost'),
+        username=environ.get('CLICKHOUSE_USERNAME', 'default'),
+        password=environ.get('CLICKHOUSE_PASSWORD', ''),
+        database=database,
+    )
+
+
+def main():
+    admin_client = get_client()
+    for database, _ in LAYOUTS.values():
+        admin_client.command(f'DROP DATABASE IF EXISTS {database}')
+        admin_client.command(f'CREATE DATABASE {database}')
+
+    clients = {layout: get_client(database) for layout, (database, _) in LAYOUTS.items()}
+    legacy_database, _ = LAYOUTS['legacy']
+    migrations = {version: statements for version, _, statements in CLICKHOUSE_MIGRATIONS}
+
+    try:
+        started = time.perf_counter()
+        clients['legacy'].command(CREATE_USERS_INTERACTION_TABLE)
+        clients['legacy'].command(GENERATE_INTERACTIONS)
+        print(f'generated {INTERACTIONS_AMOUNT} interactions: {time.perf_counter() - started:.1f}s')
+
+        for layout, (_, versions) in LAYOUTS.items():
+            if not versions:
+                continue
+
+            started = time.perf_counter()
+            client = clients[layout]
+            client.command(CREATE_USERS_INTERACTION_TABLE)
+            client.command(f'INSERT INTO users_interactions SELECT * FROM {legacy_database}.users_interactions')
+            for version in versions:
+                for statement in migrations[version]:
+                    client.command(statement)
+            print(f'migrated {layout} layout: {time.perf_counter() - started:.1f}s')
+
+        latest_dt = clients['legacy'].query('SELECT max(interaction_dt) FROM users_interactions').result_rows[0][0]
+        print(f'{"query":<18}' + ''.join(f'{layout + " ms":>14}{layout + " rows":>16}' for layout in LAYOUTS))
+        for query_name, (query, period) in QUERIES.items():
+            parameters = get_parameters(period, latest_dt)
+            row = f'{query_name:<18}'
+            for layout in LAYOUTS:
+                latency_ms, read_rows = measure(clients[layout], query, parameters)
+                row += f'{latency_ms:>14.1f}{read_rows:>16.0f}'
+            print(row)
+    finally:
+        for database, _ in LAYOUTS.values():
+            admin_client.command(f'DROP DATABASE IF EXISTS {database}')
+
+
+if __name__ == '__main__':
+    main()
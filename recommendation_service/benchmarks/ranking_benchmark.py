@@ -0,0 +1,153 @@
+"""
+Compare per-item ranking stage with vectorized one
+
+usage: python benchmarks/ranking_benchmark.py
+"""
+import itertools
+import math
+import random
+import timeit
+import typing as t
+import uuid
+from datetime import datetime
+from datetime import timedelta
+from uuid import UUID
+
+from common.models import EventData
+from common.models import EventSource
+from common.models import Image
+from common.models import RecItem
+from common.models import RecSubsystem
+from common.models import Venue
+from recsys_service.ranking import candidates_as_arrays
+from recsys_service.ranking import compose_recommendation_from_candidates_groups
+from recsys_service.ranking import rank_candidates
+
+CANDIDATES_AMOUNTS = (100, 1_000, 10_000)
+REPEATS = 5
+
+
+# per-item implementation, as it was before ranking stage was vectorized
+
+def legacy_rescore_randomized(candidates: list[RecItem]) -> list[RecItem]:
+    for rec in candidates:
+        rec.score += random.uniform(-1, 1) * 0.03
+
+    return candidates
+
+
+def legacy_rescore_with_exponential_decay(candidates: list[RecItem]) -> list[RecItem]:
+    request_dt = datetime.now()
+
+    for candidate in candidates:
+        time_delta = abs((candidate.event.datetime_from - request_dt).days)
+        candidate.score = candidate.score * math.exp(-0.002 * time_delta)
+
+    return candidates
+
+
+def legacy_get_candidates_events_ids(candidates: list[RecItem]) -> list[UUID]:
+    return [candidate.event.id for candidate in candidates]
+
+
+def legacy_get_top_k(candidates: t.Iterable[RecItem], limit: int, exclude=None) -> list[RecItem]:
+    if exclude is None:
+        exclude = []
+    selected_candidates = []
+
+    for candidate in sorted(candidates, key=lambda c: c.score, reverse=True):
+        if candidate.event.id in [*legacy_get_candidates_events_ids(selected_candidates), *exclude]:
+            continue
+
+        selected_candidates.append(candidate)
+        if len(selected_candidates) >= limit:
+            break
+
+    return selected_candidates
+
+
+def legacy_compose_recommendation_from_candidates_groups(
+        candidates_by_groups: list[list[RecItem]],
+        min_by_group: int,
+        limit: int,
+) -> list[RecItem]:
+    rescored_candidates_by_groups = [
+        legacy_get_top_k(legacy_rescore_randomized(legacy_rescore_with_exponential_decay(candidates_group)), limit)
+        for candidates_group in candidates_by_groups
+    ]
+
+    selected_candidates = []
+    for _ in range(min_by_group):
+        for candidates_group in rescored_candidates_by_groups:
+            for candidate in candidates_group:
+                if candidate.event.id not in legacy_get_candidates_events_ids(selected_candidates):
+                    selected_candidates.append(candidate)
+                    break
+
+    remained = limit - len(selected_candidates)
+    if remained > 0:
+        selected_candidates.extend(legacy_get_top_k(
+            itertools.chain.from_iterable(rescored_candidates_by_groups),
+            remained,
+            exclude=legacy_get_candidates_events_ids(selected_candidates),
+        ))
+    return selected_candidates[:limit]
+
+
+def generate_candidates_groups(amount: int) -> list[list[RecItem]]:
+    now = datetime.now()
+    # some events are recommended by several subsystems
+    events = [
+        EventData(
+            id=uuid.uuid4(),
+            title='event',
+            datetime_from=now + timedelta(hours=random.randint(1, 180 * 24)),
+            city=None,
+            venue=Venue(),
+            picture=Image(),
+            service_id=str(index),
+            service_type=EventSource.KUDAGO,
+            service_data={},
+        )
+        for index in range(max(amount * 2 // 3, 1))
+    ]
+    subsystems = list(RecSubsystem)
+
+    candidates_by_groups = [[] for _ in subsystems]
+    for index in range(amount):
+        group = index % len(subsystems)
+        candidates_by_groups[group].append(RecItem(
+            subsystem=subsystems[group],
+            event=random.choice(events),
+            score=random.random(),
+        ))
+
+    return candidates_by_groups
+
+
+def measure(compose: t.Callable, *args) -> float:
+    timer = timeit.Timer(lambda: compose(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEATS, number=number)) / number
+
+
+def main():
+    print(
+        f'{"candidates":>10} | {"limit":>5} | {"legacy, ms":>10} | {"vectorized, ms":>14} | {"speedup":>7} '
+        f'| {"arrays only, ms":>15}'
+    )
+    for amount in CANDIDATES_AMOUNTS:
+        candidates_by_groups = generate_candidates_groups(amount)
+        _, arrays = candidates_as_arrays(candidates_by_groups)
+        for limit in sorted({10, amount // 10}):
+            legacy = measure(legacy_compose_recommendation_from_candidates_groups, candidates_by_groups, 2, limit)
+            vectorized = measure(compose_recommendation_from_candidates_groups, candidates_by_groups, 2, limit)
+            arrays_only = measure(rank_candidates, arrays, 2, limit)
+            print(
+                f'{amount:>10} | {limit:>5} | {legacy * 1000:>10.3f} | {vectorized * 1000:>14.3f} '
+                f'| {legacy / vectorized:>6.1f}x | {arrays_only * 1000:>15.3f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import asyncio
+
+from common.clients import VectorDB
+from common.utils import get_logger
+from recsys_service.config import EVENTS_SNAPSHOT_PATH
+from recsys_service.config import QDRANT_HOST
+from recsys_service.config import QDRANT_PORT
+
+logger = get_logger('export_snapshot')
+
+
+async def main():
+    vectordb_client = await VectorDB.get_client(QDRANT_HOST, QDRANT_PORT)
+    exported = await vectordb_client.export_events_snapshot(EVENTS_SNAPSHOT_PATH)
+    if exported:
+        logger.info('Exported %s events to %s', exported, EVENTS_SNAPSHOT_PATH)
+    else:
+        logger.warning('No upcoming events, snapshot is not exported')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
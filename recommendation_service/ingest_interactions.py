@@ -0,0 +1,57 @@
+import asyncio
+
+import aio_pika
+
+from common.clients import ClickHouseDB
+from common.models import INTERACTIONS_EXCHANGE
+from common.models import INTERACTIONS_ROUTING_KEY
+from common.utils import get_logger
+from recsys_service.config import CLICKHOUSE_HOST
+from recsys_service.config import CLICKHOUSE_PASSWORD
+from recsys_service.config import CLICKHOUSE_POOL_SIZE
+from recsys_service.config import CLICKHOUSE_USERNAME
+from recsys_service.config import INGESTION_BATCH_SIZE
+from recsys_service.config import INGESTION_FLUSH_INTERVAL
+from recsys_service.config import RABBITMQ_HOST
+from recsys_service.config import RABBITMQ_PASSWORD
+from recsys_service.config import RABBITMQ_USER
+from recsys_service.interactions_ingestion import InteractionsIngestion
+
+logger = get_logger('ingest_interactions')
+
+INGESTION_QUEUE = 'recommendations.interactions.ingestion'
+
+
+async def main() -> None:
+    clickhouse_client = await ClickHouseDB.get_client(
+        CLICKHOUSE_HOST,
+        CLICKHOUSE_USERNAME,
+        CLICKHOUSE_PASSWORD,
+        CLICKHOUSE_POOL_SIZE,
+    )
+
+    connection = await aio_pika.connect_robust(
+        host=RABBITMQ_HOST,
+        login=RABBITMQ_USER,
+        password=RABBITMQ_PASSWORD,
+    )
+
+    channel = await connection.channel()
+    # whole batch should be delivered before it is acknowledged
+    await channel.set_qos(prefetch_count=INGESTION_BATCH_SIZE)
+
+    interactions_exchange = await channel.declare_exchange(
+        INTERACTIONS_EXCHANGE,
+        type=aio_pika.ExchangeType.TOPIC,
+        durable=True,
+    )
+    queue = await channel.declare_queue(INGESTION_QUEUE, durable=True)
+    await queue.bind(interactions_exchange, INTERACTIONS_ROUTING_KEY)
+
+    logger.info('Starting interactions ingestion')
+    ingestion = InteractionsIngestion(clickhouse_client, INGESTION_BATCH_SIZE, INGESTION_FLUSH_INTERVAL)
+    await ingestion.consume(queue)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
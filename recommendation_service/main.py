@@ -1,14 +1,39 @@
 import asyncio
 import json
+import signal
 import typing as t
+from datetime import datetime
+from datetime import timedelta
 
 import aio_pika
 
+from common.clients import ClickHouseDB
+from common.clients import EventsCatalog
 from common.clients import PostgresDB
 from common.clients import VectorDB
+from common.models import INTERACTIONS_EXCHANGE
+from common.models import INTERACTIONS_ROUTING_KEY
+from common.models import RecommendationList
 from common.models import SimplifiedRecItem
+from common.models import UserInteraction
 from common.utils import get_logger
 from common.utils.serde_helpers import custom_encoder
+from recsys_service.config import CLICKHOUSE_HOST
+from recsys_service.config import CLICKHOUSE_PASSWORD
+from recsys_service.config import CLICKHOUSE_POOL_SIZE
+from recsys_service.config import CLICKHOUSE_USERNAME
+from recsys_service.config import COOCCURRENCE_REBUILD_INTERVAL
+from recsys_service.config import COOCCURRENCE_REFRESH_INTERVAL
+from recsys_service.config import EMBEDDING_CACHE_MEMORY_SIZE
+from recsys_service.config import EMBEDDING_CACHE_PATH
+from recsys_service.config import EMBEDDING_MAX_PENDING
+from recsys_service.config import EMBEDDING_WORKERS
+from recsys_service.config import EVENTS_CATALOG_RECONCILE_INTERVAL
+from recsys_service.config import EVENTS_CATALOG_SYNC_INTERVAL
+from recsys_service.config import EVENTS_SNAPSHOT_PATH
+from recsys_service.config import LOCAL_INDEX_ENABLED
+from recsys_service.config import LOCAL_INDEX_RECONCILE_INTERVAL
+from recsys_service.config import LOCAL_INDEX_SYNC_INTERVAL
 from recsys_service.config import RABBITMQ_HOST
 from recsys_service.config import RABBITMQ_PASSWORD
 from recsys_service.config import RABBITMQ_USER
@@ -18,13 +43,36 @@ from recsys_service.config import POSTGRES_PASSWORD
 from recsys_service.config import POSTGRES_PORT
 from recsys_service.config import POSTGRES_USER
 from recsys_service.config import QDRANT_HOST
+from recsys_service.config import PRECOMPUTED_TTL
 from recsys_service.config import QDRANT_PORT
+from recsys_service.config import REC_CACHE_SIZE
+from recsys_service.config import REC_CACHE_TTL
+from recsys_service.config import UPDATED_USERS_SIZE
+from recsys_service import get_precomputed_recommendation_for_user
 from recsys_service import get_recommendation_for_user
+from recsys_service import get_recommendations_for_users_query
+from recsys_service import impressions_logger
+from recsys_service import update_dynamic_embedding
+from recsys_service.cooccurrence import CooccurrenceModel
+from recsys_service.rec_cache import RecommendationCache
 
 logger = get_logger('main')
 
 RPC_QUEUE_RECOMMENDATION_BY_USER = 'recommendations.requests.by_user'
+RPC_QUEUE_RECOMMENDATION_BY_USERS = 'recommendations.requests.by_users'
 RPC_QUEUE_SET_USER_DESCRIPTION = 'resonanse_api.requests.set_user_description'
+RPC_QUEUE_CACHE_STATS = 'recommendations.requests.cache_stats'
+
+# each interaction is consumed by one of service replicas to update dynamic embedding of user
+DYNAMIC_EMBEDDING_QUEUE = 'recommendations.interactions.dynamic_embedding'
+# description of user is set by one of replicas, all of them are notified through fanout exchange
+USERS_UPDATES_EXCHANGE = 'recommendations.users_updates'
+
+recommendation_cache: RecommendationCache[list[dict]] = RecommendationCache(REC_CACHE_TTL, REC_CACHE_SIZE)
+# precomputed recommendations are outdated for users updated after precompute,
+# older updates are not needed, precomputed recommendations are not served after PRECOMPUTED_TTL anyway
+users_updated_dt: RecommendationCache[datetime] = RecommendationCache(PRECOMPUTED_TTL, UPDATED_USERS_SIZE)
+users_updates_exchange: aio_pika.abc.AbstractExchange | None = None
 
 QueueHandler = t.Callable[
     [
@@ -35,6 +83,17 @@ QueueHandler = t.Callable[
 ]
 
 
+def get_simplified_recommendation(recommendations: RecommendationList) -> list[dict]:
+    response = [
+        SimplifiedRecItem(
+            subsystem=rec.subsystem,
+            event_id=rec.event.id,
+            score=rec.score,
+        ) for rec in recommendations
+    ]
+    return [rec.model_dump() for rec in response]
+
+
 async def rpc_get_recommendation_by_user(
         message: aio_pika.abc.AbstractIncomingMessage,
         exchange: aio_pika.exchange.AbstractExchange,
@@ -47,16 +106,26 @@ async def rpc_get_recommendation_by_user(
         req_json = json.loads(message.body)
         user_id = req_json['user_id']
 
-        recommendations = await get_recommendation_for_user(user_id)
-        response = [
-            SimplifiedRecItem(
-                subsystem=rec.subsystem,
-                event_id=rec.event.id,
-                score=rec.score,
-            ) for rec in recommendations
-        ]
+        response = recommendation_cache.get(user_id)
+        if response is None:
+            generation = recommendation_cache.get_generation()
+            precomputed_after_dt = datetime.now() - timedelta(seconds=PRECOMPUTED_TTL)
+            if (user_updated_dt := users_updated_dt.get(user_id)) is not None:
+                precomputed_after_dt = max(precomputed_after_dt, user_updated_dt)
+
+            precomputed = await get_precomputed_recommendation_for_user(user_id, precomputed_after_dt)
+            if precomputed is not None:
+                response = [rec.model_dump() for rec in precomputed]
+            else:
+                recommendations = await get_recommendation_for_user(user_id)
+                response = get_simplified_recommendation(recommendations)
+            recommendation_cache.set(user_id, response, generation)
+        else:
+            # recommendation is given again, so it is logged as computed one is
+            impressions_logger.log(user_id, [SimplifiedRecItem.model_validate(rec) for rec in response])
+
         resp_json = json.dumps(
-            [rec.model_dump() for rec in response],
+            response,
             default=custom_encoder,
         )
 
@@ -70,6 +139,37 @@ async def rpc_get_recommendation_by_user(
         )
 
 
+async def rpc_get_recommendations_by_users(
+        message: aio_pika.abc.AbstractIncomingMessage,
+        exchange: aio_pika.exchange.AbstractExchange,
+) -> None:
+    async with message.process(requeue=False):
+        if message.reply_to is None:
+            logger.warning('message.reply_to is', message.reply_to)
+            return
+
+        req_json = json.loads(message.body)
+        users_ids: set[int] = set(req_json['users_ids'])
+
+        recommendations = await get_recommendations_for_users_query(users_ids)
+        resp_json = json.dumps(
+            {
+                user_id: get_simplified_recommendation(recommendation)
+                for user_id, recommendation in recommendations.items()
+            },
+            default=custom_encoder,
+        )
+
+        logger.debug('Send response: rpc_get_recommendations_by_users')
+        await exchange.publish(
+            aio_pika.Message(
+                body=resp_json.encode(),
+                correlation_id=message.correlation_id,
+            ),
+            routing_key=message.reply_to,
+        )
+
+
 async def rpc_set_user_description(
         message: aio_pika.abc.AbstractIncomingMessage,
         exchange: aio_pika.exchange.AbstractExchange,
@@ -106,6 +206,11 @@ async def rpc_set_user_description(
             user_description,
         )
 
+        await users_updates_exchange.publish(
+            aio_pika.Message(body=json.dumps({'user_id': user_id}).encode()),
+            routing_key='',
+        )
+
         resp_json = json.dumps({'status': status})
 
         logger.debug('Send response: rpc_set_user_description')
@@ -118,6 +223,59 @@ async def rpc_set_user_description(
         )
 
 
+async def rpc_get_cache_stats(
+        message: aio_pika.abc.AbstractIncomingMessage,
+        exchange: aio_pika.exchange.AbstractExchange,
+) -> None:
+    async with message.process(requeue=False):
+        if message.reply_to is None:
+            logger.warning('message.reply_to is', message.reply_to)
+            return
+
+        resp_json = json.dumps({
+            **recommendation_cache.get_stats(),
+            'embedding_cache': VectorDB.get_embedding_cache_stats(),
+        })
+
+        logger.debug('Send response: rpc_get_cache_stats')
+        await exchange.publish(
+            aio_pika.Message(
+                body=resp_json.encode(),
+                correlation_id=message.correlation_id,
+            ),
+            routing_key=message.reply_to,
+        )
+
+
+async def handle_user_interaction(
+        message: aio_pika.abc.AbstractIncomingMessage,
+        exchange: aio_pika.exchange.AbstractExchange,
+) -> None:
+    async with message.process(requeue=False):
+        interaction = UserInteraction.model_validate_json(message.body)
+        recommendation_cache.invalidate(interaction.user_id)
+        users_updated_dt.set(interaction.user_id, datetime.now())
+
+
+async def handle_user_update(
+        message: aio_pika.abc.AbstractIncomingMessage,
+        exchange: aio_pika.exchange.AbstractExchange,
+) -> None:
+    async with message.process(requeue=False):
+        user_id: int = json.loads(message.body)['user_id']
+        recommendation_cache.invalidate(user_id)
+        users_updated_dt.set(user_id, datetime.now())
+
+
+async def handle_interaction_for_dynamic_embedding(
+        message: aio_pika.abc.AbstractIncomingMessage,
+        exchange: aio_pika.exchange.AbstractExchange,
+) -> None:
+    async with message.process(requeue=False):
+        interaction = UserInteraction.model_validate_json(message.body)
+        await update_dynamic_embedding(interaction)
+
+
 async def run_queue_handler(
         queue: aio_pika.queue.AbstractQueue,
         resp_exchange: aio_pika.exchange.AbstractExchange,
@@ -137,13 +295,45 @@ async def run_queue_handler(
 
 RPC_QUEUE_HANDLERS = {
     RPC_QUEUE_RECOMMENDATION_BY_USER: rpc_get_recommendation_by_user,
+    RPC_QUEUE_RECOMMENDATION_BY_USERS: rpc_get_recommendations_by_users,
     RPC_QUEUE_SET_USER_DESCRIPTION: rpc_set_user_description,
+    RPC_QUEUE_CACHE_STATS: rpc_get_cache_stats,
 }
 
 
 async def main() -> None:
     # init clickhouse
-    await VectorDB.get_client(QDRANT_HOST, QDRANT_PORT)
+    vectordb_client = await VectorDB.get_client(QDRANT_HOST, QDRANT_PORT)
+    # users descriptions are embedded out of event loop, worker loads model on first description
+    embedding_executor = VectorDB.start_embedding_executor(EMBEDDING_WORKERS, EMBEDDING_MAX_PENDING)
+    # descriptions are often submitted unchanged
+    VectorDB.start_embedding_cache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_SIZE)
+
+    # events catalog is loaded before serving requests, then kept in sync in background
+    events_catalog = EventsCatalog(vectordb_client)
+    await events_catalog.sync()
+
+    if LOCAL_INDEX_ENABLED:
+        # snapshot is mapped without reading, then only events updated after snapshot are fetched
+        if EVENTS_SNAPSHOT_PATH.exists():
+            try:
+                vectordb_client.load_local_index_snapshot(EVENTS_SNAPSHOT_PATH)
+            except Exception as err:
+                logger.exception('Can not load events snapshot, local index is loaded from scratch: %s', err)
+
+        logger.info('Syncing local index of upcoming events')
+        # events deleted after snapshot was exported are removed
+        await vectordb_client.sync_local_index(reconcile=True)
+
+    # collaborative subsystem is served by in-memory model, refreshed with new interactions in background
+    clickhouse_client = await ClickHouseDB.get_client(
+        CLICKHOUSE_HOST,
+        CLICKHOUSE_USERNAME,
+        CLICKHOUSE_PASSWORD,
+        CLICKHOUSE_POOL_SIZE,
+    )
+    cooccurrence_model = CooccurrenceModel(vectordb_client, clickhouse_client)
+    await cooccurrence_model.rebuild()
 
     connection = await aio_pika.connect_robust(
         host=RABBITMQ_HOST,
@@ -158,7 +348,38 @@ async def main() -> None:
     # it seems that big prefetch count depletes db connection pool
     await channel.set_qos(prefetch_count=10)
 
-    queue_handling_tasks = []
+    queue_handling_tasks = [
+        asyncio.create_task(events_catalog.run_sync(EVENTS_CATALOG_SYNC_INTERVAL, EVENTS_CATALOG_RECONCILE_INTERVAL)),
+        asyncio.create_task(cooccurrence_model.run_refresh(
+            COOCCURRENCE_REFRESH_INTERVAL,
+            COOCCURRENCE_REBUILD_INTERVAL,
+        )),
+        asyncio.create_task(impressions_logger.run(clickhouse_client)),
+    ]
+    if LOCAL_INDEX_ENABLED:
+        queue_handling_tasks.append(
+            asyncio.create_task(vectordb_client.run_local_index_sync(
+                LOCAL_INDEX_SYNC_INTERVAL,
+                LOCAL_INDEX_RECONCILE_INTERVAL,
+            ))
+        )
+    # recommendations of user are outdated when user sets description on any of replicas
+    global users_updates_exchange
+    users_updates_exchange = await channel.declare_exchange(
+        USERS_UPDATES_EXCHANGE,
+        type=aio_pika.ExchangeType.FANOUT,
+        durable=True,
+    )
+    users_updates_queue = await channel.declare_queue(exclusive=True)
+    await users_updates_queue.bind(users_updates_exchange)
+    queue_handling_tasks.append(
+        asyncio.create_task(run_queue_handler(
+            users_updates_queue,
+            exchange,
+            handle_user_update,
+        ))
+    )
+
     for (mq_queue_name, handler) in RPC_QUEUE_HANDLERS.items():
         queue = await channel.declare_queue(mq_queue_name, durable=True)
         queue_handling_tasks.append(
@@ -169,8 +390,42 @@ async def main() -> None:
             ))
         )
 
-    while queue_handling_tasks:
-        await asyncio.wait(queue_handling_tasks)
+    # recommendations of user are outdated when user interacts with events
+    interactions_exchange = await channel.declare_exchange(
+        INTERACTIONS_EXCHANGE,
+        type=aio_pika.ExchangeType.TOPIC,
+        durable=True,
+    )
+    interactions_queue = await channel.declare_queue(exclusive=True)
+    await interactions_queue.bind(interactions_exchange, INTERACTIONS_ROUTING_KEY)
+    queue_handling_tasks.append(
+        asyncio.create_task(run_queue_handler(
+            interactions_queue,
+            exchange,
+            handle_user_interaction,
+        ))
+    )
+
+    dynamic_embedding_queue = await channel.declare_queue(DYNAMIC_EMBEDDING_QUEUE, durable=True)
+    await dynamic_embedding_queue.bind(interactions_exchange, INTERACTIONS_ROUTING_KEY)
+    queue_handling_tasks.append(
+        asyncio.create_task(run_queue_handler(
+            dynamic_embedding_queue,
+            exchange,
+            handle_interaction_for_dynamic_embedding,
+        ))
+    )
+
+    # buffered recommendations are saved on shutdown
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        while queue_handling_tasks:
+            await asyncio.wait(queue_handling_tasks)
+    finally:
+        logger.info('Shutting down, flushing %s buffered recommendations', impressions_logger.get_stats()['buffered'])
+        await connection.close()
+        await impressions_logger.flush()
+        embedding_executor.shutdown()
 
 
 if __name__ == "__main__":
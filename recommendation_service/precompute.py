@@ -0,0 +1,6 @@
+import asyncio
+
+from recsys_service.precompute import run_precompute_service
+
+if __name__ == "__main__":
+    asyncio.run(run_precompute_service())
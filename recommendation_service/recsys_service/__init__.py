@@ -1,7 +1,11 @@
 import asyncio
 
+from .rec_utils import get_precomputed_recommendation_for_user
 from .rec_utils import get_recommendation_for_user
 from .rec_utils import get_recommendation_for_user_query
+from .rec_utils import get_recommendations_for_users_query
+from .rec_utils import impressions_logger
+from .rec_utils import update_dynamic_embedding
 
 if __name__ == '__main__':
     recs = asyncio.run(get_recommendation_for_user_query(
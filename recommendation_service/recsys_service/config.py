@@ -1,4 +1,6 @@
+from datetime import timedelta
 from os import environ
+from pathlib import Path
 
 # rabbit mq
 RABBITMQ_HOST = environ.get('RABBITMQ_HOST', 'localhost')
@@ -21,5 +23,54 @@ QDRANT_PORT = environ.get('QDRANT_PORT', '6333')
 CLICKHOUSE_HOST = environ.get('CLICKHOUSE_HOST', 'localhost')
 CLICKHOUSE_USERNAME = environ.get('CLICKHOUSE_USERNAME')
 CLICKHOUSE_PASSWORD = environ.get('CLICKHOUSE_PASSWORD')
+CLICKHOUSE_POOL_SIZE = int(environ.get('CLICKHOUSE_POOL_SIZE', '10'))  # max concurrent queries
 
+# candidates generation, latency budget of each subsystem in seconds
+STATIC_CANDIDATES_TIMEOUT = float(environ.get('STATIC_CANDIDATES_TIMEOUT', '1.0'))
+DYNAMIC_CANDIDATES_TIMEOUT = float(environ.get('DYNAMIC_CANDIDATES_TIMEOUT', '1.0'))
+COLLABORATIVE_CANDIDATES_TIMEOUT = float(environ.get('COLLABORATIVE_CANDIDATES_TIMEOUT', '1.0'))
 
+# recommendations cache
+REC_CACHE_TTL = float(environ.get('REC_CACHE_TTL', '60'))
+REC_CACHE_SIZE = int(environ.get('REC_CACHE_SIZE', '10000'))
+
+# offline precompute of recommendations
+PRECOMPUTE_INTERVAL = int(environ.get('PRECOMPUTE_INTERVAL', str(3600)))  # seconds between runs
+PRECOMPUTE_USERS_BATCH_SIZE = int(environ.get('PRECOMPUTE_USERS_BATCH_SIZE', '1000'))
+PRECOMPUTE_BLOCK_SIZE = int(environ.get('PRECOMPUTE_BLOCK_SIZE', '256'))  # queries scored by one matmul
+PRECOMPUTED_TTL = int(environ.get('PRECOMPUTED_TTL', str(2 * 3600)))  # seconds while precomputed is served
+# users updated after precompute, whose precomputed recommendations are outdated, remembered for PRECOMPUTED_TTL
+UPDATED_USERS_SIZE = int(environ.get('UPDATED_USERS_SIZE', '100000'))
+
+# in-memory catalog of upcoming events
+EVENTS_CATALOG_SYNC_INTERVAL = float(environ.get('EVENTS_CATALOG_SYNC_INTERVAL', '60'))  # seconds between syncs
+EVENTS_CATALOG_RECONCILE_INTERVAL = float(environ.get('EVENTS_CATALOG_RECONCILE_INTERVAL', '600'))  # deleted events
+
+# local index of upcoming events embeddings, serves vector searches instead of qdrant
+LOCAL_INDEX_ENABLED = environ.get('LOCAL_INDEX_ENABLED', 'false').lower() == 'true'
+LOCAL_INDEX_SYNC_INTERVAL = float(environ.get('LOCAL_INDEX_SYNC_INTERVAL', '60'))  # seconds between syncs
+LOCAL_INDEX_RECONCILE_INTERVAL = float(environ.get('LOCAL_INDEX_RECONCILE_INTERVAL', '600'))  # deleted events
+# snapshot of events embeddings to start local index from, exported by export_snapshot.py
+EVENTS_SNAPSHOT_PATH = Path(environ.get('EVENTS_SNAPSHOT_PATH', '/var/capybanse/snapshot/events'))
+
+# item-item co-occurrence model of collaborative subsystem
+COOCCURRENCE_PERIOD = timedelta(days=int(environ.get('COOCCURRENCE_PERIOD_DAYS', '30')))  # considered interactions
+COOCCURRENCE_REFRESH_INTERVAL = float(environ.get('COOCCURRENCE_REFRESH_INTERVAL', '60'))  # new interactions added
+COOCCURRENCE_REBUILD_INTERVAL = float(environ.get('COOCCURRENCE_REBUILD_INTERVAL', str(3600)))  # built from scratch
+
+# ingestion of users interactions to clickhouse
+INGESTION_BATCH_SIZE = int(environ.get('INGESTION_BATCH_SIZE', '1000'))  # interactions inserted at once
+INGESTION_FLUSH_INTERVAL = float(environ.get('INGESTION_FLUSH_INTERVAL', '1.0'))  # max seconds in buffer
+
+# write-behind log of given recommendations
+IMPRESSIONS_BUFFER_SIZE = int(environ.get('IMPRESSIONS_BUFFER_SIZE', '100000'))  # oldest are dropped when full
+IMPRESSIONS_BATCH_SIZE = int(environ.get('IMPRESSIONS_BATCH_SIZE', '1000'))
+IMPRESSIONS_FLUSH_INTERVAL = float(environ.get('IMPRESSIONS_FLUSH_INTERVAL', '5'))  # seconds between flushes
+
+# embedding of users descriptions in pool of processes
+EMBEDDING_WORKERS = int(environ.get('EMBEDDING_WORKERS', '1'))
+EMBEDDING_MAX_PENDING = int(environ.get('EMBEDDING_MAX_PENDING', '16'))  # submitted batches, further ones wait
+
+# cache of descriptions embeddings, recently used ones are kept in memory
+EMBEDDING_CACHE_PATH = Path(environ.get('EMBEDDING_CACHE_PATH', '/var/capybanse/embeddings/users.sqlite3'))
+EMBEDDING_CACHE_MEMORY_SIZE = int(environ.get('EMBEDDING_CACHE_MEMORY_SIZE', '1000'))
@@ -0,0 +1,287 @@
+"""
+Item-item collaborative model: events are similar when same users interacted with them.
+Model is rebuilt from users interactions periodically and refreshed with new interactions in between,
+candidates are scored by sparse matrix products against recent interactions of user
+"""
+import asyncio
+import time
+import typing as t
+from datetime import datetime
+from uuid import UUID
+
+import numpy as np
+from scipy import sparse
+
+from common.clients import ClickHouseDB
+from common.clients import VectorDB
+from common.clients.vectordb_client import RECOMMENDATION_PERIOD
+from common.clients.vectordb_client import SYNC_OVERLAP
+from common.models import EventRef
+from common.models import InteractionKind
+from common.models import UserInteraction
+from common.utils import get_logger
+from recsys_service.config import COOCCURRENCE_PERIOD
+
+logger = get_logger('cooccurrence')
+
+
+class CooccurrenceState(t.NamedTuple):
+    events_ids: list[UUID]
+    event_index: dict[UUID, int]
+    events_ts: np.ndarray  # float64, timestamp of event start, nan if event can not be recommended
+    user_index: dict[int, int]
+    interactions: sparse.csr_matrix  # users x events, 1 if user interacted with event
+    cooccurrence: sparse.csr_matrix  # events x events, amount of users interacted with both events
+    similarity: sparse.csr_matrix  # events x events, cosine similarity of events by interacted users
+    synced_dt: datetime
+
+
+def get_similarity(interactions: sparse.csr_matrix, cooccurrence: sparse.csr_matrix) -> sparse.csr_matrix:
+    users_by_event = np.asarray(interactions.sum(axis=0), dtype=np.float32).ravel()
+    inv_norms = sparse.diags(1 / np.sqrt(np.maximum(users_by_event, 1)))
+    return (inv_norms @ cooccurrence @ inv_norms).tocsr()
+
+
+def get_cooccurrence(interactions: sparse.csr_matrix) -> sparse.csr_matrix:
+    cooccurrence = (interactions.T @ interactions).tocsr()
+    cooccurrence.setdiag(0)
+    cooccurrence.eliminate_zeros()
+    return cooccurrence
+
+
+def resized(matrix: sparse.csr_matrix, shape: tuple[int, int]) -> sparse.csr_matrix:
+    matrix = matrix.tocoo()
+    return sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=shape, dtype=np.float32)
+
+
+def index_pairs(
+        pairs: list[tuple[int, UUID]],
+        user_index: dict[int, int],
+        event_index: dict[UUID, int],
+        events_ids: list[UUID],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    rows and columns of pairs in interactions matrix, unknown users and events are added to indices
+    """
+    rows = np.empty(len(pairs), dtype=np.int64)
+    cols = np.empty(len(pairs), dtype=np.int64)
+    for pair_index, (user_id, event_id) in enumerate(pairs):
+        rows[pair_index] = user_index.setdefault(user_id, len(user_index))
+        if event_id not in event_index:
+            event_index[event_id] = len(events_ids)
+            events_ids.append(event_id)
+        cols[pair_index] = event_index[event_id]
+
+    return rows, cols
+
+
+def build_state(
+        pairs: list[tuple[int, UUID]],
+        upcoming_events: list[EventRef],
+        synced_dt: datetime,
+) -> CooccurrenceState:
+    events_ids: list[UUID] = []
+    event_index: dict[UUID, int] = {}
+    user_index: dict[int, int] = {}
+    rows, cols = index_pairs(pairs, user_index, event_index, events_ids)
+
+    interactions = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+        shape=(len(user_index), len(events_ids)),
+    )
+    interactions.data[:] = 1  # duplicated pairs are summed on construction
+    cooccurrence = get_cooccurrence(interactions)
+
+    events_ts = np.full(len(events_ids), np.nan, dtype=np.float64)
+    for event in upcoming_events:
+        if event.id in event_index:
+            events_ts[event_index[event.id]] = event.datetime_from.timestamp()
+
+    return CooccurrenceState(
+        events_ids=events_ids,
+        event_index=event_index,
+        events_ts=events_ts,
+        user_index=user_index,
+        interactions=interactions,
+        cooccurrence=cooccurrence,
+        similarity=get_similarity(interactions, cooccurrence),
+        synced_dt=synced_dt,
+    )
+
+
+def update_state(
+        state: CooccurrenceState,
+        pairs: list[tuple[int, UUID]],
+        synced_dt: datetime,
+) -> CooccurrenceState:
+    """
+    add new interactions to model, co-occurrences are updated only for changed pairs of events.
+    Events which were not interacted before rebuild can not be recommended until next rebuild
+    """
+    events_ids = list(state.events_ids)
+    event_index = dict(state.event_index)
+    user_index = dict(state.user_index)
+    rows, cols = index_pairs(pairs, user_index, event_index, events_ids)
+
+    shape = (len(user_index), len(events_ids))
+    interactions = resized(state.interactions, shape)
+
+    # pairs which are already in model are skipped, so interactions stay binary
+    is_new = np.asarray(interactions[rows, cols]).ravel() == 0 if len(pairs) else np.empty(0, dtype=bool)
+    new_interactions = sparse.csr_matrix(
+        (np.ones(is_new.sum(), dtype=np.float32), (rows[is_new], cols[is_new])),
+        shape=shape,
+    )
+    new_interactions.data[:] = 1
+
+    # (X + dX)^T (X + dX) = X^T X + X^T dX + dX^T X + dX^T dX
+    cooccurrence = (
+        resized(state.cooccurrence, (shape[1], shape[1]))
+        + interactions.T @ new_interactions
+        + new_interactions.T @ interactions
+        + new_interactions.T @ new_interactions
+    ).tocsr()
+    cooccurrence.setdiag(0)
+    cooccurrence.eliminate_zeros()
+    interactions = interactions + new_interactions
+
+    events_ts = np.full(len(events_ids), np.nan, dtype=np.float64)
+    events_ts[:len(state.events_ts)] = state.events_ts
+
+    return CooccurrenceState(
+        events_ids=events_ids,
+        event_index=event_index,
+        events_ts=events_ts,
+        user_index=user_index,
+        interactions=interactions,
+        cooccurrence=cooccurrence,
+        similarity=get_similarity(interactions, cooccurrence),
+        synced_dt=synced_dt,
+    )
+
+
+def get_seeds(interactions: list[UserInteraction]) -> tuple[list[UUID], set[UUID]]:
+    """
+    disliked events are not seeds of candidates, even if user clicked them before
+    :param interactions: recent interactions of user, latest first
+    :return: seed events, latest first, and all interacted events, which are excluded from candidates
+    """
+    interacted_events_ids = {interaction.event_id for interaction in interactions}
+    disliked_events_ids = {
+        interaction.event_id
+        for interaction in interactions
+        if interaction.interaction_type == InteractionKind.DISLIKE
+    }
+    seed_events_ids = list(dict.fromkeys(
+        interaction.event_id
+        for interaction in interactions
+        if interaction.event_id not in disliked_events_ids
+    ))
+    return seed_events_ids, interacted_events_ids
+
+
+class CooccurrenceModel:
+    """
+    Model state is shared by all instances and replaced as a whole on refresh
+    """
+    _state: CooccurrenceState | None = None
+
+    def __init__(self, vectordb_client: VectorDB, clickhouse_client: ClickHouseDB):
+        self._vectordb_client = vectordb_client
+        self._clickhouse_client = clickhouse_client
+
+    @property
+    def is_loaded(self) -> bool:
+        return CooccurrenceModel._state is not None
+
+    async def rebuild(self):
+        synced_dt = datetime.now()
+        pairs, upcoming_events = await asyncio.gather(
+            self._clickhouse_client.get_interacted_pairs(synced_dt - COOCCURRENCE_PERIOD, synced_dt),
+            self._vectordb_client.get_upcoming_events_refs(),
+        )
+
+        # matrices are built in thread, so requests are served meanwhile
+        state = await asyncio.get_running_loop().run_in_executor(None, build_state, pairs, upcoming_events, synced_dt)
+        CooccurrenceModel._state = state
+        logger.info(
+            'Co-occurrence model built: %s users, %s events, %s co-occurrences',
+            len(state.user_index), len(state.events_ids), state.cooccurrence.nnz,
+        )
+
+    async def refresh(self):
+        state = CooccurrenceModel._state
+        synced_dt = datetime.now()
+        pairs = await self._clickhouse_client.get_interacted_pairs(state.synced_dt - SYNC_OVERLAP, synced_dt)
+        if pairs:
+            CooccurrenceModel._state = await asyncio.get_running_loop().run_in_executor(
+                None, update_state, state, pairs, synced_dt,
+            )
+        else:
+            CooccurrenceModel._state = state._replace(synced_dt=synced_dt)
+
+    async def run_refresh(self, refresh_interval: float, rebuild_interval: float):
+        """
+        refresh model every refresh_interval seconds and rebuild it every rebuild_interval seconds,
+        model is expected to be built once before
+        """
+        rebuilt = time.monotonic()
+        while True:
+            await asyncio.sleep(refresh_interval)
+            try:
+                if time.monotonic() - rebuilt >= rebuild_interval:
+                    await self.rebuild()
+                    rebuilt = time.monotonic()
+                else:
+                    await self.refresh()
+            except Exception as err:
+                logger.exception('Exception on co-occurrence model refresh: %s', err)
+
+    def get_candidates(
+            self,
+            seed_events_ids: list[UUID],
+            excluded_events_ids: t.Collection[UUID],
+            limit: int,
+            request_dt: datetime,
+    ) -> list[tuple[float, EventRef]]:
+        """
+        events most similar to seed ones in average
+        :param seed_events_ids: events which user is interested in
+        :param excluded_events_ids: events which are not candidates, seed ones are excluded too
+        :return: similarity and event of candidates, best first
+        """
+        state = CooccurrenceModel._state
+        seeds = [
+            state.event_index[event_id]
+            for event_id in seed_events_ids
+            if event_id in state.event_index
+        ]
+        if not seeds:
+            return []
+
+        scores = np.asarray(state.similarity[seeds].sum(axis=0)).ravel() / len(seeds)
+        scores[seeds] = 0
+        scores[[
+            state.event_index[event_id]
+            for event_id in excluded_events_ids
+            if event_id in state.event_index
+        ]] = 0
+
+        request_ts = request_dt.timestamp()
+        period_end_ts = (request_dt + RECOMMENDATION_PERIOD).timestamp()
+        is_upcoming = (state.events_ts >= request_ts) & (state.events_ts <= period_end_ts)
+        found = np.flatnonzero(is_upcoming & (scores > 0))
+        if len(found) > limit:
+            found = found[np.argpartition(-scores[found], limit - 1)[:limit]]
+        found = found[np.argsort(-scores[found], kind='stable')]
+
+        return [
+            (
+                float(scores[index]),
+                EventRef.model_construct(
+                    id=state.events_ids[index],
+                    datetime_from=datetime.fromtimestamp(state.events_ts[index]),
+                ),
+            )
+            for index in found
+        ]
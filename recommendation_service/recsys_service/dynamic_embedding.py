@@ -0,0 +1,115 @@
+"""
+Dynamic user embedding, maintained incrementally on each interaction.
+Weighted sum of interacted events embeddings and amount of interactions decay exponentially with time,
+decay is applied lazily when embedding is updated or read
+"""
+from datetime import datetime
+from datetime import timedelta
+from uuid import UUID
+
+import numpy as np
+
+from common.clients.vectordb_client import DynamicEmbedding
+from common.clients.vectordb_client import EMBEDDING_SIZE
+from common.models import InteractionKind
+from common.models import UserInteraction
+
+IMPLICIT_COEFFICIENT = 0.2
+EXPLICIT_COEFFICIENT = 1  # value multiplier for explicit feedback
+INTERACTIONS_WEIGHTS = {
+    InteractionKind.CLICK: IMPLICIT_COEFFICIENT,
+    InteractionKind.LIKE: EXPLICIT_COEFFICIENT,
+    InteractionKind.DISLIKE: EXPLICIT_COEFFICIENT,
+}
+DECAY_HALF_LIFE = timedelta(days=7)  # interaction weight halves in this time
+CONSIDERED_EVENTS = 100  # recently interacted events, which are excluded from candidates
+
+
+def get_interaction_key(interaction: UserInteraction) -> tuple[UUID, InteractionKind, datetime]:
+    """
+    interaction as it is stored, clickhouse DateTime has no fractions of second
+    """
+    return interaction.event_id, interaction.interaction_type, interaction.interaction_dt.replace(microsecond=0)
+
+
+def get_decay_factor(from_ts: float, to_ts: float) -> float:
+    return 0.5 ** (max(to_ts - from_ts, 0) / DECAY_HALF_LIFE.total_seconds())
+
+
+def get_decayed(dynamic_embedding: DynamicEmbedding, ts: float) -> DynamicEmbedding:
+    """
+    dynamic embedding as it is at ts
+    """
+    decay_factor = get_decay_factor(dynamic_embedding.updated_ts, ts)
+    return dynamic_embedding._replace(
+        weighted_sum=dynamic_embedding.weighted_sum * decay_factor,
+        count=dynamic_embedding.count * decay_factor,
+        updated_ts=max(dynamic_embedding.updated_ts, ts),
+    )
+
+
+def add_interaction(
+        dynamic_embedding: DynamicEmbedding | None,
+        interaction: UserInteraction,
+        event_embedding: np.ndarray,
+) -> DynamicEmbedding:
+    if dynamic_embedding is None:
+        dynamic_embedding = DynamicEmbedding(
+            weighted_sum=np.zeros(EMBEDDING_SIZE, dtype=np.float32),
+            count=0.0,
+            updated_ts=0.0,
+            events_ids=[],
+        )
+
+    # interactions received out of order are decayed to time of embedding
+    interaction_ts = interaction.interaction_dt.timestamp()
+    dynamic_embedding = get_decayed(dynamic_embedding, interaction_ts)
+    decay_factor = get_decay_factor(interaction_ts, dynamic_embedding.updated_ts)
+
+    weight = INTERACTIONS_WEIGHTS[interaction.interaction_type] * decay_factor
+    events_ids = [interaction.event_id]
+    events_ids.extend(event_id for event_id in dynamic_embedding.events_ids if event_id != interaction.event_id)
+
+    return dynamic_embedding._replace(
+        weighted_sum=dynamic_embedding.weighted_sum + event_embedding.astype(np.float32) * weight,
+        count=dynamic_embedding.count + decay_factor,
+        events_ids=events_ids[:CONSIDERED_EVENTS],
+    )
+
+
+def build_dynamic_embedding(
+        interactions: list[UserInteraction],
+        events_embeddings: dict[UUID, np.ndarray],
+) -> DynamicEmbedding | None:
+    """
+    dynamic embedding from history of interactions, latest first
+    :return: embedding or None if there are no interactions with known events
+    """
+    dynamic_embedding = None
+    for interaction in reversed(interactions):
+        event_embedding = events_embeddings.get(interaction.event_id)
+        if event_embedding is None:
+            continue
+
+        dynamic_embedding = add_interaction(dynamic_embedding, interaction, event_embedding)
+
+    return dynamic_embedding
+
+
+def get_dynamic_query_embedding(
+        dynamic_embedding: DynamicEmbedding,
+        user_embedding: np.ndarray | None,
+        request_ts: float,
+) -> np.ndarray:
+    """
+    average of decayed interacted events embeddings and user embedding from description
+    """
+    dynamic_embedding = get_decayed(dynamic_embedding, request_ts)
+
+    dynamic_embeddings_summed = dynamic_embedding.weighted_sum
+    dynamic_embeddings_amount = dynamic_embedding.count
+    if user_embedding is not None:
+        dynamic_embeddings_summed = dynamic_embeddings_summed + user_embedding
+        dynamic_embeddings_amount += 1
+
+    return dynamic_embeddings_summed / dynamic_embeddings_amount
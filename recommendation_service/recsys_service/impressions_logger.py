@@ -0,0 +1,79 @@
+"""
+Write-behind log of given recommendations.
+Recommendations are buffered in memory and inserted to clickhouse by batches from background task,
+so replies do not wait for insert. When buffer is full, oldest recommendations are dropped
+"""
+import asyncio
+from collections import deque
+from datetime import datetime
+
+from common.clients import ClickHouseDB
+from common.models import RecommendationList
+from common.models import SimplifiedRecItem
+from common.utils import get_logger
+
+logger = get_logger('impressions_logger')
+
+Impression = tuple[int, RecommendationList | list[SimplifiedRecItem], datetime]
+
+
+class ImpressionsLogger:
+    def __init__(self, max_buffered: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+
+        self._buffer: deque[Impression] = deque(maxlen=max_buffered)
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._clickhouse_client: ClickHouseDB | None = None
+
+    def log(self, user_id: int, recommendation: RecommendationList | list[SimplifiedRecItem]):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((user_id, recommendation, datetime.now()))
+
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush(self):
+        """
+        insert all buffered recommendations,
+        batch which failed to insert is returned to buffer if there is room for it
+        """
+        if self._clickhouse_client is None:
+            return
+
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                try:
+                    await self._clickhouse_client.insert_given_recommendations_log(batch)
+                except Exception as err:
+                    logger.exception('Batch of %s recommendations is not inserted: %s', len(batch), err)
+                    room = self._buffer.maxlen - len(self._buffer)
+                    returned = batch[max(len(batch) - room, 0):]
+                    self.dropped += len(batch) - len(returned)
+                    self._buffer.extendleft(reversed(returned))
+                    return
+
+    async def run(self, clickhouse_client: ClickHouseDB):
+        """
+        flush buffer when batch is collected or every flush_interval seconds
+        """
+        self._clickhouse_client = clickhouse_client
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._batch_ready.clear()
+
+            await self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            'buffered': len(self._buffer),
+            'max_buffered': self._buffer.maxlen,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,89 @@
+"""
+Ingestion of users interactions from message queue to clickhouse.
+Interactions are buffered and inserted by batches, messages are acknowledged only after batch is inserted
+"""
+import asyncio
+import time
+
+import aio_pika
+from pydantic import ValidationError
+
+from common.clients import ClickHouseDB
+from common.models import UserInteraction
+from common.utils import get_logger
+
+logger = get_logger('interactions_ingestion')
+
+
+class InteractionsIngestion:
+    def __init__(self, clickhouse_client: ClickHouseDB, batch_size: int, flush_interval: float):
+        self.clickhouse_client = clickhouse_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._messages: list[aio_pika.abc.AbstractIncomingMessage] = []
+        self._interactions: list[UserInteraction] = []
+        self._first_buffered_at: float | None = None
+        self._flush_lock = asyncio.Lock()
+
+    async def add(self, message: aio_pika.abc.AbstractIncomingMessage):
+        try:
+            interaction = UserInteraction.model_validate_json(message.body)
+        except ValidationError as err:
+            logger.warning('Invalid interaction message rejected: %s', err)
+            await message.reject(requeue=False)
+            return
+
+        if self._first_buffered_at is None:
+            self._first_buffered_at = time.monotonic()
+        self._messages.append(message)
+        self._interactions.append(interaction)
+
+        if len(self._interactions) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._messages:
+                return
+
+            messages, interactions = self._messages, self._interactions
+            self._messages, self._interactions = [], []
+            self._first_buffered_at = None
+
+            try:
+                await self.clickhouse_client.insert_interactions(interactions)
+            except Exception as err:
+                logger.exception('Batch of %s interactions is not inserted, requeued: %s', len(interactions), err)
+                await messages[-1].nack(multiple=True, requeue=True)
+                return
+
+            # messages of one channel are acknowledged up to the last one
+            await messages[-1].ack(multiple=True)
+            logger.debug('Inserted batch of %s interactions', len(interactions))
+
+    async def run_periodic_flush(self):
+        """
+        flush buffered interactions which wait longer than flush_interval
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval / 2)
+            if self._first_buffered_at is None:
+                continue
+
+            if time.monotonic() - self._first_buffered_at >= self.flush_interval:
+                try:
+                    await self.flush()
+                except Exception as err:
+                    logger.exception('Exception on interactions flush: %s', err)
+
+    async def consume(self, queue: aio_pika.abc.AbstractQueue):
+        flush_task = asyncio.create_task(self.run_periodic_flush())
+        try:
+            async with queue.iterator() as qiterator:
+                message: aio_pika.abc.AbstractIncomingMessage
+                async for message in qiterator:
+                    await self.add(message)
+        finally:
+            flush_task.cancel()
+            await self.flush()
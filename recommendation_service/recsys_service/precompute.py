@@ -0,0 +1,209 @@
+"""
+Offline precompute of recommendations for all active users.
+Candidates of all users are scored against upcoming events matrix with blocked matrix multiplication
+"""
+import asyncio
+import time
+from datetime import datetime
+from uuid import UUID
+
+import numpy as np
+
+from common.clients import ClickHouseDB
+from common.clients import VectorDB
+from common.clients.local_index import normalize
+from common.models import EventRef
+from common.models import RecSubsystem
+from common.models import SimplifiedRecItem
+from common.utils import get_logger
+from recsys_service.config import CLICKHOUSE_HOST
+from recsys_service.config import CLICKHOUSE_PASSWORD
+from recsys_service.config import CLICKHOUSE_POOL_SIZE
+from recsys_service.config import CLICKHOUSE_USERNAME
+from recsys_service.config import PRECOMPUTE_BLOCK_SIZE
+from recsys_service.config import PRECOMPUTE_INTERVAL
+from recsys_service.config import PRECOMPUTE_USERS_BATCH_SIZE
+from recsys_service.config import QDRANT_HOST
+from recsys_service.config import QDRANT_PORT
+from recsys_service.cooccurrence import CooccurrenceModel
+from recsys_service.cooccurrence import get_seeds
+from recsys_service.ranking import CandidatesArrays
+from recsys_service.ranking import ID_HASH_MASK
+from recsys_service.ranking import rank_candidates
+from recsys_service.rec_utils import CandidatesQuery
+from recsys_service.rec_utils import REC_COEFFICIENTS
+from recsys_service.rec_utils import get_candidates_queries
+from recsys_service.request_context import INTERACTIONS_PERIOD
+from recsys_service.request_context import get_recommendation_contexts
+
+logger = get_logger('precompute')
+
+SUBSYSTEMS_CODES = {subsystem: code for code, subsystem in enumerate(RecSubsystem)}
+
+
+class UpcomingEvents:
+    """
+    Normalized embeddings of upcoming events with their features for ranking
+    """
+
+    def __init__(self, ids: list[UUID], datetimes_ts: np.ndarray, vectors: np.ndarray):
+        self.ids = ids
+        self.datetimes_ts = datetimes_ts
+        self.vectors = normalize(vectors)
+        self.ids_hashes = np.array([event_id.int & ID_HASH_MASK for event_id in ids], dtype=np.int64)
+        self.index_by_id = {event_id: index for index, event_id in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def search_events_by_matrix(
+        events: UpcomingEvents,
+        queries: list[CandidatesQuery],
+        block_size: int,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Exact cosine search of events for each query, queries are scored by blocks
+    :return: indices of found events and their scores for each query
+    """
+    results = []
+    for block_start in range(0, len(queries), block_size):
+        block = queries[block_start:block_start + block_size]
+        block_embeddings = normalize(np.stack([query.embedding for query in block]).astype(np.float32))
+        block_scores = block_embeddings @ events.vectors.T
+
+        for query, scores in zip(block, block_scores):
+            excluded = [events.index_by_id[event_id] for event_id in query.exclude if event_id in events.index_by_id]
+            scores[excluded] = -np.inf
+
+            limit = min(query.limit, len(events))
+            found = np.argpartition(-scores, limit - 1)[:limit]
+            found = found[np.isfinite(scores[found])]
+            results.append((found, scores[found]))
+
+    return results
+
+
+def get_collaborative_result(
+        events: UpcomingEvents,
+        candidates: list[tuple[float, EventRef]],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    indices of collaborative candidates in upcoming events and their scores
+    """
+    candidates = [(score, event) for score, event in candidates if event.id in events.index_by_id]
+    found = np.array([events.index_by_id[event.id] for _, event in candidates], dtype=np.int64)
+    scores = np.array([score for score, _ in candidates], dtype=np.float32)
+    return found, scores
+
+
+def compose_precomputed_recommendation(
+        events: UpcomingEvents,
+        results: list[tuple[RecSubsystem, np.ndarray, np.ndarray]],
+) -> list[SimplifiedRecItem]:
+    """
+    :param results: subsystem, indices of found events and their scores for each candidates group
+    """
+    found = np.concatenate([found for _, found, _ in results])
+    arrays = CandidatesArrays(
+        scores=np.concatenate([
+            scores.astype(np.float64) * REC_COEFFICIENTS[subsystem]
+            for subsystem, _, scores in results
+        ]),
+        events_ts=events.datetimes_ts[found],
+        subsystems=np.concatenate([
+            np.full(len(group_found), SUBSYSTEMS_CODES[subsystem], dtype=np.int8)
+            for subsystem, group_found, _ in results
+        ]),
+        ids_hashes=events.ids_hashes[found],
+    )
+    candidates_subsystems = [subsystem for subsystem, group_found, _ in results for _ in group_found]
+
+    selected, scores = rank_candidates(arrays, 2, 10)
+    return [
+        SimplifiedRecItem(
+            subsystem=candidates_subsystems[index],
+            event_id=events.ids[found[index]],
+            score=float(scores[index]),
+        ) for index in selected
+    ]
+
+
+async def precompute_recommendations():
+    vectordb_client = await VectorDB.get_client(QDRANT_HOST, QDRANT_PORT)
+    clickhouse_client = await ClickHouseDB.get_client(
+        CLICKHOUSE_HOST,
+        CLICKHOUSE_USERNAME,
+        CLICKHOUSE_PASSWORD,
+        CLICKHOUSE_POOL_SIZE,
+    )
+    computed_dt = datetime.now()
+
+    # 1. load upcoming events, users and co-occurrence model
+    events_matrix = await vectordb_client.get_upcoming_events_matrix()
+    if not events_matrix.ids:
+        logger.warning('No upcoming events, nothing to precompute')
+        return
+    events = UpcomingEvents(*events_matrix)
+
+    cooccurrence_model = CooccurrenceModel(vectordb_client, clickhouse_client)
+    await cooccurrence_model.rebuild()
+
+    users_ids = await vectordb_client.get_users_ids()
+    users_ids |= await clickhouse_client.get_active_users(computed_dt - INTERACTIONS_PERIOD)
+    users_ids = sorted(users_ids)
+    logger.info('Precompute for %s users over %s events', len(users_ids), len(events))
+
+    # 2. score candidates of users by batches
+    for batch_start in range(0, len(users_ids), PRECOMPUTE_USERS_BATCH_SIZE):
+        batch_users_ids = set(users_ids[batch_start:batch_start + PRECOMPUTE_USERS_BATCH_SIZE])
+        contexts = await get_recommendation_contexts(
+            vectordb_client,
+            clickhouse_client,
+            batch_users_ids,
+        )
+
+        queries_by_user = {
+            user_id: await get_candidates_queries(context)
+            for user_id, context in contexts.items()
+        }
+        queries = [query for user_queries in queries_by_user.values() for query in user_queries]
+        results = iter(search_events_by_matrix(events, queries, PRECOMPUTE_BLOCK_SIZE))
+
+        recommendations = {}
+        for user_id, user_queries in queries_by_user.items():
+            user_results = [(query.subsystem, *next(results)) for query in user_queries]
+
+            seed_events_ids, interacted_events_ids = get_seeds(await contexts[user_id].get_user_interactions())
+            if seed_events_ids:
+                collaborative_candidates = cooccurrence_model.get_candidates(
+                    seed_events_ids,
+                    interacted_events_ids,
+                    10,
+                    computed_dt,
+                )
+                user_results.append(
+                    (RecSubsystem.COLLABORATIVE, *get_collaborative_result(events, collaborative_candidates))
+                )
+
+            if not any(len(found) for _, found, _ in user_results):
+                continue
+
+            recommendations[user_id] = compose_precomputed_recommendation(events, user_results)
+
+        # 3. save to materialized table
+        await clickhouse_client.insert_precomputed_recommendations(recommendations, computed_dt)
+
+    logger.info('Precompute done in %s seconds', (datetime.now() - computed_dt).seconds)
+
+
+async def run_precompute_service():
+    while True:
+        started = time.monotonic()
+        try:
+            await precompute_recommendations()
+        except Exception as err:
+            logger.exception('Exception on precompute: %s', err)
+
+        elapsed_seconds = time.monotonic() - started
+        await asyncio.sleep(max(PRECOMPUTE_INTERVAL - elapsed_seconds, 0))
@@ -0,0 +1,172 @@
+"""
+Ranking stage: rescoring and composition of candidates on numpy arrays
+"""
+import typing as t
+from datetime import datetime
+
+import numpy as np
+
+from common.models import RecItem
+
+RAND_AMPLITUDE_COEF = 0.03  # coefficient to regulate randomiastion impact
+DECAY = 0.002  # time decay per day between event and request
+SECONDS_IN_DAY = 24 * 3600
+ID_HASH_MASK = (1 << 63) - 1  # lower bits of event uuid fit int64
+
+_rng = np.random.default_rng()
+
+
+class CandidatesArrays(t.NamedTuple):
+    scores: np.ndarray  # float64
+    events_ts: np.ndarray  # float64, timestamp of event start
+    subsystems: np.ndarray  # int8, index of candidates group
+    ids_hashes: np.ndarray  # int64, hash of event id
+
+
+def candidates_as_arrays(candidates_by_groups: list[list[RecItem]]) -> tuple[list[RecItem], CandidatesArrays]:
+    """
+    flatten candidates groups to index aligned list of candidates and arrays of their features
+    """
+    candidates = []
+    scores = []
+    events_ts = []
+    ids_hashes = []
+    subsystems = []
+    for group_index, candidates_group in enumerate(candidates_by_groups):
+        for candidate in candidates_group:
+            event = candidate.event
+            candidates.append(candidate)
+            scores.append(candidate.score)
+            events_ts.append(event.datetime_from.timestamp())
+            ids_hashes.append(event.id.int & ID_HASH_MASK)
+        subsystems.append(np.full(len(candidates_group), group_index, dtype=np.int8))
+
+    arrays = CandidatesArrays(
+        scores=np.array(scores, dtype=np.float64),
+        events_ts=np.array(events_ts, dtype=np.float64),
+        subsystems=np.concatenate(subsystems) if subsystems else np.empty(0, dtype=np.int8),
+        ids_hashes=np.array(ids_hashes, dtype=np.int64),
+    )
+    return candidates, arrays
+
+
+def rescore_with_exponential_decay(scores: np.ndarray, events_ts: np.ndarray, request_ts: float) -> np.ndarray:
+    # time_delta = days(|event dt - current dt|)
+    time_delta = np.abs(np.floor((events_ts - request_ts) / SECONDS_IN_DAY))
+    return scores * np.exp(-DECAY * time_delta)
+
+
+def rescore_randomized(scores: np.ndarray) -> np.ndarray:
+    return scores + _rng.uniform(-1, 1, size=scores.shape) * RAND_AMPLITUDE_COEF
+
+
+def deduplicate(scores: np.ndarray, ids_hashes: np.ndarray) -> np.ndarray:
+    """
+    :return: indices of best scored occurrence of each event
+    """
+    by_score = np.argsort(-scores, kind='stable')
+    _, first_occurrences = np.unique(ids_hashes[by_score], return_index=True)
+    return by_score[first_occurrences]
+
+
+def get_top_k(scores: np.ndarray, indices: np.ndarray, limit: int) -> np.ndarray:
+    """
+    :param scores: scores of all candidates
+    :param indices: candidates to select from
+    :param limit: amount of items
+    :return: indices of K best candidates sorted by score
+    """
+    if limit <= 0:
+        return indices[:0]
+    if len(indices) > limit:
+        indices = indices[np.argpartition(-scores[indices], limit - 1)[:limit]]
+
+    return indices[np.argsort(-scores[indices], kind='stable')]
+
+
+def select_min_by_group(scores: np.ndarray, arrays: CandidatesArrays, min_by_group: int) -> np.ndarray:
+    """
+    take min amount of best candidates from each group, groups are taken in turn.
+    Event which is already selected is skipped and next candidate of group is taken,
+    so groups which overlap keep their amount
+    :return: indices of selected candidates in order of selection
+    """
+    by_group = np.lexsort((-scores, arrays.subsystems))
+    groups = arrays.subsystems[by_group]
+    groups_ids = np.unique(groups)
+    positions = np.searchsorted(groups, groups_ids, side='left').tolist()
+    ends = np.searchsorted(groups, groups_ids, side='right').tolist()
+    ids_hashes = arrays.ids_hashes[by_group].tolist()
+
+    selected = []
+    selected_hashes = set()
+    for _ in range(min_by_group):
+        for group_index, end in enumerate(ends):
+            position = positions[group_index]
+            while position < end and ids_hashes[position] in selected_hashes:
+                position += 1
+            if position < end:
+                selected.append(by_group[position])
+                selected_hashes.add(ids_hashes[position])
+                position += 1
+            positions[group_index] = position
+
+    return np.array(selected, dtype=np.intp)
+
+
+def rank_candidates(
+        arrays: CandidatesArrays,
+        min_by_group: int,
+        limit: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rescores candidates and selects balanced sorted list of recommendations
+    :param arrays: candidates features
+    :param min_by_group: minimum amount of items from each group
+    :param limit: amount of items in final result
+    :return: indices of selected candidates and rescored scores of all candidates
+    """
+    # 1. rescore candidates
+    scores = rescore_randomized(
+        rescore_with_exponential_decay(
+            arrays.scores,
+            arrays.events_ts,
+            datetime.now().timestamp(),
+        )
+    )
+
+    # 2. take min amount from each group
+    selected = select_min_by_group(scores, arrays, min_by_group)[:limit]
+
+    # 3. get top k candidates from remained, each event is kept in a group where it is scored best
+    remained = np.flatnonzero(~np.isin(arrays.ids_hashes, arrays.ids_hashes[selected]))
+    remained = remained[deduplicate(scores[remained], arrays.ids_hashes[remained])]
+    remained = get_top_k(scores, remained, limit - len(selected))
+    return np.concatenate((selected, remained)), scores
+
+
+def compose_recommendation_from_candidates_groups(
+        candidates_by_groups: list[list[RecItem]],
+        min_by_group: int,
+        limit: int,
+) -> list[RecItem]:
+    """
+    Rescores candidates and compose balanced sorted list of recommendations
+    :param candidates_by_groups: list of recommendations by subsystem
+    :param min_by_group: minimum amount of items from each group
+    :param limit: amount of items in final result
+    :return:
+    """
+    candidates, arrays = candidates_as_arrays(candidates_by_groups)
+    if not candidates:
+        return []
+
+    selected, scores = rank_candidates(arrays, min_by_group, limit)
+
+    recommendation = []
+    for index in selected:
+        candidate = candidates[index]
+        candidate.score = float(scores[index])
+        recommendation.append(candidate)
+
+    return recommendation
@@ -0,0 +1,82 @@
+import time
+import typing as t
+from collections import OrderedDict
+
+V = t.TypeVar('V')
+
+
+class RecommendationCache(t.Generic[V]):
+    """
+    Recommendations by user id, entries expire after ttl,
+    least recently used entries are evicted when cache is full.
+    Recommendation computed before user was invalidated is not set, so invalidations are counted:
+    each one is remembered by user with its number, latest max_size ones are kept
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[int, tuple[float, V]] = OrderedDict()
+        self._generation = 0
+        self._invalidated: OrderedDict[int, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> V | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, recommendation = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return recommendation
+
+    def get_generation(self) -> int:
+        """
+        :return: amount of invalidations, it is taken before recommendation is computed and passed to set
+        """
+        return self._generation
+
+    def set(self, user_id: int, recommendation: V, generation: int | None = None):
+        """
+        :param generation: generation before recommendation was computed,
+            recommendation is not set if user was invalidated since
+        """
+        if generation is not None and self._invalidated.get(user_id, 0) > generation:
+            return
+
+        self._entries[user_id] = (time.monotonic() + self.ttl, recommendation)
+        self._entries.move_to_end(user_id)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+        self._generation += 1
+        self._invalidated[user_id] = self._generation
+        self._invalidated.move_to_end(user_id)
+        while len(self._invalidated) > self.max_size:
+            self._invalidated.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+        }
@@ -1,23 +1,31 @@
-import itertools
-import math
-import random
+import asyncio
 import typing as t
 from datetime import datetime
-from datetime import timedelta
 from uuid import UUID
 
 import numpy as np
 
 from common.clients import ClickHouseDB
+from common.clients import EventsCatalog
 from common.clients import PostgresDB
 from common.clients import VectorDB
-from common.models import InteractionKind
+from common.models import EventData
+from common.models import EventRef
 from common.models import RecItem
 from common.models import RecSubsystem
 from common.models import RecommendationList
+from common.models import SimplifiedRecItem
+from common.models import UserInteraction
+from common.utils import get_logger
 from recsys_service.config import CLICKHOUSE_HOST
 from recsys_service.config import CLICKHOUSE_PASSWORD
+from recsys_service.config import CLICKHOUSE_POOL_SIZE
 from recsys_service.config import CLICKHOUSE_USERNAME
+from recsys_service.config import COLLABORATIVE_CANDIDATES_TIMEOUT
+from recsys_service.config import DYNAMIC_CANDIDATES_TIMEOUT
+from recsys_service.config import IMPRESSIONS_BATCH_SIZE
+from recsys_service.config import IMPRESSIONS_BUFFER_SIZE
+from recsys_service.config import IMPRESSIONS_FLUSH_INTERVAL
 from recsys_service.config import POSTGRES_DB
 from recsys_service.config import POSTGRES_HOST
 from recsys_service.config import POSTGRES_PASSWORD
@@ -25,319 +33,394 @@ from recsys_service.config import POSTGRES_PORT
 from recsys_service.config import POSTGRES_USER
 from recsys_service.config import QDRANT_HOST
 from recsys_service.config import QDRANT_PORT
+from recsys_service.config import STATIC_CANDIDATES_TIMEOUT
+from recsys_service.cooccurrence import CooccurrenceModel
+from recsys_service.cooccurrence import get_seeds
+from recsys_service.dynamic_embedding import add_interaction
+from recsys_service.dynamic_embedding import get_dynamic_query_embedding
+from recsys_service.dynamic_embedding import get_interaction_key
+from recsys_service.impressions_logger import ImpressionsLogger
+from recsys_service.ranking import compose_recommendation_from_candidates_groups
+from recsys_service.request_context import RecommendationContext
+from recsys_service.request_context import get_recommendation_contexts
 
+logger = get_logger('rec_utils')
 
-async def get_static_dssm_candidates(
-        vectordb_client: VectorDB,
-        user_id: int,
-) -> RecommendationList:
-    user_embeddings = await vectordb_client.get_users_vectors_by_ids({user_id})
-    user_embedding = next(iter(user_embeddings), None)
-    if user_embedding is None:
-        return []
+# given recommendations are saved by background task, started by service
+impressions_logger = ImpressionsLogger(IMPRESSIONS_BUFFER_SIZE, IMPRESSIONS_BATCH_SIZE, IMPRESSIONS_FLUSH_INTERVAL)
+
+T = t.TypeVar('T')
+
+DYNAMIC_EMBEDDING_SAVE_ATTEMPTS = 5
+
+REC_COEFFICIENTS = {
+    RecSubsystem.BASIC: 1,
+    RecSubsystem.DYNAMIC: 0.95,
+    RecSubsystem.COLLABORATIVE: 0.99,
+}
 
-    result = await vectordb_client.search_event_by_vector(user_embedding, 10)
+
+class CandidatesQuery(t.NamedTuple):
+    subsystem: RecSubsystem
+    embedding: np.ndarray
+    limit: int
+    exclude: frozenset[UUID] = frozenset()  # events that should not be recommended
+
+
+def get_candidates_from_search_result(
+        query: CandidatesQuery,
+        result: list[tuple[float, EventData | EventRef]],
+) -> RecommendationList:
+    coefficient = REC_COEFFICIENTS[query.subsystem]
     return [
         RecItem(
-            subsystem=RecSubsystem.BASIC,
-            score=item[0],
-            event=item[1],
-        ) for item in result
+            subsystem=query.subsystem,
+            score=score * coefficient,
+            event=event,
+        ) for score, event in result
+        if event.id not in query.exclude
     ]
 
 
-async def get_dynamic_dssm_candidates(
+async def search_candidates(
         vectordb_client: VectorDB,
-        clickhouse_client: ClickHouseDB,
-        user_id: int,
-) -> RecommendationList:
+        queries: list[CandidatesQuery],
+) -> list[RecommendationList]:
     """
-    1. get user clicks for recent
-    2. calculate average vector for clicked events
-    3. prepare candidates
+    search candidates of several queries in one request
+    :return: candidates group for each query
     """
-    last_week = datetime.now() - timedelta(days=7)
-    considered_interactions = 100
+    search_queries = [(query.embedding, query.limit) for query in queries]
+
+    events_catalog = EventsCatalog(vectordb_client)
+    if events_catalog.is_loaded:
+        # events are taken from catalog, events indexed after its last sync are skipped until next sync
+        ids_results = await vectordb_client.search_events_ids_by_vectors(search_queries)
+        results = [
+            [
+                (score, event)
+                for score, event_id in ids_result
+                if (event := events_catalog.get(event_id)) is not None
+            ]
+            for ids_result in ids_results
+        ]
+    else:
+        # ranking and response need only event id and date, full payload is not fetched
+        results = await vectordb_client.search_events_by_vectors(search_queries, compact=True)
 
-    implicit_coefficient = 0.2
-    explicit_coefficient = 1  # value multiplier for explicit feedback
-
-    interactions = await clickhouse_client.get_interactions_by_user(
-        user_id,
-        last_week,
-        considered_interactions,
-    )
+    return [
+        get_candidates_from_search_result(query, result)
+        for query, result in zip(queries, results)
+    ]
 
-    interacted_events_ids = {interaction.event_id for interaction in interactions}
-    interacted_events_embeddings = await vectordb_client.get_events_vectors_by_ids(interacted_events_ids)
-    interacted_events_embeddings_by_id: dict[UUID, np.ndarray] = {
-        event_id: embedding
-        for event_id, embedding in zip(interacted_events_ids, interacted_events_embeddings)
-    }
 
-    positive_vectors = []
-    negative_vectors = []
+async def get_static_dssm_query(
+        context: RecommendationContext,
+) -> CandidatesQuery | None:
+    user_embedding = await context.get_user_embedding()
+    if user_embedding is None:
+        return None
 
-    for interaction in interactions:
-        event_embedding = interacted_events_embeddings_by_id[interaction.event_id]
-        if interaction.interaction_type == InteractionKind.CLICK:
-            positive_vectors.append(event_embedding * implicit_coefficient)
-        elif interaction.interaction_type == InteractionKind.LIKE:
-            positive_vectors.append(event_embedding * explicit_coefficient)
-        elif interaction.interaction_type == InteractionKind.DISLIKE:
-            negative_vectors.append(event_embedding * explicit_coefficient)
+    return CandidatesQuery(RecSubsystem.BASIC, user_embedding, 10)
 
-    if len(positive_vectors) == 0 and len(negative_vectors) == 0:
-        return []
 
-    # then count dynamic_embedding
+async def get_dynamic_dssm_query(
+        context: RecommendationContext,
+) -> CandidatesQuery | None:
+    """
+    1. get incrementally maintained dynamic embedding of user
+    2. average it with user embedding from description
+    3. prepare candidates query
+    """
+    dynamic_embedding = await context.get_dynamic_embedding()
+    if dynamic_embedding is None:
+        return None
 
     # user embedding from description or None if no description
-    user_embeddings = await vectordb_client.get_users_vectors_by_ids({user_id})
-    user_embedding = next(iter(user_embeddings), None)
+    user_embedding = await context.get_user_embedding()
 
-    dynamic_embeddings_summed = sum(positive_vectors) + sum(negative_vectors)
-    dynamic_embeddings_amount = len(positive_vectors) + len(negative_vectors)
-    if user_embedding is not None:
-        dynamic_embeddings_summed += user_embedding
-        dynamic_embeddings_amount += 1
-
-    dynamic_embedding = dynamic_embeddings_summed / dynamic_embeddings_amount
+    query_embedding = get_dynamic_query_embedding(
+        dynamic_embedding,
+        user_embedding,
+        context.request_dt.timestamp(),
+    )
 
     # potentially vector search can return events, that was interacted by user
     # then we need to remove those events from candidates list
+    interacted_events_ids = frozenset(dynamic_embedding.events_ids)
     limit = len(interacted_events_ids) + 10  # we need at least 10 events that user don't interacted
 
-    result = await vectordb_client.search_event_by_vector(dynamic_embedding, limit)
+    return CandidatesQuery(RecSubsystem.DYNAMIC, query_embedding, limit, interacted_events_ids)
+
+
+async def get_collaborative_candidates(
+        context: RecommendationContext,
+) -> RecommendationList | None:
+    """
+    events which other users interacted together with recently clicked or liked events of user
+    """
+    cooccurrence_model = CooccurrenceModel(context.vectordb_client, context.clickhouse_client)
+    if not cooccurrence_model.is_loaded:
+        return None
 
+    seed_events_ids, interacted_events_ids = get_seeds(await context.get_user_interactions())
+    if not seed_events_ids:
+        return None
+
+    result = cooccurrence_model.get_candidates(seed_events_ids, interacted_events_ids, 10, context.request_dt)
+    coefficient = REC_COEFFICIENTS[RecSubsystem.COLLABORATIVE]
     return [
         RecItem(
-            subsystem=RecSubsystem.DYNAMIC,
-            score=item[0],
-            event=item[1],
-        ) for item in result
-        if item[1].id not in interacted_events_ids
+            subsystem=RecSubsystem.COLLABORATIVE,
+            score=score * coefficient,
+            event=event,
+        ) for score, event in result
     ]
 
 
-async def get_collaborative_dssm_candidates(
-        vectordb_client: VectorDB,
-        clickhouse_client: ClickHouseDB,
-        user_id: int,
-) -> RecommendationList:
-    last_week = datetime.now() - timedelta(days=7)
-    considered_interactions = 100
-
-    # 1. get user clicks
-    interactions = await clickhouse_client.get_interactions_by_user(
-        user_id,
-        last_week,
-        considered_interactions,
+async def get_candidates_queries(
+        context: RecommendationContext,
+) -> list[CandidatesQuery]:
+    """
+    queries of all vector search subsystems which have candidates for user
+    """
+    queries = await asyncio.gather(
+        get_static_dssm_query(context),
+        get_dynamic_dssm_query(context),
     )
-    interacted_events_ids = {interaction.event_id for interaction in interactions}
+    return [query for query in queries if query is not None]
 
-    # 2. get users who made same clicks
-    users_interacted_same_events = []
-    for event_id in interacted_events_ids:
-        users_interacted_same_events.append(await clickhouse_client.get_interactions_by_event(event_id, last_week, 10))
 
-    users_interacted_same_events = itertools.chain.from_iterable(users_interacted_same_events)
+async def get_with_deadline(
+        subsystem: RecSubsystem,
+        coro: t.Awaitable[T | None],
+        timeout: float,
+) -> T | None:
+    """
+    await subsystem candidates or query, subsystem is dropped if it misses deadline
+    :return: result or None if subsystem has no candidates or was dropped
+    """
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except TimeoutError:
+        logger.warning('subsystem %s missed deadline of %s seconds, dropped', subsystem.value, timeout)
+        return None
 
-    users_ids_interacted_same_events = {
-        interaction.user_id for interaction in users_interacted_same_events
-        if interaction.user_id != user_id
-    }
-    similar_users_embeddings = await vectordb_client.get_users_vectors_by_ids(users_ids_interacted_same_events)
 
-    # 3. calculate average vector for those users
-    if len(similar_users_embeddings) == 0:
+async def get_vector_candidates_groups_with_deadline(
+        vectordb_client: VectorDB,
+        context: RecommendationContext,
+        deadline: float,
+) -> list[RecommendationList]:
+    """
+    candidates of vector search subsystems, queries which met their deadline are searched in one batch
+    :param deadline: loop time by which search has to be done, it is shared by queries and search
+    """
+    loop = asyncio.get_running_loop()
+    queries = await asyncio.gather(
+        get_with_deadline(
+            RecSubsystem.BASIC,
+            get_static_dssm_query(context),
+            STATIC_CANDIDATES_TIMEOUT,
+        ),
+        get_with_deadline(
+            RecSubsystem.DYNAMIC,
+            get_dynamic_dssm_query(context),
+            DYNAMIC_CANDIDATES_TIMEOUT,
+        ),
+    )
+    queries = [query for query in queries if query is not None]
+
+    # search has only remained time, so queries and search together take at most budget of subsystems
+    timeout = max(deadline - loop.time(), 0)
+    try:
+        return await asyncio.wait_for(search_candidates(vectordb_client, queries), timeout)
+    except TimeoutError:
+        logger.warning('search of %s queries missed deadline, remained %.3f seconds', len(queries), timeout)
         return []
-    collaborative_embedding: np.ndarray = sum(similar_users_embeddings) / len(similar_users_embeddings)
 
-    # 4. get candidates
-    result = await vectordb_client.search_event_by_vector(collaborative_embedding, 10)
-    return [
-        RecItem(
-            subsystem=RecSubsystem.COLLABORATIVE,
-            score=item[0],
-            event=item[1],
-        ) for item in result
-    ]
-
-
-def rescore_randomized(candidates: RecommendationList) -> RecommendationList:
-    RAND_AMPLITUDE_COEF = 0.03  # coefficient to regulate randomiastion impact
-
-    for rec in candidates:
-        rec.score += random.uniform(-1, 1) * RAND_AMPLITUDE_COEF
-
-    return candidates
 
+async def get_candidates_groups_with_deadline(
+        vectordb_client: VectorDB,
+        context: RecommendationContext,
+) -> list[RecommendationList]:
+    """
+    candidates of subsystems which met their deadline, all deadlines are counted from start of request
+    """
+    started = asyncio.get_running_loop().time()
+    candidates_by_groups, collaborative_candidates = await asyncio.gather(
+        get_vector_candidates_groups_with_deadline(
+            vectordb_client,
+            context,
+            started + max(STATIC_CANDIDATES_TIMEOUT, DYNAMIC_CANDIDATES_TIMEOUT),
+        ),
+        get_with_deadline(
+            RecSubsystem.COLLABORATIVE,
+            get_collaborative_candidates(context),
+            COLLABORATIVE_CANDIDATES_TIMEOUT,
+        ),
+    )
 
-def adjust_recommendation_with_time_decay(
-        candidate: RecItem,
-        time_delta: int,
-) -> RecItem:
-    # time_delta = days(|event dt - current dt|)
-    DECAY = 0.002
+    if collaborative_candidates:
+        candidates_by_groups.append(collaborative_candidates)
 
-    original_score = candidate.score
-    adjusted_score = original_score * math.exp(-DECAY * time_delta)
-    candidate.score = adjusted_score
+    return candidates_by_groups
 
-    return candidate
 
+async def get_recommendation_for_user_query(user_id: int) -> RecommendationList:
+    vectordb_client = await VectorDB.get_client(QDRANT_HOST, QDRANT_PORT)
+    clickhouse_client = await ClickHouseDB.get_client(
+        CLICKHOUSE_HOST,
+        CLICKHOUSE_USERNAME,
+        CLICKHOUSE_PASSWORD,
+        CLICKHOUSE_POOL_SIZE,
+    )
 
-def get_candidates_events_ids(candidates: list[RecItem]) -> list[UUID]:
-    return [
-        selected_candidate.event.id
-        for selected_candidate in candidates
-    ]
+    # 1. get candidates, subsystems are queried concurrently and share request data
+    context = RecommendationContext(
+        vectordb_client,
+        clickhouse_client,
+        user_id,
+    )
 
+    candidates_by_groups = await get_candidates_groups_with_deadline(vectordb_client, context)
 
-def rescore_with_exponential_decay(candidates: RecommendationList) -> RecommendationList:
-    request_dt = datetime.now()
+    # 2. compose recommendation
+    recommendation = compose_recommendation_from_candidates_groups(
+        candidates_by_groups,
+        2,
+        10,
+    )
 
-    for candidate in candidates:
-        event_dt = candidate.event.datetime_from
-        time_delta = abs((event_dt - request_dt).days)
-        adjust_recommendation_with_time_decay(candidate, time_delta)
+    # 4. save recommendation, it is written in background
+    impressions_logger.log(user_id, recommendation)
 
-    return candidates
+    return recommendation
 
 
-def get_top_k(candidates: RecommendationList, limit: int, exclude=None) -> RecommendationList:
+async def get_recommendations_for_users_query(users_ids: set[int]) -> dict[int, RecommendationList]:
     """
-    sort candidates by score and return K candidates
-    :param candidates:
-    :param limit: amount of items
-    :param exclude: events to exclude from top k
-    :return:
+    Recommendations for several users, backends are queried with bulk requests
     """
-    if exclude is None:
-        exclude = []
-    selected_candidates = []
-
-    filtered_candidates = filter(
-        lambda candidate: t.cast(RecItem, candidate).event.id,
-        candidates
-    )
-    sorted_candidates = sorted(
-        filtered_candidates,
-        key=lambda candidate: t.cast(RecItem, candidate).score,
-        reverse=True,
+    vectordb_client = await VectorDB.get_client(QDRANT_HOST, QDRANT_PORT)
+    clickhouse_client = await ClickHouseDB.get_client(
+        CLICKHOUSE_HOST,
+        CLICKHOUSE_USERNAME,
+        CLICKHOUSE_PASSWORD,
+        CLICKHOUSE_POOL_SIZE,
     )
 
-    for candidate in sorted_candidates:
-        candidate = t.cast(RecItem, candidate)
-        if candidate.event.id in [
-            *get_candidates_events_ids(selected_candidates),
-            *exclude,
-        ]:
-            continue
+    # 1. prepare candidates queries of all users
+    contexts = await get_recommendation_contexts(
+        vectordb_client,
+        clickhouse_client,
+        users_ids,
+    )
+    queries: list[tuple[int, CandidatesQuery]] = [
+        (user_id, query)
+        for user_id, context in contexts.items()
+        for query in await get_candidates_queries(context)
+    ]
 
-        selected_candidates.append(candidate)
-        if len(selected_candidates) >= limit:
-            break
+    # 2. get candidates with one batch search
+    candidates_groups = await search_candidates(vectordb_client, [query for _, query in queries])
 
-    return selected_candidates
+    candidates_by_user: dict[int, list[RecommendationList]] = {user_id: [] for user_id in users_ids}
+    for (user_id, _), candidates_group in zip(queries, candidates_groups):
+        candidates_by_user[user_id].append(candidates_group)
 
+    # collaborative candidates are scored in memory
+    for user_id, context in contexts.items():
+        if collaborative_candidates := await get_collaborative_candidates(context):
+            candidates_by_user[user_id].append(collaborative_candidates)
 
-def compose_recommendation_from_candidates_groups(
-        candidates_by_groups: list[list[RecItem]],
-        min_by_group: int,
-        limit: int,
-) -> list[RecItem]:
-    """
-    Rescores candidates and compose balanced sorted list of recommendations
-    :param candidates_by_groups: list of recommendations by subsystem
-    :param min_by_group: minimum amount of items from each group
-    :param limit: amount of items in final result
-    :return:
-    """
-    # 1. rescore candidates and take min amount from each group
-    rescored_candidates_by_groups = []
-    for candidates_group in candidates_by_groups:
-        rescored_candidates = rescore_randomized(
-            rescore_with_exponential_decay(
-                candidates_group
-            )
+    # 3. compose recommendations
+    recommendations = {
+        user_id: compose_recommendation_from_candidates_groups(
+            candidates_by_groups,
+            2,
+            10,
         )
-        sorted_rescored_candidates = get_top_k(rescored_candidates, limit)
-        rescored_candidates_by_groups.append(sorted_rescored_candidates)
-
-    selected_candidates = []
-    for index in range(min_by_group):
-        for candidates_group in rescored_candidates_by_groups:
-            for candidate in candidates_group:
-                if candidate.event.id not in get_candidates_events_ids(selected_candidates):
-                    selected_candidates.append(candidate)
-                    break
-
-    # 2. get top k candidates from remained
-    remained = limit - len(selected_candidates)
-    if remained > 0:
-        other_candidates: list[RecItem] = itertools.chain.from_iterable(rescored_candidates_by_groups)
-        selected_candidates.extend(get_top_k(
-            other_candidates,
-            remained,
-            exclude=get_candidates_events_ids(selected_candidates),
-        ))
-    elif remained < 0:
-        selected_candidates = selected_candidates[:-remained]
-    return selected_candidates
+        for user_id, candidates_by_groups in candidates_by_user.items()
+    }
 
+    # 4. save recommendations, they are written in background
+    for user_id, recommendation in recommendations.items():
+        impressions_logger.log(user_id, recommendation)
 
-async def get_recommendation_for_user_query(user_id: int) -> RecommendationList:
+    return recommendations
+
+
+async def update_dynamic_embedding(interaction: UserInteraction):
+    """
+    add interaction to dynamic embedding of user.
+    Embedding is saved only if it was not changed since it was read, otherwise it is read and updated again
+    """
     vectordb_client = await VectorDB.get_client(QDRANT_HOST, QDRANT_PORT)
     clickhouse_client = await ClickHouseDB.get_client(
         CLICKHOUSE_HOST,
         CLICKHOUSE_USERNAME,
         CLICKHOUSE_PASSWORD,
+        CLICKHOUSE_POOL_SIZE,
     )
 
-    # 1. get candidates
-    basic_candidates = await get_static_dssm_candidates(
-        vectordb_client,
-        user_id,
-    )
+    for _ in range(DYNAMIC_EMBEDDING_SAVE_ATTEMPTS):
+        context = RecommendationContext(
+            vectordb_client,
+            clickhouse_client,
+            interaction.user_id,
+        )
+        dynamic_embedding = await context.get_dynamic_embedding()
+
+        # first embedding of user is built from history, which may already contain interaction
+        is_considered = dynamic_embedding is not None and dynamic_embedding.version is None and (
+            get_interaction_key(interaction) in {
+                get_interaction_key(user_interaction)
+                for user_interaction in await context.get_user_interactions()
+            }
+        )
+        if not is_considered:
+            events_embeddings = await context.get_events_embeddings({interaction.event_id})
+            if interaction.event_id not in events_embeddings:
+                logger.warning('No embedding of event %s, interaction is not considered', interaction.event_id)
+                return
+
+            dynamic_embedding = add_interaction(
+                dynamic_embedding,
+                interaction,
+                events_embeddings[interaction.event_id],
+            )
 
-    DYNAMIC_REC_COEFFICIENT = 0.95  # noqa
-    dynamic_candidates = await get_dynamic_dssm_candidates(
-        vectordb_client,
-        clickhouse_client,
-        user_id,
-    )
-    for dynamic_candidate in dynamic_candidates:
-        dynamic_candidate.score *= DYNAMIC_REC_COEFFICIENT
+        if await vectordb_client.set_dynamic_embedding(interaction.user_id, dynamic_embedding):
+            return
 
-    COLLABORATIVE_REC_COEFFICIENT = 0.99  # noqa
-    collaborative_candidates = await get_collaborative_dssm_candidates(
-        vectordb_client,
-        clickhouse_client,
-        user_id,
+        logger.debug('Dynamic embedding of user %s is changed concurrently, updating again', interaction.user_id)
+
+    logger.warning(
+        'Dynamic embedding of user %s is not saved in %s attempts, interaction is not considered',
+        interaction.user_id, DYNAMIC_EMBEDDING_SAVE_ATTEMPTS,
     )
-    for collaborative_candidate in collaborative_candidates:
-        collaborative_candidate.score *= COLLABORATIVE_REC_COEFFICIENT
 
-    candidates_by_groups = [
-        basic_candidates,
-        dynamic_candidates,
-        collaborative_candidates,
-    ]
 
-    # 2. compose recommendation
-    recommendation = compose_recommendation_from_candidates_groups(
-        candidates_by_groups,
-        2,
-        10,
+async def get_precomputed_recommendation_for_user(
+        user_id: int,
+        computed_after_dt: datetime,
+) -> list[SimplifiedRecItem] | None:
+    """
+    Recommendation computed by offline precompute job
+    :param computed_after_dt: older recommendations are not considered
+    :return: recommendation or None if there is no fresh one
+    """
+    clickhouse_client = await ClickHouseDB.get_client(
+        CLICKHOUSE_HOST,
+        CLICKHOUSE_USERNAME,
+        CLICKHOUSE_PASSWORD,
+        CLICKHOUSE_POOL_SIZE,
     )
 
-    # 4. save recommendation
-    await clickhouse_client.insert_given_recommendation(
-        user_id=user_id,
-        recommendation=recommendation,
-    )
+    recommendation = await clickhouse_client.get_precomputed_recommendation(user_id, computed_after_dt)
+    if recommendation is not None:
+        impressions_logger.log(user_id, recommendation)
 
     return recommendation
 
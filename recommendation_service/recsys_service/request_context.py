@@ -0,0 +1,204 @@
+import asyncio
+import typing as t
+from datetime import datetime
+from datetime import timedelta
+from uuid import UUID
+
+import numpy as np
+
+from common.clients import ClickHouseDB
+from common.clients import VectorDB
+from common.clients.vectordb_client import DynamicEmbedding
+from common.models import UserInteraction
+from recsys_service.dynamic_embedding import build_dynamic_embedding
+
+T = t.TypeVar('T')
+K = t.TypeVar('K')
+
+INTERACTIONS_PERIOD = timedelta(days=7)
+CONSIDERED_INTERACTIONS = 100
+
+
+class DataCache(t.Generic[K, T]):
+    """
+    Values fetched by key, absent values are remembered too
+    """
+
+    def __init__(self):
+        self._values: dict[K, T | None] = {}
+
+    def fill(self, keys: t.Iterable[K], values: dict[K, T]):
+        for key in keys:
+            self._values[key] = values.get(key)
+
+    def get_missing(self, keys: t.Iterable[K]) -> set[K]:
+        return {key for key in keys if key not in self._values}
+
+    def get_many(self, keys: t.Iterable[K]) -> dict[K, T]:
+        return {
+            key: self._values[key]
+            for key in keys
+            if self._values.get(key) is not None
+        }
+
+
+class RecommendationContext:
+    """
+    Request scoped data loader.
+    Data shared by candidates subsystems is fetched once per request
+    """
+
+    def __init__(
+            self,
+            vectordb_client: VectorDB,
+            clickhouse_client: ClickHouseDB,
+            user_id: int,
+            request_dt: datetime | None = None,
+            events_embeddings: DataCache[UUID, np.ndarray] | None = None,
+            users_embeddings: DataCache[int, np.ndarray] | None = None,
+            preloaded: dict[str, t.Any] | None = None,
+    ):
+        """
+        :param preloaded: data fetched for several users in bulk by name of its loader,
+            e.g. 'user_interactions', it is not loaded again
+        """
+        self.vectordb_client = vectordb_client
+        self.clickhouse_client = clickhouse_client
+        self.user_id = user_id
+        self.request_dt = request_dt or datetime.now()
+
+        self._loaded: dict[str, asyncio.Future] = {}
+        self._preloaded = preloaded if preloaded is not None else {}
+        self._events_embeddings = events_embeddings if events_embeddings is not None else DataCache()
+        self._users_embeddings = users_embeddings if users_embeddings is not None else DataCache()
+
+    @property
+    def interactions_after_dt(self) -> datetime:
+        return self.request_dt - INTERACTIONS_PERIOD
+
+    async def _load_once(self, key: str, loader: t.Callable[[], t.Awaitable[T]]) -> T:
+        if key in self._preloaded:
+            return self._preloaded[key]
+
+        if key not in self._loaded:
+            self._loaded[key] = asyncio.ensure_future(loader())
+
+        # shield shared loading from cancellation of subsystem that missed its deadline
+        return await asyncio.shield(self._loaded[key])
+
+    async def get_user_embedding(self) -> np.ndarray | None:
+        """
+        user embedding from description or None if no description
+        """
+        async def load() -> np.ndarray | None:
+            users_embeddings = await self.get_users_embeddings({self.user_id})
+            return users_embeddings.get(self.user_id)
+
+        return await self._load_once('user_embedding', load)
+
+    async def get_user_interactions(self) -> list[UserInteraction]:
+        """
+        recent user interactions, latest first
+        """
+        async def load() -> list[UserInteraction]:
+            interactions_by_user = await self.clickhouse_client.get_last_interactions_by_users(
+                {self.user_id},
+                self.interactions_after_dt,
+                CONSIDERED_INTERACTIONS,
+            )
+            return interactions_by_user.get(self.user_id, [])
+
+        return await self._load_once('user_interactions', load)
+
+    async def get_dynamic_embedding(self) -> DynamicEmbedding | None:
+        """
+        incrementally maintained dynamic embedding of user or None if user has no interactions.
+        Embedding of user, who has no stored one yet, is built from history of interactions,
+        it is saved only by interactions handler
+        """
+        async def load() -> DynamicEmbedding | None:
+            dynamic_embeddings = await self.vectordb_client.get_dynamic_embeddings_map({self.user_id})
+            if self.user_id in dynamic_embeddings:
+                return dynamic_embeddings[self.user_id]
+
+            interactions = await self.get_user_interactions()
+            if not interactions:
+                return None
+
+            interacted_events_ids = {interaction.event_id for interaction in interactions}
+            events_embeddings = await self.get_events_embeddings(interacted_events_ids)
+            return build_dynamic_embedding(interactions, events_embeddings)
+
+        return await self._load_once('dynamic_embedding', load)
+
+    async def get_users_embeddings(self, users_ids: set[int]) -> dict[int, np.ndarray]:
+        if missing := self._users_embeddings.get_missing(users_ids):
+            self._users_embeddings.fill(missing, await self.vectordb_client.get_users_vectors_map(missing))
+
+        return self._users_embeddings.get_many(users_ids)
+
+    async def get_events_embeddings(self, events_ids: set[UUID]) -> dict[UUID, np.ndarray]:
+        if missing := self._events_embeddings.get_missing(events_ids):
+            self._events_embeddings.fill(missing, await self.vectordb_client.get_events_vectors_map(missing))
+
+        return self._events_embeddings.get_many(events_ids)
+
+
+async def get_recommendation_contexts(
+        vectordb_client: VectorDB,
+        clickhouse_client: ClickHouseDB,
+        users_ids: set[int],
+) -> dict[int, RecommendationContext]:
+    """
+    Prepare contexts for several users, data of all users is fetched with bulk requests
+    """
+    request_dt = datetime.now()
+    interactions_after_dt = request_dt - INTERACTIONS_PERIOD
+
+    events_embeddings = DataCache()
+    users_embeddings = DataCache()
+
+    # 1. users embeddings and interactions
+    users_vectors, dynamic_embeddings, interactions_by_user = await asyncio.gather(
+        vectordb_client.get_users_vectors_map(users_ids),
+        vectordb_client.get_dynamic_embeddings_map(users_ids),
+        clickhouse_client.get_last_interactions_by_users(
+            users_ids,
+            interactions_after_dt,
+            CONSIDERED_INTERACTIONS,
+        ),
+    )
+    users_embeddings.fill(users_ids, users_vectors)
+
+    # 2. embeddings of interacted events, they are needed only to build missing dynamic embeddings
+    events_ids_without_dynamic_embedding = {
+        interaction.event_id
+        for user_id, interactions in interactions_by_user.items()
+        if user_id not in dynamic_embeddings
+        for interaction in interactions
+    }
+    events_embeddings.fill(
+        events_ids_without_dynamic_embedding,
+        await vectordb_client.get_events_vectors_map(events_ids_without_dynamic_embedding),
+    )
+
+    contexts = {}
+    for user_id in users_ids:
+        preloaded = {
+            'user_embedding': users_vectors.get(user_id),
+            'user_interactions': interactions_by_user.get(user_id, []),
+        }
+        if user_id in dynamic_embeddings:
+            preloaded['dynamic_embedding'] = dynamic_embeddings[user_id]
+
+        contexts[user_id] = RecommendationContext(
+            vectordb_client,
+            clickhouse_client,
+            user_id,
+            request_dt=request_dt,
+            events_embeddings=events_embeddings,
+            users_embeddings=users_embeddings,
+            preloaded=preloaded,
+        )
+
+    return contexts
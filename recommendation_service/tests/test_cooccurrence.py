@@ -0,0 +1,105 @@
+from datetime import datetime
+from datetime import timedelta
+from uuid import UUID
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from common.models import EventRef
+from recsys_service.cooccurrence import CooccurrenceModel
+from recsys_service.cooccurrence import CooccurrenceState
+from recsys_service.cooccurrence import build_state
+from recsys_service.cooccurrence import update_state
+
+SYNCED_DT = datetime(2024, 6, 1)
+
+
+def get_random_pairs(
+        rng: np.random.Generator,
+        users_ids: list[int],
+        events_ids: list[UUID],
+        amount: int,
+) -> list[tuple[int, UUID]]:
+    return [
+        (users_ids[user_index], events_ids[event_index])
+        for user_index, event_index in zip(
+            rng.integers(0, len(users_ids), size=amount),
+            rng.integers(0, len(events_ids), size=amount),
+        )
+    ]
+
+
+def assert_same_model(state: CooccurrenceState, expected: CooccurrenceState):
+    assert state.events_ids == expected.events_ids
+    assert state.user_index == expected.user_index
+    assert (state.interactions != expected.interactions).nnz == 0
+    assert (state.cooccurrence != expected.cooccurrence).nnz == 0
+    np.testing.assert_allclose(state.similarity.toarray(), expected.similarity.toarray(), rtol=1e-6)
+
+
+def test_update_of_small_model_is_same_as_rebuild():
+    event_a, event_b, event_c = uuid4(), uuid4(), uuid4()
+    pairs = [(1, event_a), (1, event_b), (2, event_a)]
+    # already known pair, duplicated new pair, new user and new event
+    new_pairs = [(1, event_a), (2, event_b), (2, event_b), (3, event_c), (3, event_a)]
+
+    state = update_state(build_state(pairs, [], SYNCED_DT), new_pairs, SYNCED_DT)
+
+    assert_same_model(state, build_state(pairs + new_pairs, [], SYNCED_DT))
+    index_a, index_b, index_c = (state.event_index[event_id] for event_id in (event_a, event_b, event_c))
+    assert state.cooccurrence[index_a, index_b] == 2
+    assert state.cooccurrence[index_a, index_c] == 1
+    assert state.cooccurrence[index_b, index_c] == 0
+    assert state.cooccurrence[index_a, index_a] == 0
+
+
+@pytest.mark.parametrize('updates_amount', [1, 5])
+def test_updates_are_same_as_rebuild(updates_amount: int):
+    rng = np.random.default_rng(updates_amount)
+    users_ids = list(range(200))
+    events_ids = [uuid4() for _ in range(100)]
+
+    pairs = get_random_pairs(rng, users_ids[:150], events_ids[:80], 1000)
+    state = build_state(pairs, [], SYNCED_DT)
+    for _ in range(updates_amount):
+        new_pairs = get_random_pairs(rng, users_ids, events_ids, 200)
+        state = update_state(state, new_pairs, SYNCED_DT)
+        pairs += new_pairs
+
+    assert_same_model(state, build_state(pairs, [], SYNCED_DT))
+
+
+def test_update_keeps_start_of_known_events():
+    event_a, event_b, event_c = uuid4(), uuid4(), uuid4()
+    upcoming_events = [EventRef(id=event_a, datetime_from=SYNCED_DT + timedelta(days=1))]
+
+    state = build_state([(1, event_a), (1, event_b)], upcoming_events, SYNCED_DT)
+    state = update_state(state, [(2, event_a), (2, event_c)], SYNCED_DT)
+
+    assert state.events_ts[state.event_index[event_a]] == upcoming_events[0].datetime_from.timestamp()
+    assert np.isnan(state.events_ts[state.event_index[event_b]])
+    assert np.isnan(state.events_ts[state.event_index[event_c]])
+
+
+def test_candidates_are_similar_upcoming_events(monkeypatch):
+    seed, similar, less_similar, past = uuid4(), uuid4(), uuid4(), uuid4()
+    request_dt = SYNCED_DT
+    upcoming_events = [
+        EventRef(id=event_id, datetime_from=request_dt + timedelta(days=1))
+        for event_id in (seed, similar, less_similar)
+    ] + [EventRef(id=past, datetime_from=request_dt - timedelta(days=1))]
+    pairs = [
+        (1, seed), (1, similar), (1, past),
+        (2, seed), (2, similar), (2, past),
+        (3, seed), (3, less_similar),
+        (4, less_similar),
+    ]
+    monkeypatch.setattr(CooccurrenceModel, '_state', build_state(pairs, upcoming_events, SYNCED_DT))
+    model = CooccurrenceModel(None, None)
+
+    candidates = model.get_candidates([seed], [], limit=10, request_dt=request_dt)
+
+    assert [event.id for _, event in candidates] == [similar, less_similar]
+    assert candidates[0][0] > candidates[1][0] > 0
+    assert model.get_candidates([seed], [similar], limit=10, request_dt=request_dt)[0][1].id == less_similar
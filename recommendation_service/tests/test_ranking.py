@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from recsys_service import ranking
+from recsys_service.ranking import CandidatesArrays
+from recsys_service.ranking import rank_candidates
+
+
+@pytest.fixture(autouse=True)
+def not_randomized(monkeypatch):
+    monkeypatch.setattr(ranking, 'rescore_randomized', lambda scores: scores)
+
+
+def get_arrays(candidates: list[tuple[int, int, float]]) -> CandidatesArrays:
+    """
+    :param candidates: group, event hash and score of each candidate
+    """
+    events_ts = datetime.now().timestamp() + 3600  # same day, scores are not decayed
+    return CandidatesArrays(
+        scores=np.array([score for _, _, score in candidates], dtype=np.float64),
+        events_ts=np.full(len(candidates), events_ts, dtype=np.float64),
+        subsystems=np.array([group for group, _, _ in candidates], dtype=np.int8),
+        ids_hashes=np.array([event_hash for _, event_hash, _ in candidates], dtype=np.int64),
+    )
+
+
+def get_ranked_hashes(arrays: CandidatesArrays, min_by_group: int, limit: int) -> list[int]:
+    selected, _ = rank_candidates(arrays, min_by_group, limit)
+    return arrays.ids_hashes[selected].tolist()
+
+
+def test_best_scored_without_min_by_group():
+    arrays = get_arrays([(0, 1, 0.5), (0, 2, 0.9), (1, 3, 0.7), (1, 4, 0.1)])
+
+    assert get_ranked_hashes(arrays, min_by_group=0, limit=3) == [2, 3, 1]
+
+
+def test_min_by_group_is_taken_from_worse_group():
+    arrays = get_arrays([(0, 1, 0.9), (0, 2, 0.8), (0, 3, 0.7), (1, 4, 0.2), (1, 5, 0.1)])
+
+    assert get_ranked_hashes(arrays, min_by_group=1, limit=3) == [1, 4, 2]
+    assert get_ranked_hashes(arrays, min_by_group=2, limit=4) == [1, 4, 2, 5]
+
+
+def test_min_by_group_is_filled_when_groups_overlap():
+    # events 1 and 2 are scored better by first group, second group keeps its minimum with them
+    arrays = get_arrays([(0, 1, 0.9), (0, 2, 0.8), (0, 3, 0.7), (1, 1, 0.6), (1, 2, 0.5), (1, 4, 0.4)])
+
+    selected, _ = rank_candidates(arrays, min_by_group=2, limit=10)
+
+    assert arrays.ids_hashes[selected].tolist() == [1, 2, 3, 4]
+    assert arrays.subsystems[selected].tolist() == [0, 1, 0, 1]
+
+
+def test_min_by_group_is_cut_by_limit():
+    arrays = get_arrays([(0, 1, 0.9), (0, 2, 0.8), (1, 3, 0.2), (1, 4, 0.1), (2, 5, 0.3)])
+
+    assert get_ranked_hashes(arrays, min_by_group=2, limit=2) == [1, 3]
+
+
+def test_events_are_not_duplicated():
+    rng = np.random.default_rng(0)
+    candidates = [
+        (int(group), int(event_hash), float(score))
+        for group, event_hash, score in zip(
+            rng.integers(0, 3, size=300),
+            rng.integers(0, 100, size=300),
+            rng.uniform(0, 1, size=300),
+        )
+    ]
+    arrays = get_arrays(candidates)
+
+    ranked = get_ranked_hashes(arrays, min_by_group=5, limit=50)
+
+    assert len(ranked) == len(set(ranked)) == 50
+    for group in range(3):
+        group_hashes = {event_hash for event_group, event_hash, _ in candidates if event_group == group}
+        assert len(group_hashes.intersection(ranked)) >= 5
+
+
+def test_remained_are_sorted_by_best_score_of_event():
+    arrays = get_arrays([(0, 1, 0.9), (0, 2, 0.3), (1, 2, 0.6), (1, 3, 0.5), (2, 4, 0.8)])
+
+    selected, scores = rank_candidates(arrays, min_by_group=0, limit=4)
+
+    assert arrays.ids_hashes[selected].tolist() == [1, 4, 2, 3]
+    assert scores[selected].tolist() == sorted(scores[selected].tolist(), reverse=True)
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from recsys_service.rec_cache import RecommendationCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_get_set_and_stats(clock):
+    cache = RecommendationCache(ttl=60, max_size=10)
+
+    assert cache.get(1) is None
+    cache.set(1, ['a'])
+
+    assert cache.get(1) == ['a']
+    assert cache.get_stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1, 'max_size': 10}
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = RecommendationCache(ttl=60, max_size=10)
+    cache.set(1, ['a'])
+
+    clock[0] += 59
+    assert cache.get(1) == ['a']
+    clock[0] += 1
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = RecommendationCache(ttl=60, max_size=2)
+    cache.set(1, ['a'])
+    cache.set(2, ['b'])
+    cache.get(1)
+
+    cache.set(3, ['c'])
+
+    assert cache.get(2) is None
+    assert cache.get(1) == ['a']
+    assert cache.get(3) == ['c']
+
+
+def test_invalidate_removes_entry(clock):
+    cache = RecommendationCache(ttl=60, max_size=10)
+    cache.set(1, ['a'])
+
+    cache.invalidate(1)
+
+    assert cache.get(1) is None
+
+
+def test_recommendation_computed_before_invalidation_is_not_set(clock):
+    cache = RecommendationCache(ttl=60, max_size=10)
+    generation = cache.get_generation()
+
+    # user is updated while recommendation is computed
+    cache.invalidate(1)
+    cache.set(1, ['outdated'], generation)
+
+    assert cache.get(1) is None
+
+    generation = cache.get_generation()
+    cache.set(1, ['actual'], generation)
+    assert cache.get(1) == ['actual']
+
+
+def test_invalidation_of_other_user_does_not_prevent_set(clock):
+    cache = RecommendationCache(ttl=60, max_size=10)
+    generation = cache.get_generation()
+
+    cache.invalidate(2)
+    cache.set(1, ['a'], generation)
+
+    assert cache.get(1) == ['a']
+
+
+def test_later_invalidation_of_user_prevents_set(clock):
+    cache = RecommendationCache(ttl=60, max_size=10)
+    cache.invalidate(1)
+    generation = cache.get_generation()
+    cache.invalidate(2)
+
+    cache.set(1, ['a'], generation)
+    assert cache.get(1) == ['a']
+
+    cache.invalidate(1)
+    cache.set(1, ['b'], generation)
+    assert cache.get(1) is None
+
+
+def test_set_without_generation_is_not_checked(clock):
+    cache = RecommendationCache(ttl=60, max_size=10)
+    cache.invalidate(1)
+
+    cache.set(1, ['a'])
+
+    assert cache.get(1) == ['a']